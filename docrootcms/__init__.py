@@ -0,0 +1,6 @@
+def warm(docroot_dir=None):
+    """
+        precompile the docroot templates and data files into the shared caches before workers fork; see preload.py
+    """
+    from .preload import warm as _warm
+    return _warm(docroot_dir)
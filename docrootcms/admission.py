@@ -0,0 +1,213 @@
+# Per route concurrency limits for docroot pages and apis so one hammered .data.py can't take every worker thread.
+# A data file sets its own limit:
+#
+#   max_concurrency = 4                         # requests running this page/api at once in this worker
+#   max_queue_wait = 2.0                        # seconds a request over the limit waits for a slot (0: reject now)
+#   max_queue = 20                              # requests allowed to wait at once; the rest are rejected
+#
+# or DOCROOT_MAX_CONCURRENCY, DOCROOT_MAX_QUEUE_WAIT and DOCROOT_MAX_QUEUE set the defaults for every route with a
+# data file.  Rejected requests get a 503 with Retry-After (retry_after / DOCROOT_RETRY_AFTER seconds).  Cached pages
+# and 304s are answered before the limit is checked.  Limits are per worker process; active, waiting and rejected
+# counts per route are reported to staff at /_cms/stats/.  Under ASGI waiting requests are futures on the event loop
+# rather than threads, and a streamed response holds its slot until the server closes it.
+import asyncio
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+from django.http import HttpResponse
+
+log = logging.getLogger("docrootcms.admission")
+
+# requests allowed to wait for a slot per route unless DOCROOT_MAX_QUEUE says otherwise (None: no bound)
+DEFAULT_MAX_QUEUE = 100
+
+
+class AsyncWaiter:
+    """
+        a request waiting on the event loop; granted is set (under the limiter's lock) once a slot is handed to it
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class Limiter:
+    """
+        a counting semaphore with a bounded wait and the counters to tune it
+    """
+
+    def __init__(self, route, limit, queue_wait=0.0, queue_size=None):
+        self.route = route
+        self.limit = limit
+        self.queue_wait = queue_wait
+        self.queue_size = queue_size
+        self.condition = threading.Condition()
+        # AsyncWaiters in arrival order; a released slot goes to them first since they hold no thread
+        self.async_waiters = deque()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_waiting = 0
+
+    def configure(self, limit, queue_wait, queue_size):
+        with self.condition:
+            self.limit = limit
+            self.queue_wait = queue_wait
+            self.queue_size = queue_size
+            self._wake()
+
+    # hands the free slots to the waiting requests; called with the lock held
+    def _wake(self):
+        while self.async_waiters and self.active < self.limit:
+            waiter = self.async_waiters.popleft()
+            waiter.granted = True
+            self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            self.queued += 1
+            waiter.loop.call_soon_threadsafe(waiter.wake)
+        if self.active < self.limit:
+            self.condition.notify(self.limit - self.active)
+
+    # admits the request now if there is a slot; returns None if it would have to wait
+    def _admit_now(self):
+        if self.active < self.limit:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if not self.queue_wait or (self.queue_size is not None and self.waiting >= self.queue_size):
+            self.rejected += 1
+            log.warning(f"rejecting request for {self.route}: {self.active} active and {self.waiting} waiting")
+            return False
+        return None
+
+    def acquire(self):
+        """
+            True once the request holds a slot (call release() when it is done); False if it was rejected
+        """
+        with self.condition:
+            admitted = self._admit_now()
+            if admitted is not None:
+                return admitted
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                admitted = self.condition.wait_for(lambda: self.active < self.limit, self.queue_wait)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.timeouts += 1
+                self.rejected += 1
+                log.warning(f"rejecting request for {self.route}: no slot after {self.queue_wait}s")
+                return False
+            self.active += 1
+            self.admitted += 1
+            self.queued += 1
+            return True
+
+    async def aacquire(self):
+        """
+            acquire() for the event loop; a request cancelled while it waits never keeps a slot
+        """
+        with self.condition:
+            admitted = self._admit_now()
+            if admitted is not None:
+                return admitted
+            waiter = AsyncWaiter()
+            self.async_waiters.append(waiter)
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_wait)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as ex:
+            with self.condition:
+                granted = waiter.granted
+                if not granted:
+                    self.async_waiters.remove(waiter)
+                    self.waiting -= 1
+                    if not isinstance(ex, asyncio.CancelledError):
+                        self.timeouts += 1
+                        self.rejected += 1
+            if isinstance(ex, asyncio.CancelledError):
+                # the slot was handed over just as the request went away
+                if granted:
+                    self.release()
+                raise
+            if granted:
+                return True
+            log.warning(f"rejecting request for {self.route}: no slot after {self.queue_wait}s")
+            return False
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self._wake()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(route, data):
+    """
+        the Limiter for a route (page or api uri) from its data module and the settings; None if it is unlimited
+    """
+    limit = getattr(data, 'max_concurrency', None) or getattr(settings, 'DOCROOT_MAX_CONCURRENCY', None)
+    if not limit or data is None:
+        return None
+    queue_wait = getattr(data, 'max_queue_wait', None)
+    if queue_wait is None:
+        queue_wait = getattr(settings, 'DOCROOT_MAX_QUEUE_WAIT', 0.0)
+    queue_size = getattr(data, 'max_queue', None) or getattr(settings, 'DOCROOT_MAX_QUEUE', DEFAULT_MAX_QUEUE)
+    limiter = _limiters.get(route)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(route, Limiter(route, limit, queue_wait, queue_size))
+    if (limiter.limit, limiter.queue_wait, limiter.queue_size) != (limit, queue_wait, queue_size):
+        # the data file changed
+        limiter.configure(limit, queue_wait, queue_size)
+    return limiter
+
+
+def release_after(limiter, response):
+    """
+        gives the slot back once response is done: now, or for a streamed response when the server closes it
+    """
+    if response is not None and response.streaming:
+        response._resource_closers.append(limiter.release)
+    else:
+        limiter.release()
+
+
+def rejected_response(data):
+    retry_after = getattr(data, 'retry_after', None) or getattr(settings, 'DOCROOT_RETRY_AFTER', 1)
+    response = HttpResponse("Service Unavailable", status=503)
+    response['Retry-After'] = str(int(retry_after))
+    return response
+
+
+def stats():
+    return {route: limiter.stats() for route, limiter in list(_limiters.items())}
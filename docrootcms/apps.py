@@ -1,5 +1,21 @@
+import django
 from django.apps import AppConfig
+from django.core import checks
+
+# the async page view (csrf_protect on a coroutine) and the async streamed responses need django 5.0
+MINIMUM_DJANGO = (5, 0)
+
+
+def check_django_version(app_configs, **kwargs):
+    if django.VERSION[:2] < MINIMUM_DJANGO:
+        minimum = '.'.join(str(part) for part in MINIMUM_DJANGO)
+        return [checks.Error(f"docrootcms needs django >= {minimum}; this is django {django.get_version()}",
+                             id='docrootcms.E001')]
+    return []
 
 
 class CmsConfig(AppConfig):
     name = 'docrootcms'
+
+    def ready(self):
+        checks.register(check_django_version)
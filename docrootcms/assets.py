@@ -0,0 +1,378 @@
+# Sends docroot static files for views.static once the docroot lookup and the forbidden extension checks passed.
+# Every response carries Last-Modified and an ETag built from the file's stat (size, mtime and inode) so browser
+# revalidations of css, js and images are answered with a 304 from one stat() call without opening the file.
+# GETs with a Range header (pdf viewers, video players seeking) get a 206 with just the requested bytes: one range as
+# a plain body, several as multipart/byteranges, honouring If-Range.  A single range is handed to the server as an
+# open file positioned at the first byte with its Content-Length, so servers with a wsgi.file_wrapper that uses
+# sendfile() (gunicorn, uwsgi) send it with os.sendfile without passing the bytes through python.
+# Compressible files (see compress) are sent as their precompressed .br/.gz copy when the client accepts it and the
+# copy is newer than the file; DOCROOT_PRECOMPRESSED = False turns that off.
+# With DOCROOT_SENDFILE = 'x-accel-redirect' (nginx) or 'x-sendfile' (apache mod_xsendfile) the file is not sent by
+# python at all: once the docroot lookup and forbidden checks passed we return an empty response naming the file and
+# the web server sends it (and handles conditional, range and gzip_static requests itself).  nginx needs an internal
+# location mapping DOCROOT_SENDFILE_PREFIX to the docroot:
+#
+#   location /_docroot/ { internal; alias /srv/example.com/docroot/files/; }
+#
+# DOCROOT_SENDFILE_HEADERS adds headers per extension, e.g. {'.mp4': {'X-Accel-Buffering': 'no'}}; an extension mapped
+# to None is still sent by python.  Any other DOCROOT_SENDFILE value is logged once and the files are sent by python.
+# Small files are sent from memory and medium ones from an mmap when DOCROOT_HOT_FILES is on (see hotfiles);
+# views.static asks serve_cached() before it even looks for the file.
+import os
+import re
+import uuid
+import logging
+import mimetypes
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from . import compress
+from . import hotfiles
+
+log = logging.getLogger("docrootcms.assets")
+
+# more ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+RANGE_SPEC = re.compile(r'^(\d*)-(\d*)$')
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+# DOCROOT_SENDFILE values we already logged as invalid
+_invalid_modes = set()
+
+
+def get_etag(stat):
+    """
+        a strong validator for the file contents; it changes whenever the file is rewritten or replaced
+    """
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}-{stat.st_ino:x}"'
+
+
+def add_validators(response, stat):
+    response['ETag'] = get_etag(stat)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+# a 304 (or 412) for the request's If-None-Match/If-Modified-Since etc.; None if the file has to be sent
+def conditional_response(request, stat):
+    response = get_conditional_response(request, etag=get_etag(stat), last_modified=int(stat.st_mtime))
+    if response is not None and response.status_code == 304:
+        # a 304 repeats the validators the client would have got with a 200
+        add_validators(response, stat)
+    return response
+
+
+# returns the (first, last) byte positions a Range header asks for, [] if none of them is satisfiable or None when
+#   the header is malformed and must be ignored
+def parse_ranges(header, size):
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC.match(spec.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = int(last) if last else size - 1
+        else:
+            # the last n bytes
+            length = int(last)
+            if not length:
+                continue
+            start = max(size - length, 0)
+            end = size - 1
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+# False when If-Range names another version of the file than the one we have; the client then wants all of it
+def if_range_matches(request, stat):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # only a strong etag can be used for a partial response
+        return value == get_etag(stat)
+    return parse_http_date_safe(value) == int(stat.st_mtime)
+
+
+def requested_ranges(request, stat):
+    """
+        the byte ranges to send for a GET with a Range header; None to send the whole file
+    """
+    header = request.headers.get('Range')
+    if request.method != 'GET' or not header or not if_range_matches(request, stat):
+        return None
+    ranges = parse_ranges(header, stat.st_size)
+    if ranges is not None and len(ranges) > MAX_RANGES:
+        log.debug(f"ignoring a request for {len(ranges)} ranges")
+        return None
+    return ranges
+
+
+class FileRange:
+    """
+        a read only window of an open file; fileno() lets a wsgi.file_wrapper sendfile() it from the current offset
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+# a response with the contents of a hot file; the same headers FileResponse would send for the file itself
+def bytes_response(data, status, content_type, source_name):
+    response = HttpResponse(data, status=status, content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(False, os.path.basename(source_name))
+    return response
+
+
+# body is the name of the file to send or its contents (see hotfiles)
+def single_range_response(body, content_type, stat, start, end, source_name):
+    length = end - start + 1
+    if isinstance(body, bytes):
+        response = bytes_response(body[start:end + 1], 206, content_type, source_name)
+    else:
+        # a real file so a wsgi.file_wrapper can sendfile() it
+        response = FileResponse(FileRange(open(body, 'rb'), start, length), status=206,
+                                content_type=content_type, filename=os.path.basename(source_name))
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
+
+
+def multipart_response(body, content_type, stat, ranges):
+    boundary = uuid.uuid4().hex
+    part_type = content_type or 'application/octet-stream'
+    headers = [(f'\r\n--{boundary}\r\nContent-Type: {part_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{stat.st_size}\r\n\r\n').encode('ascii') for start, end in ranges]
+    trailer = f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+    # opens the file on first use so nothing leaks when the response is never sent
+    def parts():
+        if isinstance(body, bytes):
+            for header, (start, end) in zip(headers, ranges):
+                yield header
+                yield body[start:end + 1]
+        else:
+            file = hotfiles.open_file(body, stat.st_size)
+            try:
+                for header, (start, end) in zip(headers, ranges):
+                    yield header
+                    part = FileRange(file, start, end - start + 1)
+                    while chunk := part.read(BLOCK_SIZE):
+                        yield chunk
+            finally:
+                file.close()
+        yield trailer
+
+    response = StreamingHttpResponse(parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    response['Content-Length'] = str(sum(len(header) for header in headers) + len(trailer) +
+                                     sum(end - start + 1 for start, end in ranges))
+    return response
+
+
+def range_response(body, content_type, stat, ranges, source_name):
+    if not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if len(ranges) == 1:
+        return single_range_response(body, content_type, stat, *ranges[0], source_name)
+    return multipart_response(body, content_type, stat, ranges)
+
+
+# {content coding: q} from an Accept-Encoding header
+def accepted_encodings(header):
+    encodings = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding] = quality
+    return encodings
+
+
+# the precompressed codings the client accepts, preferred first
+def preferred_encodings(request):
+    header = request.headers.get('Accept-Encoding')
+    if not header:
+        return []
+    accepted = accepted_encodings(header)
+    return [encoding for encoding in (compress.BROTLI, compress.GZIP)
+            if accepted.get(encoding, accepted.get('*', 0)) > 0]
+
+
+def is_negotiated(file_name):
+    return getattr(settings, 'DOCROOT_PRECOMPRESSED', True) and compress.is_compressible(file_name)
+
+
+# returns (file_name, stat, encoding) of the precompressed copy to send; encoding is None for the file itself
+def select_variant(request, file_name, stat):
+    for encoding in preferred_encodings(request):
+        variant = file_name + compress.SUFFIXES[encoding]
+        try:
+            variant_stat = os.stat(variant)
+        except FileNotFoundError:
+            continue
+        if variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+            return variant, variant_stat, encoding
+    return file_name, stat, None
+
+
+# the DOCROOT_SENDFILE mode; None when it is unset or not one we know so the files are sent by python
+def get_sendfile_mode():
+    mode = getattr(settings, 'DOCROOT_SENDFILE', None)
+    if not mode:
+        return None
+    mode = str(mode).lower()
+    if mode in (X_ACCEL_REDIRECT, X_SENDFILE):
+        return mode
+    if mode not in _invalid_modes:
+        _invalid_modes.add(mode)
+        log.error(f"unknown DOCROOT_SENDFILE [{mode}]; expected {X_ACCEL_REDIRECT} or {X_SENDFILE}. "
+                  f"Static files are sent by python.")
+    return None
+
+
+# the extra headers for an offloaded file; None if the file must be sent by python
+def offload_headers(file_name):
+    if not get_sendfile_mode():
+        return None
+    per_extension = getattr(settings, 'DOCROOT_SENDFILE_HEADERS', None) or {}
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in per_extension:
+        return {}
+    return per_extension[extension]
+
+
+def offload_response(file_name, path, headers):
+    """
+        an empty response telling the web server in front of us to send file_name
+    """
+    response = HttpResponse(content_type=mimetypes.guess_type(path)[0])
+    if get_sendfile_mode() == X_ACCEL_REDIRECT:
+        docroot_dir = os.path.abspath(str(getattr(settings, "DOCROOT_ROOT", "")))
+        relative = os.path.relpath(os.path.abspath(file_name), docroot_dir).replace(os.sep, '/')
+        prefix = getattr(settings, 'DOCROOT_SENDFILE_PREFIX', '/_docroot/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative)
+    else:
+        response['X-Sendfile'] = os.path.abspath(file_name)
+    for name, value in headers.items():
+        response[name] = value
+    log.debug(f"offloading {file_name}: {response.get('X-Accel-Redirect') or response.get('X-Sendfile')}")
+    return response
+
+
+def respond(request, path, source_name, body, stat, encoding, negotiated):
+    """
+        the response for one representation of a static file; body is the file to send or its contents
+    """
+    response = conditional_response(request, stat)
+    if response is not None:
+        log.debug(f"not modified: {source_name}")
+        if negotiated:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+    content_type = mimetypes.guess_type(path)[0]
+    ranges = requested_ranges(request, stat)
+    if ranges is not None:
+        log.debug(f"sending {ranges} of {source_name}")
+        response = range_response(body, content_type, stat, ranges, source_name)
+    elif isinstance(body, bytes):
+        response = bytes_response(body, 200, content_type, source_name)
+    else:
+        log.debug("downloading...")
+        # a server with a wsgi.file_wrapper may sendfile() the file; only map it for the others
+        file = hotfiles.open_file(body, stat.st_size, mappable='wsgi.file_wrapper' not in request.META)
+        response = FileResponse(file, content_type=content_type, filename=os.path.basename(source_name))
+        if isinstance(file, hotfiles.MappedFile):
+            response.block_size = BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if negotiated:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return add_validators(response, stat)
+
+
+def serve_hot_file(request, entry, path, negotiated):
+    body, stat, encoding = entry.data, entry.stat, None
+    if negotiated:
+        for preferred in preferred_encodings(request):
+            if preferred in entry.variants:
+                _, stat, body = entry.variants[preferred]
+                encoding = preferred
+                break
+    return respond(request, path, entry.file_name, body, stat, encoding, negotiated)
+
+
+def serve_cached(request, file_name, path):
+    """
+        the response for file_name from the hot file cache; None if it isn't cached (or hot files are off)
+    """
+    cache = hotfiles.get_cache()
+    if cache is None:
+        return None
+    entry = cache.get(file_name)
+    if entry is None:
+        return None
+    return serve_hot_file(request, entry, path, is_negotiated(file_name))
+
+
+def serve(request, file_name, path):
+    """
+        the response for the static file file_name (path is the url path it was found for); None if it is gone
+    """
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    headers = offload_headers(file_name)
+    if headers is not None:
+        return offload_response(file_name, path, headers)
+    negotiated = is_negotiated(file_name)
+    cache = hotfiles.get_cache()
+    if cache is not None and stat.st_size <= cache.max_file_size:
+        return serve_hot_file(request, cache.load(file_name, stat, negotiated), path, negotiated)
+    encoding = None
+    body = file_name
+    if negotiated:
+        # every variant has its own stat so the validators tell them apart
+        body, stat, encoding = select_variant(request, file_name, stat)
+    return respond(request, path, file_name, body, stat, encoding, negotiated)
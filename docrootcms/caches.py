@@ -0,0 +1,221 @@
+# Process level caches of objects built from docroot files (compiled .dt templates and executed .data.py modules) so
+# we stop re-reading and re-parsing the same files on every request.  Entries are validated against the file
+# modification time according to the cache mode:
+#   'mtime'    - stat the file on every hit (one syscall instead of a read + parse)
+#   'interval' - stat the file at most once every <interval> seconds
+#   'never'    - trust the cache (production); rely on the watcher (DOCROOT_WATCH) or a restart to pick up changes
+# Enable with DOCROOT_TEMPLATE_CACHE = 'mtime' | 'interval' | 'never'; DOCROOT_TEMPLATE_CACHE_INTERVAL in seconds and
+# DOCROOT_DATA_CACHE / DOCROOT_DATA_CACHE_INTERVAL for the data modules.
+# NOTE: a cached data module is shared by every request (and thread) of the worker, so module level code runs once per
+#   worker and get_context() must not modify module level objects (update a copy of a module level context dict).
+import os
+import time
+import codecs
+import logging
+import threading
+import importlib.util
+from collections import namedtuple
+from django.conf import settings
+from django.template import Template as DjangoTemplate
+from django.template import Origin, engines
+
+from . import watcher
+from . import dependencies
+
+log = logging.getLogger("docrootcms.caches")
+
+MTIME = 'mtime'
+INTERVAL = 'interval'
+NEVER = 'never'
+MODES = (MTIME, INTERVAL, NEVER)
+
+Entry = namedtuple('Entry', ['mtime', 'checked', 'value'])
+
+
+class FileCache:
+    """
+        maps a file name to a value built from that file; subclasses implement build()
+    """
+
+    def __init__(self, mode=MTIME, interval=2.0):
+        if mode not in MODES:
+            raise ValueError(f"unknown cache mode [{mode}]; expected one of {MODES}")
+        self.mode = mode
+        self.interval = interval
+        self.entries = {}
+        self.lock = threading.Lock()
+        # file name -> lock held while the file is built so concurrent misses build it only once
+        self.building = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_name, *args):
+        entry = self.entries.get(file_name)
+        if entry is not None:
+            if self.mode == NEVER:
+                self.hits += 1
+                return entry.value
+            now = time.monotonic()
+            if self.mode == INTERVAL and now - entry.checked < self.interval:
+                self.hits += 1
+                return entry.value
+            try:
+                mtime = os.stat(file_name).st_mtime_ns
+            except FileNotFoundError:
+                self.discard(file_name)
+                raise
+            if mtime == entry.mtime:
+                self.entries[file_name] = entry._replace(checked=now)
+                self.hits += 1
+                return entry.value
+            log.debug(f"{file_name} changed; rebuilding")
+        with self.lock:
+            building = self.building.setdefault(file_name, threading.Lock())
+        with building:
+            current = self.entries.get(file_name)
+            if current is not None and current is not entry:
+                # another thread built it while we waited
+                self.hits += 1
+                return current.value
+            self.misses += 1
+            # stat before building so a change made while we build is picked up on the next check
+            mtime = os.stat(file_name).st_mtime_ns
+            value = self.build(file_name, *args)
+            with self.lock:
+                self.entries[file_name] = Entry(mtime, time.monotonic(), value)
+        return value
+
+    def build(self, file_name, *args):
+        raise NotImplementedError
+
+    def discard(self, file_name):
+        with self.lock:
+            self.entries.pop(file_name, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'mode': self.mode,
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TemplateCache(FileCache):
+    """
+        compiled docroot .dt templates
+    """
+
+    def build(self, file_name, template_name):
+        template = compile_template(file_name, template_name)
+        # remember what it extends/includes so changes to shared layouts invalidate exactly the pages using them
+        dependencies.record(file_name, template)
+        return template
+
+
+class DataModuleCache(FileCache):
+    """
+        executed docroot .data.py modules
+    """
+
+    def build(self, file_name, module_name):
+        return load_data_module(file_name, module_name)
+
+
+def compile_template(file_name, template_name):
+    log.debug("opening file: " + str(file_name))
+    with codecs.open(file_name, "r", encoding='utf-8') as fp:
+        log.debug("loading template...")
+        # sas django 2.2 no longer reqiures bytes so we can go back to just reading it in
+        # if this has problems with utf-8 content then do a decode afterwards instead
+        return DjangoTemplate(fp.read(), Origin(file_name), template_name)
+
+
+def load_data_module(file_name, module_name):
+    log.debug(f"loading data file: {file_name}")
+    spec = importlib.util.spec_from_file_location(module_name, file_name)
+    data = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(data)
+    return data
+
+
+_template_cache = None
+_data_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_template_cache():
+    global _template_cache
+    if _template_cache is None:
+        mode = getattr(settings, 'DOCROOT_TEMPLATE_CACHE', None)
+        if not mode:
+            return None
+        with _cache_lock:
+            if _template_cache is None:
+                _template_cache = TemplateCache(mode, getattr(settings, 'DOCROOT_TEMPLATE_CACHE_INTERVAL', 2.0))
+                watcher.subscribe(on_change)
+    return _template_cache
+
+
+# returns the compiled template for a docroot .dt file; from the cache when it is enabled
+def get_template(file_name, template_name):
+    cache = get_template_cache()
+    if cache is None:
+        return compile_template(file_name, template_name)
+    return cache.get(file_name, template_name)
+
+
+def get_data_cache():
+    global _data_cache
+    if _data_cache is None:
+        mode = getattr(settings, 'DOCROOT_DATA_CACHE', None)
+        if not mode:
+            return None
+        with _cache_lock:
+            if _data_cache is None:
+                _data_cache = DataModuleCache(mode, getattr(settings, 'DOCROOT_DATA_CACHE_INTERVAL', 2.0))
+                watcher.subscribe(on_change)
+    return _data_cache
+
+
+# returns the executed data module for a docroot .data.py file; from the cache when it is enabled
+#   raises FileNotFoundError if there is no data file
+def get_data_module(file_name, module_name):
+    cache = get_data_cache()
+    if cache is None:
+        return load_data_module(file_name, module_name)
+    return cache.get(file_name, module_name)
+
+
+# the templates our docroot templates extend and include (page.dt, _base.dt, dt.inc/*) are loaded through the
+#   template engine; reset any cached loaders so they are re-read after a change
+def reset_template_loaders():
+    for engine in engines.all():
+        for loader in getattr(getattr(engine, 'engine', None), 'template_loaders', []):
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+
+def on_change(event):
+    file_caches = [cache for cache in (_template_cache, _data_cache) if cache]
+    if event.kind == watcher.RESET or event.is_dir:
+        for cache in file_caches:
+            cache.clear()
+        reset_template_loaders()
+        return
+    for cache in file_caches:
+        cache.discard(event.file_name)
+    if event.file_name.endswith('.dt') or 'dt.inc' in event.file_name:
+        reset_template_loaders()
+
+
+def stats():
+    templates = get_template_cache()
+    data = get_data_cache()
+    return {'templates': templates.stats() if templates else None, 'data_modules': data.stats() if data else None}
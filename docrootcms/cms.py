@@ -1,22 +1,38 @@
 import os
-import codecs
 import logging
-import importlib.util
+import datetime
+from asgiref.sync import async_to_sync, sync_to_async, iscoroutinefunction
 from django.conf import settings
-from django.template import Template as DjangoTemplate
-from django.template import Origin, RequestContext
-from django.http import HttpResponse
+from django.template import RequestContext
+from django.http import HttpResponse, HttpResponseBase, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag, set_response_etag
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_protect
 
+from . import routes
+from . import caches
+from . import pagecache
+from . import streaming
+from . import contextloaders
+from . import templatevars
+from . import jsonencoding
+from . import admission
+from . import coalesce
+from . import revalidate
+
 log = logging.getLogger("docrootcms.cms")
 
 
 class Template:
     # note: uri = request.path_info.strip() or '/home/index.html'
     # note: language_code = request.LANGUAGE_CODE or 'en' or 'fr'
-    def __init__(self, uri, language_code):
+    # note: request is the request to render for; a synthetic GET for the uri is built when it is not given
+    def __init__(self, uri, language_code, request=None):
         # setup our basic attributes for the meta-data we will use for validation and template creation
         self.is_found = False
+        self.language_code = language_code
+        self.request = request
         self.docroot_dir = getattr(settings, "DOCROOT_ROOT", "")
         log.debug("docroot dir: " + str(self.docroot_dir))
         self.original_path = uri.strip()
@@ -74,13 +90,13 @@ class Template:
             self.file_name += "dt"
             self.template_name = self.template_name[:-4]
             self.template_name += "dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.is_found = True
 
         elif self.file_name.endswith('/'):
             self.file_name += "index.dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.module_name += "index.html"
                 self.template_name += "index.dt"
@@ -88,26 +104,25 @@ class Template:
 
         else:
             self.file_name += ".dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.module_name += ".html"
                 self.template_name += ".dt"
                 self.is_found = True
 
-    def render(self):
+    # direct: render the page itself, bypassing the page cache, coalescing and admission control (exports)
+    def render(self, direct=False):
         if self.is_found:
-            log.debug("opening file: " + str(self.file_name))
-            fp = codecs.open(self.file_name, "r", encoding='utf-8')
-            log.debug("loading template...")
-            # template = Template(fp.read().encode('utf-8'), Origin(self.file_name), self.template_name)
-            # sas django 2.2 no longer reqiures bytes so we can go back to just reading it in
-            # if this has problems with utf-8 content then do a decode afterwards instead
-            template = DjangoTemplate(fp.read(), Origin(self.file_name), self.template_name)
-            log.debug("closing file")
-            fp.close()
+            log.debug("loading template: " + str(self.file_name))
+            # compiled templates are shared from the process cache when DOCROOT_TEMPLATE_CACHE is set
+            template = caches.get_template(self.file_name, self.template_name)
 
             if template:
                 log.debug("attempting to load context and render the template...")
+                if self.request is None:
+                    self.request = self.synthetic_request(self.original_path, self.language_code)
+                if direct:
+                    return TemplateMeta.render_page_direct(self.request, template, self.module_name)
                 return self.render_page(self.request, template, self.module_name)
             else:
                 return None
@@ -118,65 +133,25 @@ class Template:
     def __str__(self):
         return self.file_name
 
+    # an anonymous GET for rendering pages outside of a real request (exports etc.)
     @staticmethod
-    @csrf_protect
-    def render_page(request, template, module_name):
-        """
-        Internal interface to the dev page view.
-        """
-        context = {}
-        log.debug("template name: " + template.name)
-        log.debug("module_name: " + module_name)
-        datafile_name = template.origin.name
-        # strip off the html and try data.py
-        if datafile_name.endswith('dt'):
-            datafile_name = datafile_name[0:len(datafile_name) - 2]
-            datafile_name += 'data.py'
-            log.debug("datafilename: " + datafile_name)
-        # else:
-        #     datafile_name += '.data.py'
-        # try to load a data file if it is there in order to get the context
-        # all data files should support get_context() or a context property
-        try:
-            log.debug("attempting to load data_file...")
-            spec = importlib.util.spec_from_file_location(module_name, datafile_name)
-            data = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(data)
-
-            # datafile = imp.load_source(module_name, datafile_name)
-            # note changing datafile below to data
-        except FileNotFoundError:
-            data = None
-        except Exception as ex:
-            # logging.error(traceback.format_exc())
-            data = None
-            if settings.DEBUG:
-                raise ex
-        if data:
-            try:
-                initmethod = getattr(data, 'get_context')
-            except AttributeError:
-                initmethod = None
-            if initmethod:
-                # we may want to return something like a redirect so if is response then return it; else use for data!
-                context = initmethod(request)
-                if isinstance(context, HttpResponse):
-                    return context
-            else:
-                try:
-                    context = getattr(data, 'context')
-                except AttributeError:
-                    context = {}
-        # print("context string: " + str(context))
-        template_context = RequestContext(request)
-        if context:
-            template_context.push(context)
-        response = HttpResponse(template.render(template_context))
-        # add a canonical header if we are doing some fancy string replacement so analytics work properly with SEO
-        if request.path != "/" + module_name and request.scheme and request.get_host():
-            response['Link'] = f'< {request.scheme}://{request.get_host()}/{module_name} >; rel="canonical"'
+    def synthetic_request(uri, language_code):
+        from django.test import RequestFactory
+        from django.contrib.auth.models import AnonymousUser
+        # the host has to pass ALLOWED_HOSTS since the canonical link header calls request.get_host()
+        host = getattr(settings, 'DOCROOT_EXPORT_HOST', None)
+        if not host:
+            allowed = [h for h in getattr(settings, 'ALLOWED_HOSTS', []) if h != '*' and not h.startswith('.')]
+            host = allowed[0] if allowed else 'localhost'
+        request = RequestFactory().get(uri, HTTP_HOST=host, SERVER_NAME=host)
+        request.LANGUAGE_CODE = language_code
+        request.user = AnonymousUser()
+        return request
 
-        return response
+    @staticmethod
+    def render_page(request, template, module_name):
+        # same pipeline (data file, caching, csrf) as a docroot request
+        return TemplateMeta.render_page(request, template, module_name)
 
 
 class Data:
@@ -249,13 +224,13 @@ class TemplateMeta:
             self.file_name += "dt"
             self.template_name = self.template_name[:-4]
             self.template_name += "dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.is_found = True
 
         elif self.file_name.endswith('/'):
             self.file_name += "index.dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.module_name += "index.html"
                 self.template_name += "index.dt"
@@ -263,7 +238,7 @@ class TemplateMeta:
 
         else:
             self.file_name += ".dt"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.module_name += ".html"
                 self.template_name += ".dt"
@@ -271,15 +246,9 @@ class TemplateMeta:
 
     def render(self):
         if self.is_found:
-            log.debug("opening file: " + str(self.file_name))
-            fp = codecs.open(self.file_name, "r", encoding='utf-8')
-            log.debug("loading template...")
-            # template = Template(fp.read().encode('utf-8'), Origin(self.file_name), self.template_name)
-            # sas django 2.2 no longer reqiures bytes so we can go back to just reading it in
-            # if this has problems with utf-8 content then do a decode afterwards instead
-            template = DjangoTemplate(fp.read(), Origin(self.file_name), self.template_name)
-            log.debug("closing file")
-            fp.close()
+            log.debug("loading template: " + str(self.file_name))
+            # compiled templates are shared from the process cache when DOCROOT_TEMPLATE_CACHE is set
+            template = caches.get_template(self.file_name, self.template_name)
 
             if template:
                 log.debug("attempting to load context and render the template...")
@@ -287,6 +256,17 @@ class TemplateMeta:
             else:
                 return None
 
+    async def arender(self):
+        if self.is_found:
+            log.debug("loading template: " + str(self.file_name))
+            template = caches.get_template(self.file_name, self.template_name)
+
+            if template:
+                log.debug("attempting to load context and render the template...")
+                return await self.arender_page(self.request, template, self.module_name)
+            else:
+                return None
+
     def is_found(self):
         return self.is_found
 
@@ -299,59 +279,247 @@ class TemplateMeta:
         """
         Internal interface to the dev page view.
         """
-        context = {}
+        page = PageRender(request, template, module_name)
+        # identical concurrent requests wait for the first one and share its response
+        return coalesce.run(coalesce.get_key(request, page.data, page.policy), request, page.serve)
+
+    @staticmethod
+    @csrf_protect
+    async def arender_page(request, template, module_name):
+        """
+        Internal interface to the dev page view under ASGI; an async get_context() is awaited on the event loop
+        """
+        # loading the data file and checking request.user (a session lookup) may query the database
+        page, key = await sync_to_async(TemplateMeta.prepare_page)(request, template, module_name)
+        return await coalesce.arun(key, request, page.aserve)
+
+    @staticmethod
+    @csrf_protect
+    def render_page_direct(request, template, module_name):
+        """
+            renders the page without the page cache, coalescing or admission control
+        """
+        page = PageRender(request, template, module_name)
+        page.policy = None
+        return page.render()
+
+    # returns (page, coalescing key) for a request
+    @staticmethod
+    def prepare_page(request, template, module_name):
+        page = PageRender(request, template, module_name)
+        return page, coalesce.get_key(request, page.data, page.policy)
+
+    @staticmethod
+    def add_canonical_link(request, response, module_name):
+        # add a canonical header if we are doing some fancy string replacement so analytics work properly with SEO
+        if request.path != "/" + module_name and request.scheme and request.get_host():
+            response['Link'] = f'< {request.scheme}://{request.get_host()}/{module_name} >; rel="canonical"'
+        return response
+
+
+class PageRender:
+    """
+        the steps of rendering one docroot page; shared by the sync and async page views
+    """
+
+    def __init__(self, request, template, module_name):
+        self.request = request
+        self.template = template
+        self.module_name = module_name
         log.debug("template name: " + template.name)
         log.debug("module_name: " + module_name)
-        datafile_name = template.origin.name
+        self.data, self.data_failed = self.load_data(template.origin.name, module_name)
+        # streamed pages are never cached
+        self.stream = streaming.is_streamed(self.data)
+        self.policy = None if self.data_failed or self.stream else pagecache.get_policy(self.data)
+        if self.policy and not pagecache.is_cacheable_request(request):
+            self.policy = None
+        self.generations = None
+        self.session_accessed = None
+        # the expired or outdated cache entry for stale-while-revalidate and stale-if-error
+        self.stale = None
+
+    # returns (data, data_failed) for the data file next to a page template
+    @staticmethod
+    def load_data(datafile_name, module_name):
         # strip off the html and try data.py
         if datafile_name.endswith('dt'):
             datafile_name = datafile_name[0:len(datafile_name) - 2]
             datafile_name += 'data.py'
             log.debug("datafilename: " + datafile_name)
-        # else:
-        #     datafile_name += '.data.py'
         # try to load a data file if it is there in order to get the context
         # all data files should support get_context() or a context property
         try:
             log.debug("attempting to load data_file...")
-            spec = importlib.util.spec_from_file_location(module_name, datafile_name)
-            data = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(data)
-
-            # datafile = imp.load_source(module_name, datafile_name)
-            # note changing datafile below to data
+            # executed once per worker and shared when DOCROOT_DATA_CACHE is set
+            return caches.get_data_module(datafile_name, module_name), False
         except FileNotFoundError:
-            data = None
+            return None, False
         except Exception as ex:
             # logging.error(traceback.format_exc())
-            data = None
             if settings.DEBUG:
                 raise ex
-        if data:
-            try:
-                initmethod = getattr(data, 'get_context')
-            except AttributeError:
-                initmethod = None
-            if initmethod:
-                # we may want to return something like a redirect so if is response then return it; else use for data!
-                context = initmethod(request)
-                if isinstance(context, HttpResponse):
-                    return context
+            return None, True
+
+    # serve the rendered page from the output cache if the data file (or the lack of one) allows it
+    def cached_response(self):
+        if not self.policy:
+            return None
+        pagecache.subscribe()
+        response, self.generations, self.stale = pagecache.get(self.request, self.module_name, self.policy,
+                                                               pagecache.dependency_keys(self.template))
+        if not response and self.stale and pagecache.can_revalidate(self.stale, self.policy, self.generations):
+            # the visitor gets the expired copy now; the page is rendered again in the background
+            response = pagecache.to_response(self.stale)
+            revalidate.submit(pagecache.get_key(self.request, self.module_name, self.policy), self.refresh,
+                              pagecache.get_cache())
+        if response:
+            return TemplateMeta.add_canonical_link(self.request, response, self.module_name)
+        self.session_accessed = pagecache.track_session(self.request)
+        return None
+
+    # renders the page again for a detached copy of the request to replace the stale cache entry
+    def refresh(self):
+        page = PageRender(revalidate.detach_request(self.request), self.template, self.module_name)
+        if not page.policy:
+            return
+        page.generations = self.generations
+        page.session_accessed = pagecache.track_session(page.request)
+        page.render()
+
+    # the last good copy in place of a page that failed to render; None if there is none to serve
+    def stale_response(self):
+        if not self.stale or not pagecache.can_serve_on_error(self.stale, self.policy):
+            return None
+        pagecache.session_used(self.request, self.session_accessed)
+        return TemplateMeta.add_canonical_link(self.request, pagecache.to_response(self.stale), self.module_name)
+
+    def get_context_method(self):
+        return getattr(self.data, 'get_context', None)
+
+    def static_context(self):
+        return getattr(self.data, 'context', {})
+
+    # {key: callable(request)} to run concurrently and add to the context; loaders for keys the template (with its
+    #   parents and includes) never reads are skipped
+    def get_loaders(self):
+        loaders = getattr(self.data, 'loaders', None)
+        if loaders:
+            report = templatevars.analyze(self.template)
+            if report.complete:
+                unused = [key for key in loaders if key not in report.keys]
+                if unused:
+                    log.debug(f"skipping loaders the template does not use: {unused}")
+                    loaders = {key: loader for key, loader in loaders.items() if key in report.keys}
+        return loaders
+
+    # a new dict since the context may be the data file's module level context
+    @staticmethod
+    def merge_context(context, values):
+        merged = dict(context or {})
+        merged.update(values)
+        return merged
+
+    # get_context() returned a response (a redirect etc.) instead of the context
+    def context_response(self, response):
+        if self.policy:
+            pagecache.session_used(self.request, self.session_accessed)
+        return response
+
+    def serve(self):
+        response = self.cached_response()
+        if response:
+            return response
+        # requests over the page's concurrency limit wait for a slot or are turned away before doing any work
+        limiter = admission.get_limiter(self.module_name, self.data)
+        if limiter and not limiter.acquire():
+            return self.stale_response() or admission.rejected_response(self.data)
+        response = None
+        try:
+            response = self.render()
+            return response
+        except Exception:
+            response = self.stale_response()
+            if response is None:
+                raise
+            log.exception(f"serving a stale copy of {self.module_name}")
+            return response
+        finally:
+            if limiter:
+                # a streamed page keeps its slot until it has been sent
+                admission.release_after(limiter, response)
+
+    async def aserve(self):
+        if self.policy:
+            # the cache backends are synchronous
+            response = await sync_to_async(self.cached_response)()
+            if response:
+                return response
+        limiter = admission.get_limiter(self.module_name, self.data)
+        if limiter and not await limiter.aacquire():
+            return self.stale_response() or admission.rejected_response(self.data)
+        response = None
+        try:
+            response = await self.arender()
+            return response
+        except Exception:
+            response = self.stale_response()
+            if response is None:
+                raise
+            log.exception(f"serving a stale copy of {self.module_name}")
+            return response
+        finally:
+            if limiter:
+                # a streamed page keeps its slot until it has been sent
+                admission.release_after(limiter, response)
+
+    def render(self):
+        initmethod = self.get_context_method()
+        if initmethod:
+            # we may want to return something like a redirect so if is response then return it; else use for data!
+            if iscoroutinefunction(initmethod):
+                context = async_to_sync(initmethod)(self.request)
+            else:
+                context = initmethod(self.request)
+            if isinstance(context, HttpResponse):
+                return self.context_response(context)
+        else:
+            context = self.static_context()
+        loaders = self.get_loaders()
+        if loaders:
+            context = self.merge_context(context, contextloaders.run(self.request, loaders))
+        return self.respond(context)
+
+    async def arender(self):
+        initmethod = self.get_context_method()
+        if initmethod:
+            if iscoroutinefunction(initmethod):
+                context = await initmethod(self.request)
             else:
-                try:
-                    context = getattr(data, 'context')
-                except AttributeError:
-                    context = {}
-        # print("context string: " + str(context))
-        template_context = RequestContext(request)
+                context = await sync_to_async(initmethod)(self.request)
+            if isinstance(context, HttpResponse):
+                return self.context_response(context)
+        else:
+            context = self.static_context()
+        loaders = self.get_loaders()
+        if loaders:
+            context = self.merge_context(context, await contextloaders.arun(self.request, loaders))
+        # templates and context processors may use the database so they render in a thread
+        return await sync_to_async(self.respond)(context, asynchronous=True)
+
+    def respond(self, context, asynchronous=False):
+        template_context = RequestContext(self.request)
         if context:
             template_context.push(context)
-        response = HttpResponse(template.render(template_context))
-        # add a canonical header if we are doing some fancy string replacement so analytics work properly with SEO
-        if request.path != "/" + module_name and request.scheme and request.get_host():
-            response['Link'] = f'< {request.scheme}://{request.get_host()}/{module_name} >; rel="canonical"'
-
-        return response
+        if self.stream:
+            response = streaming.stream_page(self.request, self.template, template_context,
+                                             streaming.get_chunk_size(self.data), asynchronous)
+            return TemplateMeta.add_canonical_link(self.request, response, self.module_name)
+        response = HttpResponse(self.template.render(template_context))
+        if self.policy:
+            pagecache.store(self.request, self.module_name, self.policy, response, self.generations,
+                            pagecache.session_used(self.request, self.session_accessed))
+        return TemplateMeta.add_canonical_link(self.request, response, self.module_name)
 
 
 class ApiMeta:
@@ -362,6 +530,7 @@ class ApiMeta:
     def __init__(self, request):
         self.ALL_OPTIONS = ['GET', 'POST', 'PUT', 'TRACE', 'DELETE', 'HEAD', 'PATCH']
         self.options = []
+        self.data = None
         # setup our basic attributes for the meta-data we will use for validation and api creation
         self.is_found = False
         self.request = request
@@ -418,83 +587,217 @@ class ApiMeta:
             # our url will request .json but we want to look for a .data.py file
             self.file_name = self.file_name[:-4]
             self.file_name += "data.py"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + self.file_name)
                 self.is_found = True
         elif self.file_name.endswith('/'):
             self.file_name += "index.data.py"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.api_name += "index.json"
                 self.is_found = True
         else:
             self.file_name += ".data.py"
-            if os.path.isfile(self.file_name):
+            if routes.isfile(self.file_name):
                 log.debug("found file: " + str(self.file_name))
                 self.api_name += ".json"
                 self.is_found = True
 
+    # returns (method, response): the data file function to call for this request or the response to send instead
+    def get_method(self):
+        # try to load a data file if it is there in order to get the context
+        # all data files should support get_context() or a context property
+        try:
+            log.debug("attempting to load data_file...")
+            # executed once per worker and shared when DOCROOT_DATA_CACHE is set
+            data = caches.get_data_module(self.file_name, self.api_name)
+        except FileNotFoundError:
+            return None, None
+        except Exception as ex:
+            data = None
+            logging.error(str(ex))
+            if settings.DEBUG:
+                raise ex
+
+        if not data:
+            return None, None
+        self.data = data
+        methods = dir(data)
+        for method in methods:
+            if method in self.ALL_OPTIONS:
+                self.options.append(method)
+        # figure out the proper method to call (get, post trace etc) return method not supported if not there
+        request_method = self.request.method
+        # adding method overriding; very useful for testing or getting around proxies
+        # look for a GET or POST "_method" parameter and change the method we are looking for if found
+        override = self.request.GET.get('_method')
+        if not override:
+            override = self.request.POST.get('_method')
+        if override:
+            request_method = override.upper().strip()
+            log.debug(f"Overriding method [{self.request.method}] with parameter value [{request_method}]")
+        try:
+            initmethod = getattr(data, request_method)
+        except AttributeError:
+            initmethod = None
+        if initmethod:
+            return initmethod, None
+        log.error(
+            "Found datafile [" + self.file_name + "] but didn't find method [" + request_method + "]!")
+        # if we don't support any methods lets return a not found instead of method not supported
+        #   since there is no way to adjust the call to get it to work
+        if not self.options:
+            return None, None
+        response = HttpResponse("Method Not Supported [" + request_method + "]!", status=405)
+        response['Allow'] = ",".join(self.options)
+        # response['Content-Type'] = "text/plain"
+        return None, response
+
+    # we may want to return something like a redirect so if is response then return it; else use for data!
+    #   dicts and lists are encoded as json and generators/iterators are streamed as a json array or ndjson
+    def make_response(self, content, asynchronous=False):
+        if isinstance(content, HttpResponseBase):
+            return content
+        if jsonencoding.is_document(content):
+            response = HttpResponse(jsonencoding.dumps(content), content_type='application/json')
+        elif jsonencoding.is_stream(content):
+            response = self.stream_response(content, asynchronous)
+        else:
+            response = HttpResponse(content)
+        response['Allow'] = ",".join(self.options)
+        # response['Content-Type'] = "application/json"
+        return response
+
+    def stream_response(self, items, asynchronous=False):
+        format_name = jsonencoding.stream_format(self.request, self.data)
+        chunk_size = streaming.get_chunk_size(self.data)
+        if hasattr(items, '__anext__'):
+            chunks = jsonencoding.aiter_encoded(items, format_name, chunk_size)
+        else:
+            chunks = jsonencoding.iter_encoded(items, format_name, chunk_size)
+            if asynchronous:
+                chunks = streaming.aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=jsonencoding.CONTENT_TYPES[format_name])
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    # the etag(request) and last_modified(request) hooks of the data file; they let us answer a conditional request
+    #   (304 Not Modified / 412 Precondition Failed) without calling the method
+    def get_validator_hooks(self):
+        return getattr(self.data, 'etag', None), getattr(self.data, 'last_modified', None)
+
+    # returns (etag, last_modified) as used by django.utils.cache from what the hooks returned
+    @staticmethod
+    def validators(etag, last_modified):
+        if etag:
+            etag = quote_etag(str(etag))
+        if last_modified:
+            if not timezone.is_aware(last_modified):
+                last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+            last_modified = int(last_modified.timestamp())
+        return etag or None, last_modified or None
+
+    def add_validators(self, response, etag, last_modified):
+        if self.request.method not in ('GET', 'HEAD'):
+            return response
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        elif (response.status_code == 200 and not response.has_header('ETag')
+              and getattr(settings, 'DOCROOT_API_ETAGS', True)):
+            # no hook so the best we can do is save the client the download
+            set_response_etag(response)
+            if response.has_header('ETag'):
+                return get_conditional_response(self.request, etag=response['ETag'],
+                                                last_modified=last_modified, response=response)
+        return response
+
     def render(self):
         # return none if not found
         if self.is_found:
-            # try to load a data file if it is there in order to get the context
-            # all data files should support get_context() or a context property
-            try:
-                log.debug("attempting to load data_file...")
-                spec = importlib.util.spec_from_file_location(self.api_name, self.file_name)
-                data = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(data)
-                # datafile = imp.load_source(module_name, datafile_name)
-                # note changing datafile below to data
-            except FileNotFoundError:
-                return None
-            except Exception as ex:
-                data = None
-                logging.error(str(ex))
-                if settings.DEBUG:
-                    raise ex
-
-            if data:
-                methods = dir(data)
-                for method in methods:
-                    if method in self.ALL_OPTIONS:
-                        self.options.append(method)
-                # figure out the proper method to call (get, post trace etc) return method not supported if not there
-                request_method = self.request.method
-                # adding method overriding; very useful for testing or getting around proxies
-                # look for a GET or POST "_method" parameter and change the method we are looking for if found
-                override = self.request.GET.get('_method')
-                if not override:
-                    override = self.request.POST.get('_method')
-                if override:
-                    request_method = override.upper().strip()
-                    log.debug(f"Overriding method [{self.request.method}] with parameter value [{request_method}]")
-                try:
-                    initmethod = getattr(data, request_method)
-                except AttributeError:
-                    initmethod = None
-                if initmethod:
-                    # we may want to return something like a redirect so if is response then return it; else use for
-                    # data!
-                    content = initmethod(self.request)
-                    if isinstance(content, HttpResponse):
-                        return content
-                    else:
-                        response = HttpResponse(content)
-                        response['Allow'] = ",".join(self.options)
-                        # response['Content-Type'] = "application/json"
-                        return response
-                else:
-                    log.error(
-                        "Found datafile [" + self.file_name + "] but didn't find method [" + request_method + "]!")
-                    # if we don't support any methods lets return a not found instead of method not supported
-                    #   since there is no way to adjust the call to get it to work
-                    if not self.options:
-                        return None
-                    response = HttpResponse("Method Not Supported [" + request_method + "]!", status=405)
-                    response['Allow'] = ",".join(self.options)
-                    # response['Content-Type'] = "text/plain"
+            initmethod, response = self.get_method()
+            if initmethod is None:
+                return response
+            etag_hook, last_modified_hook = self.get_validator_hooks()
+            etag, last_modified = self.validators(
+                self.call_hook(etag_hook), self.call_hook(last_modified_hook))
+            # without a validator from a hook there is nothing to check yet; add_validators answers from the body
+            if etag or last_modified:
+                response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+                if response is not None:
+                    return response
+            # identical concurrent requests wait for the first one and share its response
+            return coalesce.run(coalesce.get_key(self.request, self.data), self.request,
+                                lambda: self.call_method(initmethod, etag, last_modified))
+
+    async def arender(self):
+        # return none if not found
+        if self.is_found:
+            # loading the data file may query the database
+            initmethod, response = await sync_to_async(self.get_method)()
+            if initmethod is None:
+                return response
+            etag_hook, last_modified_hook = self.get_validator_hooks()
+            etag, last_modified = self.validators(
+                await self.acall_hook(etag_hook), await self.acall_hook(last_modified_hook))
+            # without a validator from a hook there is nothing to check yet; add_validators answers from the body
+            if etag or last_modified:
+                response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+                if response is not None:
                     return response
+            # the key depends on request.user (a session lookup)
+            key = await sync_to_async(coalesce.get_key)(self.request, self.data)
+            return await coalesce.arun(key, self.request, lambda: self.acall_method(initmethod, etag, last_modified))
+
+    def call_method(self, initmethod, etag, last_modified):
+        # requests over the api's concurrency limit wait for a slot or are turned away before doing any work
+        limiter = admission.get_limiter(self.api_name, self.data)
+        if limiter and not limiter.acquire():
+            return admission.rejected_response(self.data)
+        response = None
+        try:
+            if iscoroutinefunction(initmethod):
+                content = async_to_sync(initmethod)(self.request)
+            else:
+                content = initmethod(self.request)
+            response = self.add_validators(self.make_response(content), etag, last_modified)
+            return response
+        finally:
+            if limiter:
+                # a streamed response keeps its slot until it has been sent
+                admission.release_after(limiter, response)
+
+    async def acall_method(self, initmethod, etag, last_modified):
+        limiter = admission.get_limiter(self.api_name, self.data)
+        if limiter and not await limiter.aacquire():
+            return admission.rejected_response(self.data)
+        response = None
+        try:
+            if iscoroutinefunction(initmethod):
+                content = await initmethod(self.request)
+            else:
+                # sync data functions may use the database
+                content = await sync_to_async(initmethod)(self.request)
+            response = self.add_validators(self.make_response(content, asynchronous=True), etag, last_modified)
+            return response
+        finally:
+            if limiter:
+                admission.release_after(limiter, response)
+
+    def call_hook(self, hook):
+        if hook is None:
+            return None
+        if iscoroutinefunction(hook):
+            return async_to_sync(hook)(self.request)
+        return hook(self.request)
+
+    async def acall_hook(self, hook):
+        if hook is None:
+            return None
+        if iscoroutinefunction(hook):
+            return await hook(self.request)
+        return await sync_to_async(hook)(self.request)
 
     def is_found(self):
         return self.is_found
@@ -0,0 +1,248 @@
+# Single-flight rendering: when many identical requests for an uncached page or api arrive together (a newsletter
+# link, a cache entry expiring under load) only the first one runs get_context()/the method and renders; the others
+# wait for it and get a copy of its response.  Requests are identical when they are anonymous GET/HEADs for the same
+# host, path and language with the same cache_vary_on_headers/cache_vary_on_query values.
+# Pages with a page cache policy coalesce automatically; other pages and apis opt in with coalesce = True in their
+# data file or everywhere with DOCROOT_COALESCE.  Waiters give up after DOCROOT_COALESCE_TIMEOUT seconds and render
+# for themselves, as they do when the first response can't be shared (it set a cookie, used the csrf token or the
+# session, or is streamed).
+# With DOCROOT_COALESCE_LOCK the first request also takes a lock in the page cache backend (DOCROOT_PAGE_CACHE_ALIAS)
+# so the other worker processes wait for it too; the shared response is kept there for
+# DOCROOT_COALESCE_RESULT_TTL seconds.
+# Under ASGI the waiters are futures on the event loop, so a burst of identical requests doesn't hold a thread each.
+import os
+import time
+import asyncio
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import pagecache
+
+log = logging.getLogger("docrootcms.coalesce")
+
+KEY_PREFIX = 'docrootcms:flight'
+# how often waiters in other workers look for the shared response
+POLL_INTERVAL = 0.05
+
+
+class Flight:
+    """
+        one in-progress render the identical requests of this process wait on
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.snapshot = None
+        # futures of the requests waiting on an event loop; resolved by land()
+        self.waiters = []
+
+    async def wait(self, timeout):
+        """
+            event.wait() for the event loop
+        """
+        with _flights_lock:
+            if self.event.is_set():
+                return True
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with _flights_lock:
+                if future in self.waiters:
+                    self.waiters.remove(future)
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(True)
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_counters = {'leaders': 0, 'followers': 0, 'shared': 0, 'fallbacks': 0, 'remote_shared': 0}
+
+
+def count(name):
+    with _flights_lock:
+        _counters[name] += 1
+
+
+def get_timeout():
+    return getattr(settings, 'DOCROOT_COALESCE_TIMEOUT', 10.0)
+
+
+def get_key(request, data, policy=None):
+    """
+        the key identical requests share or None if this request must not be coalesced
+    """
+    enabled = getattr(data, 'coalesce', None)
+    if enabled is None:
+        enabled = getattr(settings, 'DOCROOT_COALESCE', False) or policy is not None
+    if not enabled or getattr(data, 'stream', False) or not pagecache.is_cacheable_request(request):
+        return None
+    if policy is None:
+        policy = pagecache.Policy(0, list(getattr(data, 'cache_vary_on_headers', None) or []),
+                                  getattr(data, 'cache_vary_on_query', None))
+    # the response can carry a canonical link built from the host and path
+    uri = f"{request.get_host()}{request.path}"
+    return f"{KEY_PREFIX}:{request.method}:{pagecache.get_key(request, uri, policy)}"
+
+
+# what the waiters get; None if the response is specific to the request that rendered it
+def take_snapshot(request, response, session_was_used):
+    if response is None or response.status_code != 200 or response.streaming:
+        return None
+    if pagecache.is_private(request, response, session_was_used):
+        return None
+    headers = [(name, value) for name, value in response.items() if name.lower() != 'set-cookie']
+    return {'content': response.content, 'status': response.status_code, 'headers': headers}
+
+
+def restore(snapshot):
+    response = HttpResponse(snapshot['content'], status=snapshot['status'])
+    for name, value in snapshot['headers']:
+        response[name] = value
+    return response
+
+
+def get_lock_cache():
+    if not getattr(settings, 'DOCROOT_COALESCE_LOCK', False):
+        return None
+    return pagecache.get_cache()
+
+
+# takes the cross worker lock; returns (locked, snapshot) where snapshot is the response another worker shared
+def lock_or_wait(cache, key):
+    lock_key = f'{key}:lock'
+    result_key = f'{key}:result'
+    timeout = get_timeout()
+    if cache.add(lock_key, os.getpid(), timeout):
+        return True, None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        values = cache.get_many([lock_key, result_key])
+        if result_key in values:
+            count('remote_shared')
+            return False, values[result_key]
+        if lock_key not in values:
+            # the other worker finished without something to share (or died); render it ourselves
+            return False, None
+        time.sleep(POLL_INTERVAL)
+    return False, None
+
+
+def unlock(cache, key, snapshot):
+    if snapshot is not None:
+        cache.set(f'{key}:result', snapshot, getattr(settings, 'DOCROOT_COALESCE_RESULT_TTL', 2))
+    cache.delete(f'{key}:lock')
+
+
+# returns (flight, is_leader)
+def join(key):
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            _counters['followers'] += 1
+            return flight, False
+        flight = _flights[key] = Flight()
+        _counters['leaders'] += 1
+        return flight, True
+
+
+def land(key, flight):
+    with _flights_lock:
+        _flights.pop(key, None)
+        flight.event.set()
+        waiters, flight.waiters = flight.waiters, []
+    for future in waiters:
+        future.get_loop().call_soon_threadsafe(wake, future)
+
+
+def follow(flight, render):
+    if flight.event.wait(get_timeout()) and flight.snapshot is not None:
+        count('shared')
+        return restore(flight.snapshot)
+    count('fallbacks')
+    return render()
+
+
+def lead(key, flight, request, render):
+    cache = get_lock_cache()
+    locked = False
+    if cache is not None:
+        locked, flight.snapshot = lock_or_wait(cache, key)
+        if flight.snapshot is not None:
+            return restore(flight.snapshot)
+    session_accessed = pagecache.track_session(request)
+    response = None
+    try:
+        response = render()
+        return response
+    finally:
+        session_was_used = pagecache.session_used(request, session_accessed)
+        if response is not None:
+            flight.snapshot = take_snapshot(request, response, session_was_used)
+        if locked:
+            unlock(cache, key, flight.snapshot)
+
+
+def run(key, request, render):
+    """
+        render() for the first of the identical requests and a copy of its response for the rest; key from get_key()
+    """
+    if key is None:
+        return render()
+    flight, leader = join(key)
+    if not leader:
+        return follow(flight, render)
+    try:
+        return lead(key, flight, request, render)
+    finally:
+        land(key, flight)
+
+
+async def arun(key, request, arender):
+    """
+        the same as run() for the async views; arender is a coroutine function
+    """
+    if key is None:
+        return await arender()
+    flight, leader = join(key)
+    if not leader:
+        if await flight.wait(get_timeout()) and flight.snapshot is not None:
+            count('shared')
+            return restore(flight.snapshot)
+        count('fallbacks')
+        return await arender()
+    try:
+        cache = get_lock_cache()
+        locked = False
+        if cache is not None:
+            locked, flight.snapshot = await sync_to_async(lock_or_wait, thread_sensitive=False)(cache, key)
+            if flight.snapshot is not None:
+                return restore(flight.snapshot)
+        session_accessed = pagecache.track_session(request)
+        response = None
+        try:
+            response = await arender()
+            return response
+        finally:
+            session_was_used = pagecache.session_used(request, session_accessed)
+            if response is not None:
+                flight.snapshot = take_snapshot(request, response, session_was_used)
+            if locked:
+                await sync_to_async(unlock)(cache, key, flight.snapshot)
+    finally:
+        land(key, flight)
+
+
+def stats():
+    with _flights_lock:
+        return {'in_flight': len(_flights), **_counters}
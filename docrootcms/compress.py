@@ -0,0 +1,185 @@
+# Precompressed copies of the docroot's text assets.  ./manage.py docrootcms compress writes a .gz (and a .br when the
+# optional brotli package is installed: pip install brotli) next to every file with one of the
+# DOCROOT_COMPRESS_EXTENSIONS that is at least DOCROOT_COMPRESS_MIN_SIZE bytes, across a process pool of
+# DOCROOT_COMPRESS_WORKERS.  It is incremental: a copy newer than its source is left alone, and a file that doesn't
+# compress well is listed in .docrootcms-compress.json in the docroot with its modification time and size and is only
+# tried again once it changes.  Run it on every deploy.
+# views.static (see assets) sends the smallest copy the client accepts with Content-Encoding and Vary: Accept-Encoding
+# as long as it is newer than the source; a stale copy is ignored until the next run.
+import os
+import time
+import gzip
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+log = logging.getLogger("docrootcms.compress")
+
+# content coding and file suffix in the order we prefer them
+BROTLI = 'br'
+GZIP = 'gzip'
+SUFFIXES = {BROTLI: '.br', GZIP: '.gz'}
+DEFAULT_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.xml', '.txt', '.csv', '.html', '.htm', '.ico',
+                      '.ttf', '.otf', '.eot', '.wasm')
+# a copy that doesn't save at least this fraction of the source isn't worth sending
+MIN_SAVING = 0.05
+MANIFEST_NAME = '.docrootcms-compress.json'
+MANIFEST_VERSION = 1
+
+
+def get_extensions():
+    return tuple(getattr(settings, 'DOCROOT_COMPRESS_EXTENSIONS', DEFAULT_EXTENSIONS))
+
+
+def is_compressible(file_name):
+    return file_name.lower().endswith(get_extensions())
+
+
+def get_encodings():
+    """
+        the content codings we can produce here, preferred first
+    """
+    try:
+        import brotli  # noqa: F401
+        return BROTLI, GZIP
+    except ImportError:
+        return GZIP,
+
+
+def encode(data, encoding):
+    if encoding == BROTLI:
+        import brotli
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# yields (file_name, error) for the compressible files; error is set for a file we can't stat (a broken symlink)
+def find_files(docroot_dir, min_size):
+    for root, dirs, names in os.walk(docroot_dir, followlinks=True):
+        dirs[:] = [d for d in dirs if d != '__pycache__']
+        for name in sorted(names):
+            file_name = os.path.join(root, name)
+            if not is_compressible(name) or (root == docroot_dir and name == MANIFEST_NAME):
+                continue
+            try:
+                if os.path.getsize(file_name) >= min_size:
+                    yield file_name, None
+            except OSError as ex:
+                yield file_name, f"{ex.__class__.__name__}: {ex}"
+
+
+def load_manifest(docroot_dir):
+    try:
+        with open(os.path.join(docroot_dir, MANIFEST_NAME), 'r', encoding='utf-8') as fp:
+            manifest = json.load(fp)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'incompressible': {}}
+
+
+# runs in the pool; returns (file_name, written, size, compressed sizes, incompressible, error) for the copies that were
+#   out of date.  incompressible is the manifest entry for the encodings not worth keeping (None if there are none);
+#   skipped is the previous entry, honoured while the source has the same modification time and size
+def compress_file(file_name, encodings, skipped=None):
+    try:
+        stat = os.stat(file_name)
+        source_mtime = stat.st_mtime_ns
+        incompressible = []
+        if skipped and (skipped['mtime_ns'], skipped['size']) == (source_mtime, stat.st_size):
+            incompressible = [encoding for encoding in skipped['encodings'] if encoding in encodings]
+        pending = []
+        for encoding in encodings:
+            if encoding in incompressible:
+                continue
+            try:
+                if os.stat(file_name + SUFFIXES[encoding]).st_mtime_ns >= source_mtime:
+                    continue
+            except FileNotFoundError:
+                pass
+            pending.append(encoding)
+        if not pending:
+            return file_name, [], 0, {}, incompressible_entry(stat, incompressible), None
+        with open(file_name, 'rb') as fp:
+            data = fp.read()
+        written = []
+        sizes = {}
+        for encoding in pending:
+            out_file = file_name + SUFFIXES[encoding]
+            compressed = encode(data, encoding)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                # incompressible (already compressed fonts etc.); make sure no old copy is served
+                if os.path.exists(out_file):
+                    os.remove(out_file)
+                incompressible.append(encoding)
+                continue
+            tmp_file = f"{out_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as fp:
+                fp.write(compressed)
+            os.replace(tmp_file, out_file)
+            written.append(encoding)
+            sizes[encoding] = len(compressed)
+        return file_name, written, len(data), sizes, incompressible_entry(stat, incompressible), None
+    except Exception as ex:
+        return file_name, [], 0, {}, None, f"{ex.__class__.__name__}: {ex}"
+
+
+def incompressible_entry(stat, encodings):
+    if not encodings:
+        return None
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'encodings': sorted(encodings)}
+
+
+def compress(docroot_dir=None, workers=None, stdout=None):
+    """
+        write the out of date .br/.gz copies of the docroot's compressible files; returns a summary dict
+    """
+    docroot_dir = os.path.abspath(str(docroot_dir or getattr(settings, "DOCROOT_ROOT", "")))
+    workers = workers or getattr(settings, 'DOCROOT_COMPRESS_WORKERS', None) or os.cpu_count()
+    min_size = getattr(settings, 'DOCROOT_COMPRESS_MIN_SIZE', 1024)
+    encodings = get_encodings()
+    start = time.perf_counter()
+    previous = load_manifest(docroot_dir).get('incompressible', {})
+    manifest = {'version': MANIFEST_VERSION, 'incompressible': {}}
+    report = {'encodings': list(encodings), 'files': 0, 'compressed': 0, 'unchanged': 0, 'failed': {},
+              'bytes_in': 0, 'bytes_out': {encoding: 0 for encoding in encodings}}
+    files = []
+    for file_name, error in find_files(docroot_dir, min_size):
+        if error:
+            report['failed'][os.path.relpath(file_name, docroot_dir)] = error
+            if stdout:
+                stdout.write(f"FAILED {os.path.relpath(file_name, docroot_dir)}: {error}")
+        else:
+            files.append(file_name)
+    report['files'] = len(files) + len(report['failed'])
+    if files:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(compress_file, file_name, encodings,
+                                   previous.get(os.path.relpath(file_name, docroot_dir))) for file_name in files]
+            for future in futures:
+                file_name, written, size, sizes, incompressible, error = future.result()
+                rel = os.path.relpath(file_name, docroot_dir)
+                if incompressible:
+                    manifest['incompressible'][rel] = incompressible
+                if error:
+                    report['failed'][rel] = error
+                elif not size:
+                    report['unchanged'] += 1
+                    continue
+                else:
+                    report['compressed'] += 1
+                    report['bytes_in'] += size
+                    for encoding, compressed in sizes.items():
+                        report['bytes_out'][encoding] += compressed
+                if stdout:
+                    detail = error or ', '.join(f"{encoding} {sizes[encoding] * 100 // size}%" for encoding in written)
+                    stdout.write(f"{'FAILED' if error else 'compressed'} {rel}: {detail or 'incompressible'}")
+    if manifest['incompressible'] or previous:
+        with open(os.path.join(docroot_dir, MANIFEST_NAME), 'w', encoding='utf-8') as fp:
+            json.dump(manifest, fp, indent=2, sort_keys=True)
+    report['incompressible'] = len(manifest['incompressible'])
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
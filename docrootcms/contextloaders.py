@@ -0,0 +1,72 @@
+# Runs the independent parts of a page context at the same time.  A data file can declare
+#
+#   loaders = {
+#       'products': lambda request: list(Product.objects.filter(active=True)),
+#       'news': load_news,                          # def load_news(request) or async def load_news(request)
+#   }
+#
+# instead of (or next to) get_context(); every loader is called with the request and its result is added to the
+# template context under its key, so the page takes as long as the slowest loader instead of the sum of them.
+# Under WSGI the loaders run on a shared pool of DOCROOT_LOADER_WORKERS threads; under ASGI async loaders run as
+# tasks on the event loop and sync loaders in threads.  The first loader that raises fails the page like an error in
+# get_context() would.  The loaders share the one request object across threads, so they must only read it: set
+# cookies, messages or session values in get_context() instead.
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync, sync_to_async, iscoroutinefunction
+from django.conf import settings
+from django.db import close_old_connections
+
+log = logging.getLogger("docrootcms.contextloaders")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(settings, 'DOCROOT_LOADER_WORKERS', 8)
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='docrootcms-loader')
+    return _pool
+
+
+# runs one loader in a pool thread; no request cycle ends there, so this closes the thread's broken or expired
+# database connections the way request_finished does and keeps the rest for the next loader (CONN_MAX_AGE)
+def call_loader(loader, request):
+    try:
+        if iscoroutinefunction(loader):
+            return async_to_sync(loader)(request)
+        return loader(request)
+    finally:
+        close_old_connections()
+
+
+def run(request, loaders):
+    """
+        call every loader concurrently and return {key: result}
+    """
+    if len(loaders) == 1:
+        key, loader = next(iter(loaders.items()))
+        return {key: async_to_sync(loader)(request) if iscoroutinefunction(loader) else loader(request)}
+    pool = get_pool()
+    futures = {key: pool.submit(call_loader, loader, request) for key, loader in loaders.items()}
+    return {key: future.result() for key, future in futures.items()}
+
+
+async def arun(request, loaders):
+    """
+        the same as run() for the async views
+    """
+    async def call(loader):
+        if iscoroutinefunction(loader):
+            return await loader(request)
+        # thread_sensitive=False so sync loaders don't queue up behind each other on the one sync thread
+        return await sync_to_async(call_loader, thread_sensitive=False)(loader, request)
+
+    results = await asyncio.gather(*(call(loader) for loader in loaders.values()))
+    return dict(zip(loaders.keys(), results))
@@ -0,0 +1,255 @@
+# Helpers for docroot .data.py files.
+#
+# cached_context keeps what get_context() (or an api GET etc.) returns in the django cache so the expensive queries
+# behind it run once per timeout instead of once per visitor:
+#
+#   from docrootcms.decorators import cached_context
+#
+#   @cached_context(timeout=300, vary_on_query=['page'], vary_on_attributes=['LANGUAGE_CODE'])
+#   def get_context(request):
+#       return {'regions': list(Region.objects.values_list('name', flat=True))}
+#
+# Entries live in a namespace (the page uri of the data file unless one is given) that is flushed with
+# flush_context_cache(namespace) and automatically when the watcher sees the data file change.  Only GET and HEAD
+# requests are cached and a cached value is shared by every visitor with the same vary values, so vary on
+# 'user.pk' (or don't cache) when the result depends on who is asking.
+# stale_while_revalidate=<seconds> keeps serving an expired value that long while the function runs again on a
+# background thread (with an anonymous copy of the request, see revalidate); stale_if_error=<seconds> serves the last
+# good value that long after it expired when the function raises.
+#
+# lazy wraps a context value so it is only computed if the template reads it (once per render):
+#
+#   def get_context(request):
+#       return {'summary': lazy(build_summary, request)}
+import time
+import hashlib
+import logging
+import functools
+from asgiref.sync import async_to_sync, sync_to_async, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import watcher
+from . import revalidate
+from . import dependencies
+
+log = logging.getLogger("docrootcms.decorators")
+
+KEY_PREFIX = 'docrootcms:context'
+VALUE = 'value'
+RESPONSE = 'response'
+# lookup() found nothing it can serve
+MISS = object()
+
+
+def get_cache():
+    return caches[getattr(settings, 'DOCROOT_CONTEXT_CACHE_ALIAS', 'default')]
+
+
+def generation_key(namespace):
+    return f'{KEY_PREFIX}:{namespace}:generation'
+
+
+def flush_context_cache(namespace):
+    """
+        drop every value cached with @cached_context in namespace (a page uri like 'products/index.html' by default)
+    """
+    log.debug(f"flushing cached context for {namespace}")
+    get_cache().set(generation_key(namespace), time.time_ns(), None)
+
+
+# resolves a dotted request attribute like 'user.pk'; missing attributes vary as ''
+def request_attribute(request, name):
+    value = request
+    for part in name.split('.'):
+        value = getattr(value, part, None)
+        if value is None:
+            return ''
+    return value
+
+
+def vary_hash(request, attributes, headers, query):
+    vary = hashlib.md5()
+    vary.update(f"{getattr(request, 'LANGUAGE_CODE', '')}\n".encode('utf-8'))
+    for name in attributes:
+        vary.update(f"{name}={request_attribute(request, name)}\n".encode('utf-8'))
+    for header in headers:
+        vary.update(f"{header}={request.headers.get(header, '')}\n".encode('utf-8'))
+    for name in query:
+        vary.update(f"{name}={request.GET.getlist(name)}\n".encode('utf-8'))
+    return vary.hexdigest()
+
+
+# what we keep for a result: (kind, value, expires); None if it can't be shared
+def to_entry(result, timeout):
+    expires = time.time() + timeout
+    if isinstance(result, HttpResponse):
+        if result.status_code != 200 or result.cookies or result.has_header('Set-Cookie'):
+            return None
+        return RESPONSE, {'content': result.content, 'content_type': result.get('Content-Type'),
+                          'status': result.status_code}, expires
+    if getattr(result, 'streaming', False):
+        return None
+    return VALUE, result, expires
+
+
+# entries stored before stale support are (kind, value) and expire with the cache backend
+def expires(entry):
+    return entry[2] if len(entry) > 2 else float('inf')
+
+
+def from_entry(entry):
+    kind, value = entry[:2]
+    if kind == RESPONSE:
+        return HttpResponse(value['content'], content_type=value['content_type'], status=value['status'])
+    return value
+
+
+def on_change(event):
+    if event.kind == watcher.RESET or event.is_dir:
+        return
+    namespace = dependencies.file_uri(event.file_name)
+    if namespace and event.file_name.endswith('.data.py'):
+        flush_context_cache(namespace)
+
+
+class LazyValue:
+    """
+        a context value computed the first time the template resolves it; django calls callables found in the
+        context so the template sees the result
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.evaluated = False
+        self.value = None
+
+    def __call__(self):
+        if not self.evaluated:
+            self.value = self.func(*self.args, **self.kwargs)
+            self.evaluated = True
+        return self.value
+
+    def __repr__(self):
+        return f"<LazyValue {getattr(self.func, '__name__', self.func)} evaluated={self.evaluated}>"
+
+
+def lazy(func, *args, **kwargs):
+    """
+        defer func(*args, **kwargs) until the template uses the value
+    """
+    return LazyValue(func, *args, **kwargs)
+
+
+def cached_context(timeout=300, vary_on_attributes=(), vary_on_headers=(), vary_on_query=(), namespace=None,
+                   stale_while_revalidate=0, stale_if_error=0):
+    """
+        cache what the decorated data file function returns (a context dict, api content or a plain 200 response)
+        for timeout seconds per namespace and vary values; works on async functions too
+    """
+    # the cache keeps entries past their expiry for as long as a stale copy may be served
+    cache_timeout = timeout + max(stale_while_revalidate, stale_if_error)
+
+    def decorator(func):
+        func_namespace = namespace or dependencies.file_uri(func.__code__.co_filename) or func.__module__
+        if namespace is None:
+            watcher.subscribe(on_change)
+
+        def is_cacheable(request):
+            return request.method in ('GET', 'HEAD')
+
+        def get_key(request, generation):
+            vary = vary_hash(request, vary_on_attributes, vary_on_headers, vary_on_query)
+            return f'{KEY_PREFIX}:{func_namespace}:{generation}:{func.__name__}:{vary}'
+
+        def store(cache, key, result):
+            entry = to_entry(result, timeout)
+            if entry is None:
+                return
+            try:
+                cache.set(key, entry, cache_timeout)
+            except Exception as ex:
+                # unpicklable context values etc.; the page still works, it just isn't cached
+                log.warning(f"unable to cache {func_namespace} {func.__name__}: {ex}")
+
+        # an expired entry that can be served while a background call refreshes it
+        def can_revalidate(entry):
+            return time.time() < expires(entry) + stale_while_revalidate
+
+        # the last good entry in place of a call that raised; MISS if there is none to serve
+        def on_error(key, entry):
+            if entry is None or time.time() >= expires(entry) + stale_if_error:
+                return MISS
+            log.exception(f"serving a stale value for {key}")
+            return from_entry(entry)
+
+        def refresh(cache, key, request, args, kwargs):
+            detached = revalidate.detach_request(request)
+            if iscoroutinefunction(func):
+                result = async_to_sync(func)(detached, *args, **kwargs)
+            else:
+                result = func(detached, *args, **kwargs)
+            store(cache, key, result)
+
+        # returns (result, entry): the cached result if it can be served now (MISS otherwise) and the stale entry
+        def lookup(cache, key, request, args, kwargs):
+            entry = cache.get(key)
+            if entry is None:
+                return MISS, None
+            if time.time() < expires(entry):
+                log.debug(f"cached context hit: {key}")
+                return from_entry(entry), None
+            if can_revalidate(entry):
+                revalidate.submit(key, functools.partial(refresh, cache, key, request, args, kwargs), cache)
+                return from_entry(entry), None
+            return MISS, entry
+
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not is_cacheable(request):
+                    return await func(request, *args, **kwargs)
+                cache = get_cache()
+                key = get_key(request, await cache.aget(generation_key(func_namespace), 0))
+                result, entry = await sync_to_async(lookup, thread_sensitive=False)(cache, key, request, args, kwargs)
+                if result is not MISS:
+                    return result
+                try:
+                    result = await func(request, *args, **kwargs)
+                except Exception:
+                    result = on_error(key, entry)
+                    if result is MISS:
+                        raise
+                    return result
+                entry = to_entry(result, timeout)
+                if entry is not None:
+                    try:
+                        await cache.aset(key, entry, cache_timeout)
+                    except Exception as ex:
+                        log.warning(f"unable to cache {func_namespace} {func.__name__}: {ex}")
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return func(request, *args, **kwargs)
+            cache = get_cache()
+            key = get_key(request, cache.get(generation_key(func_namespace), 0))
+            result, entry = lookup(cache, key, request, args, kwargs)
+            if result is not MISS:
+                return result
+            try:
+                result = func(request, *args, **kwargs)
+            except Exception:
+                result = on_error(key, entry)
+                if result is MISS:
+                    raise
+                return result
+            store(cache, key, result)
+            return result
+        return wrapper
+    return decorator
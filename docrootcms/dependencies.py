@@ -0,0 +1,210 @@
+# Records the extends/include graph of the compiled docroot templates.  A docroot page is really a tree: the .dt file
+# extends page.dt -> _site.dt -> _cms.dt -> _base.dt and includes files from dt.inc, so when we cache rendered or
+# compiled output an edit to _base.dt has to invalidate every page while an edit to one include should only
+# invalidate the pages that use it.  affected_uris(file_name) answers which pages a changed file touches.
+# NOTE: includes with a variable name can't be followed; pages using them depend on every template.
+import os
+import logging
+import threading
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+from . import watcher
+
+log = logging.getLogger("docrootcms.dependencies")
+
+
+# the canonical uri (module name) a docroot .dt or .data.py file is rendered as; None for any other file
+def file_uri(file_name):
+    docroot_dir = os.path.abspath(str(getattr(settings, "DOCROOT_ROOT", ""))) + os.sep
+    file_name = os.path.abspath(str(file_name))
+    if not file_name.startswith(docroot_dir):
+        return None
+    rel = file_name[len(docroot_dir):].replace(os.sep, '/')
+    if rel.endswith('.data.py'):
+        return rel[:-len('.data.py')] + '.html'
+    if rel.endswith('.dt'):
+        return rel[:-len('.dt')] + '.html'
+    return None
+
+
+# returns (names, dynamic) for the templates a compiled template extends or includes; dynamic is True if any of them
+#   is chosen at render time and can't be known up front
+def referenced_templates(template):
+    names = []
+    dynamic = False
+    for node in template.nodelist.get_nodes_by_type(ExtendsNode):
+        if isinstance(node.parent_name.var, str):
+            names.append(node.parent_name.var)
+        else:
+            dynamic = True
+    for node in template.nodelist.get_nodes_by_type(IncludeNode):
+        if isinstance(node.template.var, str):
+            names.append(node.template.var)
+        else:
+            dynamic = True
+    return names, dynamic
+
+
+class DependencyGraph:
+    """
+        file -> the files it directly depends on (the templates it extends/includes and, for pages, its data file)
+    """
+
+    def __init__(self):
+        self.edges = {}
+        self.reverse = {}
+        # files that extend/include something we can't resolve up front
+        self.dynamic = set()
+        # page template file -> uri for the docroot pages we have seen
+        self.pages = {}
+        # file -> template name for the templates loaded through the engine so we can reload them after a change
+        self.names = {}
+        self.lock = threading.RLock()
+
+    def record(self, file_name, template):
+        file_name = os.path.abspath(str(file_name))
+        names, dynamic = referenced_templates(template)
+        dependencies = set()
+        children = []
+        for name in names:
+            try:
+                referenced = template.engine.get_template(name)
+            except TemplateDoesNotExist:
+                log.debug(f"{file_name} references missing template {name}")
+                dynamic = True
+                continue
+            dependency = os.path.abspath(str(referenced.origin.name))
+            dependencies.add(dependency)
+            children.append((dependency, name, referenced))
+        uri = file_uri(file_name)
+        if uri and file_name.endswith('.dt'):
+            # the page output also depends on its data file (whether or not it exists yet)
+            dependencies.add(file_name[:-len('dt')] + 'data.py')
+        with self.lock:
+            self._set_edges(file_name, dependencies)
+            if dynamic:
+                self.dynamic.add(file_name)
+            else:
+                self.dynamic.discard(file_name)
+            if uri and file_name.endswith('.dt'):
+                self.pages[file_name] = uri
+        for dependency, name, referenced in children:
+            self.names.setdefault(dependency, name)
+            if dependency not in self.edges:
+                self.record(dependency, referenced)
+
+    def _set_edges(self, file_name, dependencies):
+        for dependency in self.edges.get(file_name, ()):
+            dependents = self.reverse.get(dependency)
+            if dependents:
+                dependents.discard(file_name)
+        self.edges[file_name] = frozenset(dependencies)
+        for dependency in dependencies:
+            self.reverse.setdefault(dependency, set()).add(file_name)
+
+    # forget what a changed file depends on; it is re-recorded the next time it is needed
+    def discard(self, file_name):
+        file_name = os.path.abspath(str(file_name))
+        with self.lock:
+            self._set_edges(file_name, ())
+            del self.edges[file_name]
+            self.dynamic.discard(file_name)
+
+    def clear(self):
+        with self.lock:
+            self.edges.clear()
+            self.reverse.clear()
+            self.dynamic.clear()
+            self.pages.clear()
+            self.names.clear()
+
+    # re-record an engine loaded template that was discarded after a change
+    def _reload(self, file_name, engine):
+        name = self.names.get(file_name)
+        if name is None or engine is None:
+            return
+        try:
+            self.record(file_name, engine.get_template(name))
+        except TemplateDoesNotExist:
+            pass
+
+    def files_for(self, file_name, template=None):
+        """
+            returns (files, dynamic): every file the output of file_name depends on (including itself) and whether
+            any of them picks templates at render time
+        """
+        file_name = os.path.abspath(str(file_name))
+        if file_name not in self.edges and template is not None:
+            self.record(file_name, template)
+        engine = getattr(template, 'engine', None)
+        files = set()
+        dynamic = False
+        pending = [file_name]
+        while pending:
+            current = pending.pop()
+            if current in files:
+                continue
+            files.add(current)
+            if current not in self.edges and not current.endswith('.py'):
+                self._reload(current, engine)
+            dynamic = dynamic or current in self.dynamic
+            pending.extend(self.edges.get(current, ()))
+        return files, dynamic
+
+    def affected_uris(self, file_name):
+        file_name = os.path.abspath(str(file_name))
+        affected = set()
+        with self.lock:
+            pending = [file_name]
+            seen = set()
+            while pending:
+                current = pending.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                if current in self.pages:
+                    affected.add(self.pages[current])
+                pending.extend(self.reverse.get(current, ()))
+            if not file_name.endswith('.py'):
+                # pages that pick templates at render time may use any template
+                for page, uri in self.pages.items():
+                    if uri not in affected and self.files_for(page)[1]:
+                        affected.add(uri)
+        return affected
+
+
+_graph = DependencyGraph()
+_subscribed = False
+
+
+def get_graph():
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        watcher.subscribe(on_change)
+    return _graph
+
+
+def record(file_name, template):
+    get_graph().record(file_name, template)
+
+
+def files_for(file_name, template=None):
+    return get_graph().files_for(file_name, template)
+
+
+def affected_uris(file_name):
+    """
+        the uris of the docroot pages whose output depends on file_name (a page template, its data file, or any
+        template it extends or includes); only pages this process has compiled are known
+    """
+    return get_graph().affected_uris(file_name)
+
+
+def on_change(event):
+    if event.kind == watcher.RESET or event.is_dir:
+        _graph.clear()
+    else:
+        _graph.discard(event.file_name)
@@ -0,0 +1,202 @@
+# Prerenders the docroot pages to .html files a web server (nginx etc.) can serve directly.  Every .dt page is rendered
+# like a docroot request (cms.Template -> TemplateMeta.render_page_direct) with a synthetic anonymous GET across a
+# process pool, but never from the page cache or through coalescing and admission control.  The export is incremental:
+# a manifest in the output directory remembers the modification times of each page's template, the templates it
+# extends/includes and its data file, and only changed pages are rendered again.  Pages whose data file defines
+# get_context() or loaders depend on the request so they are skipped (and listed in the manifest) unless the data file
+# sets export = True.  Pages whose templates use {% csrf_token %} are skipped as well: the exported file would carry
+# one visitor's token.  A page that fails (a data file that doesn't parse, a worker that died) is listed under failed
+# in the manifest and the rest of the export carries on.
+# Run with ./manage.py docrootcms export <outdir>; DOCROOT_EXPORT_WORKERS sets the pool size.
+import os
+import re
+import ast
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+from . import caches
+from . import dependencies
+
+log = logging.getLogger("docrootcms.export")
+
+MANIFEST_NAME = '.docrootcms-export.json'
+MANIFEST_VERSION = 1
+CSRF_TOKEN_RE = re.compile(r'{%\s*csrf_token\s*%}')
+
+
+# True if the data file makes the page depend on the request; checked without executing the data file
+def is_request_dependent(datafile_name):
+    try:
+        with open(datafile_name, 'r', encoding='utf-8') as fp:
+            tree = ast.parse(fp.read(), datafile_name)
+    except FileNotFoundError:
+        return False
+    dependent = False
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'get_context':
+            dependent = True
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [target.id for target in targets if isinstance(target, ast.Name)]
+            if 'loaders' in names:
+                dependent = True
+            elif 'export' in names and isinstance(node.value, ast.Constant) and node.value.value is True:
+                return False
+    return dependent
+
+
+# True if any of the templates a page is built from renders a csrf token
+def uses_csrf_token(files):
+    for file_name in files:
+        if file_name.endswith('.py'):
+            continue
+        try:
+            with open(file_name, 'r', encoding='utf-8') as fp:
+                if CSRF_TOKEN_RE.search(fp.read()):
+                    return True
+        except (OSError, ValueError):
+            continue
+    return False
+
+
+# modification times of everything the page output depends on; missing files are recorded as None
+def get_signature(file_name, template):
+    files, dynamic = dependencies.files_for(file_name, template)
+    signature = {}
+    for dependency in sorted(files):
+        try:
+            signature[dependency] = os.stat(dependency).st_mtime_ns
+        except FileNotFoundError:
+            signature[dependency] = None
+    return signature, dynamic
+
+
+def find_pages(docroot_dir):
+    for root, dirs, names in os.walk(docroot_dir, followlinks=True):
+        # dt.inc holds the templates pages include; they are not pages themselves
+        dirs[:] = [d for d in dirs if d not in ('__pycache__', 'dt.inc')]
+        for name in sorted(names):
+            if name.endswith('.dt'):
+                yield os.path.join(root, name)
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+# runs in the pool; returns (uri, error)
+def render_page(uri, language_code, out_file):
+    from django.db import close_old_connections
+    from .cms import Template
+    close_old_connections()
+    try:
+        template = Template('/' + uri, language_code)
+        if not template.is_found:
+            return uri, 'template not found'
+        # the page cache may hold a copy rendered before the page changed; nothing invalidates it in this process
+        response = template.render(direct=True)
+        if response is None or response.status_code != 200:
+            return uri, f"status {getattr(response, 'status_code', None)}"
+        content = b''.join(response) if response.streaming else response.content
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        tmp_file = f"{out_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as fp:
+            fp.write(content)
+        os.replace(tmp_file, out_file)
+        return uri, None
+    except Exception as ex:
+        log.exception(f"unable to export {uri}")
+        return uri, f"{ex.__class__.__name__}: {ex}"
+    finally:
+        close_old_connections()
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as fp:
+            manifest = json.load(fp)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'pages': {}}
+
+
+def export(out_dir, language_code=None, workers=None, stdout=None):
+    """
+        render every docroot page into out_dir; returns the manifest written to out_dir/.docrootcms-export.json
+    """
+    from django.db import connections
+    docroot_dir = os.path.abspath(str(getattr(settings, "DOCROOT_ROOT", "")))
+    out_dir = os.path.abspath(str(out_dir))
+    language_code = language_code or getattr(settings, 'LANGUAGE_CODE', None)
+    workers = workers or getattr(settings, 'DOCROOT_EXPORT_WORKERS', None) or os.cpu_count()
+    start = time.perf_counter()
+    previous = load_manifest(out_dir).get('pages', {})
+    manifest = {'version': MANIFEST_VERSION, 'language_code': language_code, 'pages': {}, 'skipped': {},
+                'failed': {}, 'unchanged': []}
+
+    jobs = []
+    for file_name in find_pages(docroot_dir):
+        rel = os.path.relpath(file_name, docroot_dir).replace(os.sep, '/')
+        uri = rel[:-len('.dt')] + '.html'
+        out_file = os.path.join(out_dir, uri)
+        try:
+            if is_request_dependent(file_name[:-len('dt')] + 'data.py'):
+                manifest['skipped'][uri] = ('get_context() or loaders depend on the request; '
+                                            'set export = True to export it')
+                continue
+            template = caches.get_template(file_name, rel)
+            signature, dynamic = get_signature(file_name, template)
+        except Exception as ex:
+            manifest['failed'][uri] = f"{ex.__class__.__name__}: {ex}"
+            continue
+        if uses_csrf_token(signature):
+            manifest['skipped'][uri] = 'renders {% csrf_token %}; a static copy would share one token between visitors'
+            continue
+        entry = {'file': out_file, 'signature': signature}
+        manifest['pages'][uri] = entry
+        old = previous.get(uri)
+        # pages that pick templates at render time can't be tracked so they are always rendered
+        if not dynamic and old and old.get('signature') == signature and os.path.exists(out_file):
+            manifest['unchanged'].append(uri)
+            continue
+        jobs.append((uri, language_code, out_file))
+
+    # forked workers must not share our database connections
+    connections.close_all()
+    rendered = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [(job[0], pool.submit(render_page, *job)) for job in jobs]
+            for uri, future in futures:
+                try:
+                    uri, error = future.result()
+                except Exception as ex:
+                    # the worker died (BrokenProcessPool) or the result couldn't be sent back
+                    error = f"{ex.__class__.__name__}: {ex}"
+                if error:
+                    manifest['failed'][uri] = error
+                    manifest['pages'].pop(uri, None)
+                else:
+                    rendered += 1
+                if stdout:
+                    stdout.write(f"{'FAILED' if error else 'exported'} {uri}{': ' + error if error else ''}")
+
+    # remove the output of pages that no longer exist (or can no longer be exported)
+    for uri, entry in previous.items():
+        if uri not in manifest['pages'] and uri not in manifest['failed'] and os.path.exists(entry['file']):
+            os.remove(entry['file'])
+            if stdout:
+                stdout.write(f"removed {uri}")
+
+    manifest['rendered'] = rendered
+    manifest['seconds'] = round(time.perf_counter() - start, 3)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    return manifest
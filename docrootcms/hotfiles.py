@@ -0,0 +1,233 @@
+# In-process cache of the small docroot static files every page pulls in (favicons, icons, small svgs and css) so
+# serving one is a dict lookup instead of an isfile + open + read.  Files up to DOCROOT_HOT_FILES_MAX_FILE_SIZE bytes
+# are kept in memory (with their precompressed .br/.gz copies, see compress) in a least recently used cache of at most
+# DOCROOT_HOT_FILES_MAX_BYTES per worker process.  An entry is checked against the file's stat at most once every
+# DOCROOT_HOT_FILES_INTERVAL seconds and dropped as soon as the watcher (DOCROOT_WATCH) sees the file change.
+# With DOCROOT_HOT_FILES_MMAP_SIZE set (default 0: off) files up to that many bytes that are too big to keep are mapped
+# with mmap and sent from the mapping instead of with buffered reads, except under a server with a wsgi.file_wrapper
+# (gunicorn, uwsgi) that would send the open file with sendfile() and for single range requests, which do the same.
+# Only files views.static already sent (so after the forbidden extension checks and not offloaded to the web server)
+# are cached.  Enable with DOCROOT_HOT_FILES = True; memory use and hit rate per worker are reported at /_cms/stats/.
+import os
+import mmap
+import time
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+from . import watcher
+from . import compress
+
+log = logging.getLogger("docrootcms.hotfiles")
+
+
+class HotFile:
+    """
+        the contents of one static file and of its fresh precompressed copies
+    """
+
+    def __init__(self, file_name, stat, data, variants, signature):
+        self.file_name = file_name
+        self.stat = stat
+        self.data = data
+        # encoding -> (file_name, stat, data)
+        self.variants = variants
+        # (size, mtime, inode) of the file and its possible copies; None for a copy that doesn't exist
+        self.signature = signature
+        self.checked = time.monotonic()
+        self.size = len(data) + sum(len(variant[2]) for variant in variants.values())
+
+
+# what revalidation compares: the file and every copy that could be sent for it
+def get_signature(file_name):
+    signature = []
+    for name in [file_name] + [file_name + suffix for suffix in compress.SUFFIXES.values()]:
+        try:
+            stat = os.stat(name)
+            signature.append((stat.st_size, stat.st_mtime_ns, stat.st_ino))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def read_file(file_name):
+    with open(file_name, 'rb') as fp:
+        return fp.read()
+
+
+class HotFileCache:
+    """
+        a byte bounded least recently used map of file name to HotFile
+    """
+
+    def __init__(self, max_bytes, max_file_size, interval):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.interval = interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+
+    def get(self, file_name):
+        """
+            the cached HotFile or None; the file is re-checked when the interval has passed
+        """
+        entry = self.entries.get(file_name)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry.checked >= self.interval:
+            self.revalidations += 1
+            if get_signature(file_name) != entry.signature:
+                log.debug(f"{file_name} changed; dropping it")
+                self.discard(file_name)
+                return None
+            entry.checked = now
+        with self.lock:
+            if file_name in self.entries:
+                self.entries.move_to_end(file_name)
+            self.hits += 1
+        return entry
+
+    def load(self, file_name, stat, negotiated):
+        """
+            read file_name (and its fresh precompressed copies when negotiated) into the cache; returns the HotFile
+        """
+        signature = get_signature(file_name)
+        data = read_file(file_name)
+        variants = {}
+        if negotiated:
+            for encoding, suffix in compress.SUFFIXES.items():
+                variant = file_name + suffix
+                try:
+                    variant_stat = os.stat(variant)
+                except FileNotFoundError:
+                    continue
+                if variant_stat.st_mtime_ns >= stat.st_mtime_ns and variant_stat.st_size <= self.max_file_size:
+                    variants[encoding] = (variant, variant_stat, read_file(variant))
+        entry = HotFile(file_name, stat, data, variants, signature)
+        with self.lock:
+            self.misses += 1
+            old = self.entries.pop(file_name, None)
+            if old is not None:
+                self.bytes -= old.size
+            if entry.size > self.max_bytes:
+                return entry
+            self.entries[file_name] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def discard(self, file_name):
+        with self.lock:
+            entry = self.entries.pop(file_name, None)
+            if entry is not None:
+                self.bytes -= entry.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'revalidations': self.revalidations,
+            'mapped': _mapped,
+        }
+
+
+class MappedFile:
+    """
+        a read only file object over an mmap of the whole file; FileResponse reads it without a syscall per block
+    """
+
+    def __init__(self, file_name):
+        global _mapped
+        self.name = file_name
+        with open(file_name, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with _mapped_lock:
+            _mapped += 1
+
+    def read(self, size=-1):
+        return self.map.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.map.seek(offset, whence)
+
+    def tell(self):
+        return self.map.tell()
+
+    def close(self):
+        global _mapped
+        if self.map.closed:
+            return
+        self.map.close()
+        with _mapped_lock:
+            _mapped -= 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+# the mappings open right now (stats()['mapped'])
+_mapped = 0
+_mapped_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        if not getattr(settings, 'DOCROOT_HOT_FILES', False):
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = HotFileCache(getattr(settings, 'DOCROOT_HOT_FILES_MAX_BYTES', 32 * 1024 * 1024),
+                                      getattr(settings, 'DOCROOT_HOT_FILES_MAX_FILE_SIZE', 64 * 1024),
+                                      getattr(settings, 'DOCROOT_HOT_FILES_INTERVAL', 2.0))
+                watcher.subscribe(on_change)
+    return _cache
+
+
+def open_file(file_name, size, mappable=True):
+    """
+        a file object to send file_name from; mapped when hot files and mmap are on and it is a medium sized file
+    """
+    if mappable and getattr(settings, 'DOCROOT_HOT_FILES', False):
+        max_file_size = getattr(settings, 'DOCROOT_HOT_FILES_MAX_FILE_SIZE', 64 * 1024)
+        if max_file_size < size <= getattr(settings, 'DOCROOT_HOT_FILES_MMAP_SIZE', 0):
+            return MappedFile(file_name)
+    return open(file_name, 'rb')
+
+
+def on_change(event):
+    if _cache is None:
+        return
+    if event.kind == watcher.RESET or event.is_dir:
+        _cache.clear()
+        return
+    _cache.discard(event.file_name)
+    for suffix in compress.SUFFIXES.values():
+        # a new or changed precompressed copy changes what its source is sent as
+        if event.file_name.endswith(suffix):
+            _cache.discard(event.file_name[:-len(suffix)])
+
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache else None
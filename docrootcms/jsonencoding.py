@@ -0,0 +1,152 @@
+# Serializes what a .data.py api method returns when it isn't a response.  Dicts, lists and tuples are encoded with
+# the DOCROOT_JSON_ENCODER:
+#   None      - orjson when it is installed, otherwise the standard library json module
+#   'json'    - the standard library json module with django's DjangoJSONEncoder
+#   'orjson'  - orjson (pip install orjson); falls back to DjangoJSONEncoder for the types it doesn't know
+#   '<dotted path>' - any callable(obj) returning str or bytes
+# Generators and other iterators are streamed in constant memory, either as a json array or as newline delimited json
+# (one document per line).  The client picks ndjson with Accept: application/x-ndjson; otherwise the data file's
+# stream_format = 'json' | 'ndjson' decides (json by default):
+#
+#   stream_format = 'ndjson'
+#
+#   def GET(request):
+#       return ({'id': row.id, 'name': row.name} for row in Product.objects.iterator())
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+log = logging.getLogger("docrootcms.jsonencoding")
+
+JSON = 'json'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {JSON: 'application/json', NDJSON: 'application/x-ndjson'}
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/jsonlines')
+
+_dumps = None
+_dumps_lock = threading.Lock()
+
+
+def json_dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_dumps():
+    import orjson
+    default = DjangoJSONEncoder().default
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return dumps
+
+
+def create_dumps(name):
+    if name == JSON:
+        return json_dumps
+    if name == 'orjson':
+        return orjson_dumps()
+    if name:
+        custom = import_string(name)
+
+        def dumps(obj):
+            data = custom(obj)
+            return data.encode('utf-8') if isinstance(data, str) else data
+        return dumps
+    try:
+        return orjson_dumps()
+    except ImportError:
+        return json_dumps
+
+
+def get_dumps():
+    """
+        the configured encoder; a callable(obj) returning bytes
+    """
+    global _dumps
+    if _dumps is None:
+        with _dumps_lock:
+            if _dumps is None:
+                _dumps = create_dumps(getattr(settings, 'DOCROOT_JSON_ENCODER', None))
+    return _dumps
+
+
+def dumps(obj):
+    return get_dumps()(obj)
+
+
+def is_document(content):
+    return isinstance(content, (dict, list, tuple))
+
+
+def is_stream(content):
+    return hasattr(content, '__next__') or hasattr(content, '__anext__')
+
+
+# json or ndjson for a streamed result
+def stream_format(request, data):
+    accept = request.headers.get('Accept', '')
+    if any(content_type in accept for content_type in NDJSON_TYPES):
+        return NDJSON
+    return getattr(data, 'stream_format', JSON)
+
+
+class StreamEncoder:
+    """
+        encodes the items of a streamed result into chunks of about chunk_size bytes
+    """
+
+    def __init__(self, format_name, chunk_size):
+        self.format_name = format_name
+        self.chunk_size = chunk_size
+        self.encode = get_dumps()
+        self.buffer = [b'['] if format_name == JSON else []
+        self.size = 0
+        self.first = True
+
+    # returns a chunk when one is full, otherwise None
+    def add(self, item):
+        data = self.encode(item)
+        if self.format_name == JSON:
+            if not self.first:
+                self.buffer.append(b',')
+            self.first = False
+        else:
+            data += b'\n'
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size < self.chunk_size:
+            return None
+        chunk = b''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        return chunk
+
+    def finish(self):
+        if self.format_name == JSON:
+            self.buffer.append(b']')
+        return b''.join(self.buffer)
+
+
+def iter_encoded(items, format_name, chunk_size):
+    encoder = StreamEncoder(format_name, chunk_size)
+    for item in items:
+        chunk = encoder.add(item)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
+
+
+async def aiter_encoded(items, format_name, chunk_size):
+    encoder = StreamEncoder(format_name, chunk_size)
+    async for item in items:
+        chunk = encoder.add(item)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
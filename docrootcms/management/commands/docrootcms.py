@@ -1,12 +1,21 @@
 from django.core.management.base import BaseCommand
+from django.conf import settings
 from argparse import RawTextHelpFormatter
 import os
+import time
 import shutil
 import pathlib
 from datetime import datetime
 # from distutils.sysconfig import get_python_lib
 import site
 
+import docrootcms
+from docrootcms import routes
+from docrootcms import export
+from docrootcms import compress
+from docrootcms import caches
+from docrootcms import templatevars
+
 
 class Command(BaseCommand):
     help = """
@@ -17,6 +26,11 @@ class Command(BaseCommand):
     example: ./manage.py docrootcms update
     example: ./manage.py docrootcms develop
     example: ./manage.py docrootcms debug
+    example: ./manage.py docrootcms index
+    example: ./manage.py docrootcms warm
+    example: ./manage.py docrootcms export /var/www/example.com
+    example: ./manage.py docrootcms vars products/index.dt
+    example: ./manage.py docrootcms compress
 
     options
     --------
@@ -25,6 +39,12 @@ class Command(BaseCommand):
     test - creates new version of files that would be changed instead of changing them
     develop - copies the docroot-cms module in the virtual environment to local project for development
     debug - prints various library directories
+    index - scans DOCROOT_ROOT and writes the route index to DOCROOT_ROUTE_INDEX_FILE for the workers to load
+    warm - compiles every docroot template and data file and reports the time taken and any failures per file
+    export <outdir> - prerenders the docroot pages to .html files in outdir (only pages changed since the last export)
+    vars <page.dt> - lists the context keys a docroot template (with the templates it extends/includes) reads
+    compress - writes .gz (and .br with brotli installed) copies of the docroot css, js etc. that changed since the
+               last run
     """
     testing = False
 
@@ -239,6 +259,66 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f'Successfully copied {module_path} to {local_path}'))
             return success_instructions
 
+    def index(self):
+        # rebuild the route index and persist it so each worker can load it instead of walking the docroot itself
+        index_file = getattr(settings, 'DOCROOT_ROUTE_INDEX_FILE', None)
+        if not index_file:
+            self.stderr.write(self.style.ERROR('DOCROOT_ROUTE_INDEX_FILE is not set; nowhere to write the index!'))
+            return 'Set DOCROOT_ROUTE_INDEX_FILE in docroot/settings.py and try again.'
+        start = time.perf_counter()
+        index = routes.build_index(index_file, rescan=True)
+        elapsed = time.perf_counter() - start
+        return f'Indexed {len(index)} files from {index.docroot_dir} into {index_file} in {elapsed:.2f}s'
+
+    def warm(self):
+        # NOTE: the caches only live as long as this command; use docrootcms.warm() in a server hook to share them
+        report = docrootcms.warm()
+        for result in report.results:
+            line = f'{result.seconds * 1000:8.1f}ms  {result.kind:<8} {result.file_name}'
+            if result.error:
+                self.stderr.write(self.style.ERROR(f'{line}  {result.error}'))
+            else:
+                self.stdout.write(line)
+        return str(report)
+
+    def export(self, arguments):
+        position = arguments.index('export')
+        if len(arguments) <= position + 1:
+            self.stderr.write(self.style.ERROR('export requires an output directory!'))
+            return 'usage: ./manage.py docrootcms export <outdir>'
+        out_dir = arguments[position + 1]
+        manifest = export.export(out_dir, stdout=self.stdout)
+        for uri, reason in sorted(manifest['skipped'].items()):
+            self.stdout.write(self.style.WARNING(f'skipped {uri}: {reason}'))
+        for uri, error in sorted(manifest['failed'].items()):
+            self.stderr.write(self.style.ERROR(f'failed {uri}: {error}'))
+        return (f"Exported {manifest['rendered']} pages to {out_dir} in {manifest['seconds']}s "
+                f"({len(manifest['unchanged'])} unchanged, {len(manifest['skipped'])} skipped, "
+                f"{len(manifest['failed'])} failed)")
+
+    def vars(self, arguments):
+        position = arguments.index('vars')
+        if len(arguments) <= position + 1:
+            self.stderr.write(self.style.ERROR('vars requires a docroot template!'))
+            return 'usage: ./manage.py docrootcms vars <page.dt>'
+        template_name = arguments[position + 1].lstrip('/')
+        file_name = os.path.join(str(getattr(settings, "DOCROOT_ROOT", "")), template_name)
+        report = templatevars.analyze(caches.get_template(file_name, template_name))
+        self.stdout.write(f"templates: {', '.join((template_name,) + report.templates)}")
+        if not report.complete:
+            self.stdout.write(self.style.WARNING('the templates can read other keys as well (see the debug log)'))
+        return '\n'.join(sorted(report.keys))
+
+    def compress(self):
+        report = compress.compress(stdout=self.stdout)
+        for file_name, error in sorted(report['failed'].items()):
+            self.stderr.write(self.style.ERROR(f'failed {file_name}: {error}'))
+        sizes = ', '.join(f"{encoding} {size * 100 // report['bytes_in'] if report['bytes_in'] else 0}%"
+                          for encoding, size in report['bytes_out'].items())
+        return (f"Compressed {report['compressed']} of {report['files']} files in {report['seconds']}s "
+                f"({report['unchanged']} unchanged, {report['incompressible']} incompressible, "
+                f"{len(report['failed'])} failed; {sizes} of the original size)")
+
     def handle(self, *args, **options):
         if "update" in options['option']:
             try:
@@ -256,6 +336,16 @@ class Command(BaseCommand):
                 self.stderr.write(self.style.ERROR(f'{nfe}'))
         elif "develop" in options['option']:
             self.stdout.write(self.style.WARNING(f'{self.develop()}'))
+        elif "index" in options['option']:
+            self.stdout.write(self.style.SUCCESS(f'{self.index()}'))
+        elif "warm" in options['option']:
+            self.stdout.write(self.style.SUCCESS(f'{self.warm()}'))
+        elif "export" in options['option']:
+            self.stdout.write(self.style.SUCCESS(f"{self.export(options['option'])}"))
+        elif "vars" in options['option']:
+            self.stdout.write(self.style.SUCCESS(f"{self.vars(options['option'])}"))
+        elif "compress" in options['option']:
+            self.stdout.write(self.style.SUCCESS(f"{self.compress()}"))
         elif "debug" in options['option']:
             self.stdout.write(f'distutils -> {self.get_module_path()}')
             self.stdout.write(f'site packages -> {site.getsitepackages()}')
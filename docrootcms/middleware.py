@@ -6,52 +6,164 @@
 # based on a naming convention (<dev_page_name>.data.py).  Templates must be named with the .dt extension
 # so we and production web servers know what files to send to us to dynamically build.
 import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 from . import views as cms_views
+from . import misses
+from . import routes
+from . import watcher
 # from django.http import Http404
-# from django.conf import settings
+from django.conf import settings
 # from django.core.exceptions import MiddlewareNotUsed
 
 log = logging.getLogger("docroot.middleware")
 
 
+# middleware that has to run before we can serve a docroot page in pre-dispatch mode so sessions, csrf cookies,
+#   users and the active language behave exactly as they do for a normal view
+REQUIRED_BEFORE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.locale.LocaleMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+
+
 # testing the new way of calling middleware
 # make get_response=None to test for < 1.9 (see above)
+# runs natively under both WSGI and ASGI (django picks the mode from the rest of the middleware stack)
 class DocrootFallbackMiddleware(object):
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # DOCROOT_PRE_DISPATCH: look for a docroot file before running the rest of the stack instead of waiting
+        #   for django to produce a 404; docroot files win over url patterns with the same path in this mode
+        self.pre_dispatch = getattr(settings, 'DOCROOT_PRE_DISPATCH', False)
+        if self.pre_dispatch:
+            self.check_middleware_order()
         log.info("DocrootFallbackMiddleware initialized...")
         # todo: use this example and import to disable our middleware based on a settings entry
         # raise MiddlewareNotUsed('DISABLE_MIDDLEWARE is set')
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         # code to be executed before the view/next middleware is called
+        # make sure this worker is following docroot changes (no-op unless DOCROOT_WATCH is set)
+        watcher.ensure_started()
+        if self.pre_dispatch:
+            log.debug("DocrootFallbackMiddleware pre-dispatching: " + request.path_info)
+            result = self.dispatch(request)
+            if result:
+                return result
         response = self.get_response(request)
         # code to be executed after the view/next middleware is called
         log.debug("DocrootFallbackMiddleware called: " + request.path_info)
-        if response.status_code == 404:
+        # when pre-dispatching we already know there is no docroot file for this request
+        if response.status_code == 404 and not self.pre_dispatch:
             log.debug("got a response of 404 would have done something for: " + request.path_info)
             # will be called by apache for all 404's;
-            # first attempt to load a static file (should we skip this if nginx arleady processed? DEBUG=FALSE?
+            result = self.dispatch(request)
+            if result:
+                response = result
+
+        return response
+
+    async def __acall__(self, request):
+        watcher.ensure_started()
+        if self.pre_dispatch:
+            log.debug("DocrootFallbackMiddleware pre-dispatching: " + request.path_info)
+            result = await self.adispatch(request)
+            if result:
+                return result
+        response = await self.get_response(request)
+        log.debug("DocrootFallbackMiddleware called: " + request.path_info)
+        if response.status_code == 404 and not self.pre_dispatch:
+            result = await self.adispatch(request)
+            if result:
+                response = result
+        return response
+
+    @staticmethod
+    def dispatch(request):
+        # garbage urls (scanners etc.) we have already looked for cost a single lookup
+        miss_cache = misses.get_cache()
+        if miss_cache:
+            miss_key = miss_cache.key(request)
+            if miss_cache.is_miss(miss_key):
+                log.debug("known docroot miss: " + request.path_info)
+                return None
+
+        # with the route index we know which of the views below can answer before calling any of them
+        kinds = routes.request_kinds(request)
+
+        # first attempt to load a static file (should we skip this if nginx arleady processed? DEBUG=FALSE?
 
-            # attempt to load/render as static file
+        # attempt to load/render as static file
+        if kinds is None or routes.STATIC in kinds:
             result = cms_views.static(request)
             if result:
                 log.debug("result is a static file...")
-                response = result
+                return result
 
-            # attempt to load as template
-            if not result and request.method=='GET':
-                result = cms_views.page(request)
-                if result:
-                    log.debug("result is not none so returning it...")
-                    response = result
+        # attempt to load as template
+        if request.method == 'GET' and (kinds is None or routes.PAGE in kinds):
+            result = cms_views.page(request)
+            if result:
+                log.debug("result is not none so returning it...")
+                return result
 
-            # attempt to load an api (determined by extension [.json, .xml etc])
-            if not result:
-                result = cms_views.api(request)
-                if result:
-                    log.debug("result is not none so returning it...")
-                    response = result
+        # attempt to load an api (determined by extension [.json, .xml etc])
+        if kinds is None or routes.API in kinds:
+            result = cms_views.api(request)
+            if result:
+                log.debug("result is not none so returning it...")
+                return result
 
-        return response
+        if miss_cache:
+            miss_cache.add(miss_key)
+        return None
+
+    # same as dispatch() using the async views
+    @staticmethod
+    async def adispatch(request):
+        miss_cache = misses.get_cache()
+        if miss_cache:
+            miss_key = miss_cache.key(request)
+            if miss_cache.is_miss(miss_key):
+                log.debug("known docroot miss: " + request.path_info)
+                return None
+        kinds = routes.request_kinds(request)
+        if kinds is None or routes.STATIC in kinds:
+            result = await cms_views.astatic(request)
+            if result:
+                return result
+        if request.method == 'GET' and (kinds is None or routes.PAGE in kinds):
+            result = await cms_views.apage(request)
+            if result:
+                return result
+        if kinds is None or routes.API in kinds:
+            result = await cms_views.aapi(request)
+            if result:
+                return result
+        if miss_cache:
+            miss_cache.add(miss_key)
+        return None
+
+    @staticmethod
+    def check_middleware_order():
+        middleware = list(getattr(settings, 'MIDDLEWARE', []))
+        name = 'docrootcms.middleware.DocrootFallbackMiddleware'
+        if name not in middleware:
+            return
+        position = middleware.index(name)
+        for required in REQUIRED_BEFORE:
+            if required in middleware and middleware.index(required) > position:
+                log.warning(f"DOCROOT_PRE_DISPATCH is set but {required} comes after {name} in MIDDLEWARE; "
+                            f"docroot pages will be served without it")
@@ -0,0 +1,99 @@
+# Bounded LRU cache of requests we already know have no docroot match.  Vulnerability scanners hit us with thousands
+# of /wp-admin/..., .php and .env urls and each one used to walk the whole static -> page -> api fallback chain
+# (including the language stripped retries); with this cache a repeated miss costs a single dict lookup.
+# Enable with DOCROOT_MISS_CACHE_SIZE > 0; entries expire after DOCROOT_MISS_CACHE_TTL seconds and the whole cache
+# is dropped whenever the watcher sees a docroot change.
+import time
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+from . import watcher
+
+log = logging.getLogger("docrootcms.misses")
+
+
+class MissCache:
+    """
+        lru of (path_info, LANGUAGE_CODE, method) keys that produced no docroot response
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(request):
+        return request.path_info, getattr(request, 'LANGUAGE_CODE', None), request.method
+
+    # True if we recently saw this key produce no docroot response
+    def is_miss(self, key):
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True
+                del self.entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# returns the shared miss cache or None if it is disabled
+def get_cache():
+    global _cache
+    if _cache is None:
+        size = getattr(settings, 'DOCROOT_MISS_CACHE_SIZE', 0)
+        if not size:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = MissCache(size, getattr(settings, 'DOCROOT_MISS_CACHE_TTL', 60))
+                watcher.subscribe(on_change)
+    return _cache
+
+
+# any docroot change can turn a miss into a hit so drop everything
+def on_change(event):
+    if _cache is not None:
+        _cache.clear()
+
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache else None
@@ -0,0 +1,239 @@
+# Full page output cache for docroot pages.  A page opts in through module attributes in its data file:
+#
+#   cache_timeout = 300                         # seconds to keep the rendered page
+#   cache_vary_on_headers = ['Accept-Language']  # request headers that change the output
+#   cache_vary_on_query = ['page', 'sort']       # query parameters that change the output (default: all of them)
+#   cache_stale_while_revalidate = 60           # seconds an expired page is still served while it is re-rendered
+#   cache_stale_if_error = 3600                 # seconds an expired page is served when rendering it fails
+#
+# Pages without a get_context() or loaders (no data file or only a static context) are cached automatically for
+# DOCROOT_PAGE_CACHE_TIMEOUT seconds when it is set.  Entries live in the DOCROOT_PAGE_CACHE_ALIAS django cache and
+# are keyed on the language and canonical path.  We never cache for authenticated users, for visitors with pending
+# flash messages (a messages cookie), for requests that used a csrf token, the session or the messages, or for anything
+# but a plain 200 response.
+# Every file a page depends on (its .dt, data file and the templates it extends/includes) has a generation in the
+# cache that is bumped when the watcher sees it change; an entry is only served while none of them has changed.
+# For cache_stale_while_revalidate seconds after it expires (DOCROOT_PAGE_CACHE_STALE_WHILE_REVALIDATE by default) a
+# page is still served as is while a background thread renders it again (see revalidate).  For cache_stale_if_error
+# seconds (DOCROOT_PAGE_CACHE_STALE_IF_ERROR) the last good copy is served when get_context() or the template raises
+# or the page is over its concurrency limit, even if one of its files changed since.
+import os
+import time
+import hashlib
+import logging
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import HttpResponse
+
+from . import watcher
+from . import dependencies
+
+log = logging.getLogger("docrootcms.pagecache")
+
+KEY_PREFIX = 'docrootcms:page'
+# bumped to invalidate every cached page at once
+GLOBAL_GENERATION_KEY = f'{KEY_PREFIX}:generation'
+# bumped for any template change; used by pages that pick their templates at render time
+ANY_TEMPLATE_GENERATION_KEY = f'{KEY_PREFIX}:generation:any-template'
+
+Policy = namedtuple('Policy', ['timeout', 'headers', 'query', 'stale_while_revalidate', 'stale_if_error'],
+                    defaults=(0, 0))
+
+
+def get_cache():
+    return caches[getattr(settings, 'DOCROOT_PAGE_CACHE_ALIAS', 'default')]
+
+
+# returns the caching Policy for a page from its data module (None if the page is not cacheable)
+def get_policy(data):
+    headers = getattr(data, 'cache_vary_on_headers', None) or []
+    query = getattr(data, 'cache_vary_on_query', None)
+    timeout = getattr(data, 'cache_timeout', None)
+    if timeout is None and not hasattr(data, 'get_context') and not getattr(data, 'loaders', None):
+        # nothing in the output depends on the request beyond what the template itself reads
+        timeout = getattr(settings, 'DOCROOT_PAGE_CACHE_TIMEOUT', None)
+    if not timeout:
+        return None
+    stale_while_revalidate = getattr(data, 'cache_stale_while_revalidate', None)
+    if stale_while_revalidate is None:
+        stale_while_revalidate = getattr(settings, 'DOCROOT_PAGE_CACHE_STALE_WHILE_REVALIDATE', 0)
+    stale_if_error = getattr(data, 'cache_stale_if_error', None)
+    if stale_if_error is None:
+        stale_if_error = getattr(settings, 'DOCROOT_PAGE_CACHE_STALE_IF_ERROR', 0)
+    return Policy(timeout, list(headers), None if query is None else list(query), stale_while_revalidate or 0,
+                  stale_if_error or 0)
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    # the page would show (or have to keep) this visitor's flash messages
+    if CookieStorage.cookie_name in request.COOKIES:
+        return False
+    return True
+
+
+# the auth middleware reads the session on every request so we only care whether the page itself touches it;
+#   clears the accessed flag and returns the previous value to hand to session_used() after rendering
+def track_session(request):
+    session = getattr(request, 'session', None)
+    if session is None:
+        return None
+    accessed = session.accessed
+    session.accessed = False
+    return accessed
+
+
+# True if the page read the session since track_session(); restores the flag for the session middleware
+def session_used(request, accessed):
+    session = getattr(request, 'session', None)
+    if session is None:
+        return False
+    used = session.accessed
+    session.accessed = bool(accessed) or used
+    return used
+
+
+# True if the page read or added flash messages; the cookie storage sets its cookie after we store the page
+def messages_used(request):
+    storage = getattr(request, '_messages', None)
+    if storage is None:
+        return False
+    return storage.used or storage.added_new or bool(getattr(storage, '_loaded_data', None))
+
+
+# True if rendering the page made it specific to this visitor
+def is_private(request, response, session_was_used=False):
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or request.META.get('CSRF_COOKIE_USED'):
+        return True
+    if session_was_used or messages_used(request):
+        return True
+    return bool(response.cookies) or response.has_header('Set-Cookie')
+
+
+def generation_key(file_name):
+    return f"{KEY_PREFIX}:generation:{hashlib.md5(os.path.abspath(file_name).encode('utf-8')).hexdigest()}"
+
+
+# the generation keys a page entry is validated against
+def dependency_keys(template):
+    files, dynamic = dependencies.files_for(template.origin.name, template)
+    keys = [GLOBAL_GENERATION_KEY] + sorted(generation_key(file_name) for file_name in files)
+    if dynamic:
+        keys.append(ANY_TEMPLATE_GENERATION_KEY)
+    return keys
+
+
+def get_key(request, uri, policy):
+    language = getattr(request, 'LANGUAGE_CODE', None) or getattr(settings, 'LANGUAGE_CODE', '')
+    vary = hashlib.md5()
+    for header in policy.headers:
+        vary.update(f"{header}={request.headers.get(header, '')}\n".encode('utf-8'))
+    if policy.query is None:
+        vary.update(request.META.get('QUERY_STRING', '').encode('utf-8'))
+    else:
+        for name in policy.query:
+            vary.update(f"{name}={request.GET.getlist(name)}\n".encode('utf-8'))
+    return f'{KEY_PREFIX}:{language}:{uri}:{vary.hexdigest()}'
+
+
+# entries stored before stale support have no expiry of their own; the cache backend expires them
+def expires(entry):
+    return entry.get('expires', float('inf'))
+
+
+def is_fresh(entry, generations):
+    return entry['generations'] == generations and time.time() < expires(entry)
+
+
+# True if an expired entry may be served while it is rendered again in the background
+def can_revalidate(entry, policy, generations):
+    return entry['generations'] == generations and time.time() < expires(entry) + policy.stale_while_revalidate
+
+
+# True if the entry may stand in for a page that failed to render
+def can_serve_on_error(entry, policy):
+    return time.time() < expires(entry) + policy.stale_if_error
+
+
+def to_response(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'], status=entry['status'])
+
+
+# returns (response, generations, stale); response is None on a miss and generations are handed to store() so a
+#   change made while we render is never hidden behind the new entry.  stale is the expired or outdated entry on a
+#   miss (if the cache still has one) for can_revalidate() and can_serve_on_error()
+def get(request, uri, policy, keys):
+    cache = get_cache()
+    key = get_key(request, uri, policy)
+    values = cache.get_many([key] + keys)
+    generations = tuple(values.get(generation, 0) for generation in keys)
+    entry = values.get(key)
+    if entry is None or not is_fresh(entry, generations):
+        log.debug(f"page cache miss: {key}")
+        return None, generations, entry
+    log.debug(f"page cache hit: {key}")
+    return to_response(entry), generations, None
+
+
+def store(request, uri, policy, response, generations, session_was_used=False):
+    if not is_cacheable_request(request) or response.status_code != 200 or response.streaming:
+        return False
+    if is_private(request, response, session_was_used):
+        log.debug(f"not caching {uri}; the response is specific to this visitor")
+        return False
+    entry = {
+        'content': response.content,
+        'content_type': response.get('Content-Type'),
+        'status': response.status_code,
+        'generations': generations,
+        'stored': time.time(),
+        'expires': time.time() + policy.timeout,
+    }
+    # kept past its expiry for as long as a stale copy may be served
+    timeout = policy.timeout + max(policy.stale_while_revalidate, policy.stale_if_error)
+    get_cache().set(get_key(request, uri, policy), entry, timeout)
+    return True
+
+
+# the files a page can pick as a template at render time: .dt files and anything in a dt.inc directory
+def is_template_file(file_name):
+    return file_name.endswith('.dt') or f'{os.sep}dt.inc{os.sep}' in file_name
+
+
+def invalidate(file_name):
+    log.debug(f"invalidating cached pages that depend on {file_name}")
+    keys = {generation_key(file_name): time.time_ns()}
+    if is_template_file(file_name):
+        keys[ANY_TEMPLATE_GENERATION_KEY] = time.time_ns()
+    get_cache().set_many(keys, None)
+
+
+def invalidate_all():
+    log.debug("invalidating all cached pages")
+    get_cache().set(GLOBAL_GENERATION_KEY, time.time_ns(), None)
+
+
+def on_change(event):
+    if event.kind == watcher.RESET or event.is_dir:
+        # we lost track of what changed so every page may be affected
+        invalidate_all()
+        return
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"{event.file_name} changed; affects {dependencies.affected_uris(event.file_name)}")
+    invalidate(event.file_name)
+
+
+_subscribed = False
+
+
+def subscribe():
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        watcher.subscribe(on_change)
@@ -0,0 +1,118 @@
+# Warms the process level caches before workers fork so the compiled templates are shared copy-on-write instead of
+# every worker paying to parse them during its first few hundred requests.
+# Call docrootcms.warm() from a gunicorn server hook (with preload_app = True) or run ./manage.py docrootcms warm:
+#
+#   # gunicorn.conf.py
+#   preload_app = True
+#
+#   def on_starting(server):
+#       import django
+#       django.setup()
+#       import docrootcms
+#       docrootcms.warm()
+#
+import os
+import time
+import logging
+import py_compile
+from collections import namedtuple
+from django.conf import settings
+
+from . import routes
+from . import caches
+from . import dependencies
+
+log = logging.getLogger("docrootcms.preload")
+
+TEMPLATE = 'template'
+DATA = 'data'
+INDEX = 'index'
+
+FileResult = namedtuple('FileResult', ['file_name', 'kind', 'seconds', 'error'])
+
+
+class WarmReport:
+    """
+        timing and failures for every file warm() touched
+    """
+
+    def __init__(self):
+        self.results = []
+        self.seconds = 0.0
+
+    def add(self, file_name, kind, seconds, error=None):
+        self.results.append(FileResult(file_name, kind, seconds, error))
+
+    @property
+    def failures(self):
+        return [result for result in self.results if result.error]
+
+    def count(self, kind):
+        return len([result for result in self.results if result.kind == kind])
+
+    def __str__(self):
+        return (f"warmed {self.count(TEMPLATE)} templates and {self.count(DATA)} data files in {self.seconds:.2f}s "
+                f"with {len(self.failures)} failures")
+
+
+# load the extended/included templates through the engine so they end up in django's cached loader
+def warm_references(template, seen):
+    for name in dependencies.referenced_templates(template)[0]:
+        if name in seen:
+            continue
+        seen.add(name)
+        referenced = template.engine.get_template(name)
+        warm_references(referenced, seen)
+
+
+def warm(docroot_dir=None):
+    """
+        walk the docroot compiling every .dt template (and the templates it extends/includes) into the shared caches
+        and loading every .data.py file (or just byte compiling it); returns a WarmReport
+        NOTE: compiled templates are only kept when DOCROOT_TEMPLATE_CACHE is set; otherwise this just validates them
+        and data modules are only executed and kept when DOCROOT_DATA_CACHE is set
+    """
+    docroot_dir = str(docroot_dir or getattr(settings, "DOCROOT_ROOT", ""))
+    report = WarmReport()
+    start = time.perf_counter()
+    if caches.get_template_cache() is None:
+        log.warning("DOCROOT_TEMPLATE_CACHE is not set; templates will be compiled but not kept")
+    data_cache = caches.get_data_cache()
+
+    file_start = time.perf_counter()
+    index = routes.get_index()
+    if index is not None:
+        report.add(docroot_dir, INDEX, time.perf_counter() - file_start)
+
+    seen = set()
+    for root, dirs, names in os.walk(docroot_dir, followlinks=True):
+        dirs[:] = [d for d in dirs if d != '__pycache__']
+        for name in sorted(names):
+            file_name = os.path.join(root, name)
+            if name.endswith('.dt'):
+                kind = TEMPLATE
+            elif name.endswith('.data.py'):
+                kind = DATA
+            else:
+                continue
+            file_start = time.perf_counter()
+            error = None
+            try:
+                if kind == TEMPLATE:
+                    template_name = os.path.relpath(file_name, docroot_dir)
+                    template = caches.get_template(file_name, template_name)
+                    warm_references(template, seen)
+                elif data_cache is not None:
+                    # runs the module level code once before the fork instead of once per worker
+                    data_cache.get(file_name, dependencies.file_uri(file_name) or name)
+                else:
+                    # writes the __pycache__ bytecode the data file loader picks up so no worker compiles it again
+                    py_compile.compile(file_name, doraise=True)
+            except Exception as ex:
+                error = f"{ex.__class__.__name__}: {ex}"
+                log.error(f"unable to warm {file_name}: {error}")
+            report.add(file_name, kind, time.perf_counter() - file_start, error)
+
+    report.seconds = time.perf_counter() - start
+    log.info(str(report))
+    return report
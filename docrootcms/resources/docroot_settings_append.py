@@ -72,6 +72,106 @@ STATIC_FORBIDDEN_FILE_NAMES = ['.htaccess', ]
 #   This is helpful for troubleshooting migrated DjangoCMS pages
 IGNORE_LANGUAGE_PREFIX = True
 # DISABLE_AUTHENTICATION = True
+# Scan the docroot once and answer the static/template/api file checks from memory instead of the file system
+#   NOTE: new files are not seen until the index is rebuilt (restart or ./manage.py docrootcms index) unless
+#   DOCROOT_WATCH is enabled
+DOCROOT_ROUTE_INDEX = False
+# optional file to persist the index to so every worker loads it instead of walking the docroot on startup
+# DOCROOT_ROUTE_INDEX_FILE = pathlib.Path(BASE_DIR, "cache", "docroot_routes.json")
+# Watch the docroot and dt.inc for changes (inotify on linux; 'poll' to force polling) so in memory state stays current
+#   when files are edited or deployed (git pull) while the server is running
+DOCROOT_WATCH = False
+DOCROOT_WATCH_INTERVAL = 1.0
+# Serve docroot files before the rest of the middleware/url resolution runs instead of after django returns a 404
+#   NOTE: docroot files take precedence over url patterns with the same path; the middleware must come after the
+#   session, locale, csrf, auth and messages middleware (the default when appended to MIDDLEWARE above)
+DOCROOT_PRE_DISPATCH = False
+# Remember urls that have no docroot file (scanners etc.) so repeats skip the static/page/api lookups
+#   set the size to something like 10000 to enable; hit/miss counts are reported to staff at /_cms/stats/
+DOCROOT_MISS_CACHE_SIZE = 0
+DOCROOT_MISS_CACHE_TTL = 60
+# Keep compiled .dt templates in memory instead of reading and parsing them on every request
+#   'mtime' checks the file on every hit, 'interval' at most every DOCROOT_TEMPLATE_CACHE_INTERVAL seconds and 'never'
+#   trusts the cache (use with DOCROOT_WATCH in production); None disables it
+#   NOTE: page.dt, _base.dt and dt.inc templates are loaded through the template engine; keep django's cached loader
+#   (the default when DEBUG is off) and the watcher will reset it when they change
+DOCROOT_TEMPLATE_CACHE = None
+DOCROOT_TEMPLATE_CACHE_INTERVAL = 2.0
+# Keep the executed .data.py modules per worker instead of running them on every request; same modes as
+#   DOCROOT_TEMPLATE_CACHE.  Module level code then runs once per worker so get_context() must not modify module
+#   globals.
+DOCROOT_DATA_CACHE = None
+DOCROOT_DATA_CACHE_INTERVAL = 2.0
+# Cache rendered pages in the django cache; pages opt in with cache_timeout (and optionally cache_vary_on_headers and
+#   cache_vary_on_query) in their .data.py.  Pages without a get_context() or loaders are cached for
+#   DOCROOT_PAGE_CACHE_TIMEOUT seconds when it is set.  Never used for logged in users or pages that use csrf tokens,
+#   the session or flash messages.
+DOCROOT_PAGE_CACHE_ALIAS = 'default'
+DOCROOT_PAGE_CACHE_TIMEOUT = None
+# Seconds an expired cached page is still served while a background thread renders it again, and seconds the last good
+#   copy is served when rendering fails; a data file overrides them with cache_stale_while_revalidate and
+#   cache_stale_if_error (@cached_context takes stale_while_revalidate= and stale_if_error= for apis)
+DOCROOT_PAGE_CACHE_STALE_WHILE_REVALIDATE = 0
+DOCROOT_PAGE_CACHE_STALE_IF_ERROR = 0
+# .json apis answer If-None-Match/If-Modified-Since from the etag(request) and last_modified(request) functions of their
+#   .data.py without running the method; without them a 200 GET gets an ETag hashed from the body unless this is False
+DOCROOT_API_ETAGS = True
+# Dicts and lists returned by .data.py api methods are sent as json encoded with orjson when it is installed (None),
+#   'json' (standard library), 'orjson' or a dotted path to a callable(obj) returning str/bytes; generators are
+#   streamed as a json array or ndjson (Accept: application/x-ndjson or stream_format = 'ndjson' in the data file)
+DOCROOT_JSON_ENCODER = None
+# The django cache used by @docrootcms.decorators.cached_context in .data.py files
+DOCROOT_CONTEXT_CACHE_ALIAS = 'default'
+# ./manage.py docrootcms export <outdir> prerenders the docroot pages to static .html files; the number of worker
+#   processes (default: cpu count) and the host name used for the synthetic requests (default: first ALLOWED_HOSTS)
+DOCROOT_EXPORT_WORKERS = None
+DOCROOT_EXPORT_HOST = None
+# ./manage.py docrootcms compress writes .gz (and .br with pip install brotli) copies of the docroot files with these
+#   extensions and at least DOCROOT_COMPRESS_MIN_SIZE bytes; static requests get the copy the client accepts as long
+#   as it is newer than the file unless DOCROOT_PRECOMPRESSED is False
+DOCROOT_PRECOMPRESSED = True
+DOCROOT_COMPRESS_EXTENSIONS = ['.css', '.js', '.mjs', '.json', '.map', '.svg', '.xml', '.txt', '.csv', '.html', '.htm',
+                               '.ico', '.ttf', '.otf', '.eot', '.wasm']
+DOCROOT_COMPRESS_MIN_SIZE = 1024
+DOCROOT_COMPRESS_WORKERS = None
+# Let the web server send docroot static files: 'x-accel-redirect' (nginx; needs an internal location for
+#   DOCROOT_SENDFILE_PREFIX that aliases DOCROOT_ROOT) or 'x-sendfile' (apache mod_xsendfile).  Python still finds the
+#   file and applies STATIC_FORBIDDEN_*.  DOCROOT_SENDFILE_HEADERS = {'.ext': {header: value}} adds headers per
+#   extension; {'.ext': None} keeps sending that extension from python
+DOCROOT_SENDFILE = None
+DOCROOT_SENDFILE_PREFIX = '/_docroot/'
+DOCROOT_SENDFILE_HEADERS = {}
+# Keep small docroot static files (up to DOCROOT_HOT_FILES_MAX_FILE_SIZE bytes) in a least recently used cache of
+#   DOCROOT_HOT_FILES_MAX_BYTES per worker, checked against the file every DOCROOT_HOT_FILES_INTERVAL seconds, and send
+#   larger files up to DOCROOT_HOT_FILES_MMAP_SIZE bytes from an mmap (0: never; servers with a wsgi.file_wrapper such
+#   as gunicorn and uwsgi always get the open file so they can sendfile() it)
+DOCROOT_HOT_FILES = False
+DOCROOT_HOT_FILES_MAX_BYTES = 32 * 1024 * 1024
+DOCROOT_HOT_FILES_MAX_FILE_SIZE = 64 * 1024
+DOCROOT_HOT_FILES_INTERVAL = 2.0
+DOCROOT_HOT_FILES_MMAP_SIZE = 0
+# Pages that set stream = True in their .data.py are sent as they render: the <head> first and then the body in chunks
+#   of DOCROOT_STREAM_CHUNK_SIZE characters (or the page's stream_chunk_size)
+DOCROOT_STREAM_CHUNK_SIZE = 8192
+# Threads shared by the loaders = {key: callable} of the .data.py files (run concurrently to build the page context;
+#   loaders share the request across threads and must not modify it)
+DOCROOT_LOADER_WORKERS = 8
+# Default per route (and per worker) concurrency limit for pages and apis with a .data.py (None: unlimited; a data file
+#   can set max_concurrency, max_queue_wait, max_queue and retry_after itself).  Requests over the limit wait up to
+#   DOCROOT_MAX_QUEUE_WAIT seconds (at most DOCROOT_MAX_QUEUE of them; None for no bound) and then get a 503 with
+#   Retry-After
+DOCROOT_MAX_CONCURRENCY = None
+DOCROOT_MAX_QUEUE_WAIT = 0.0
+DOCROOT_MAX_QUEUE = 100
+DOCROOT_RETRY_AFTER = 1
+# Identical concurrent anonymous GETs of a page with a page cache policy (or any page/api whose .data.py sets
+#   coalesce = True, or all of them with DOCROOT_COALESCE) share one render; waiters give up after
+#   DOCROOT_COALESCE_TIMEOUT seconds.  DOCROOT_COALESCE_LOCK also coordinates the worker processes through the page
+#   cache backend, keeping the shared response for DOCROOT_COALESCE_RESULT_TTL seconds
+DOCROOT_COALESCE = False
+DOCROOT_COALESCE_TIMEOUT = 10.0
+DOCROOT_COALESCE_LOCK = False
+DOCROOT_COALESCE_RESULT_TTL = 2
 
 # add logging and our loggers
 LOGGING = {
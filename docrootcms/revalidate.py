@@ -0,0 +1,87 @@
+# Background refreshes for stale-while-revalidate.  When a cached page (pagecache) or a @cached_context value has
+# expired but is still inside its stale_while_revalidate window the visitor gets the expired copy right away and the
+# render runs again on a daemon thread to replace it.  A refresh runs once per key at a time in this worker; with a
+# cache given it also takes a short lock there so the other workers don't refresh the same entry.
+# The background render gets a detached copy of the request: same path, query string, headers and language but
+# anonymous and without cookies or the session, so nothing it does leaks into the visitor's response.
+import os
+import copy
+import logging
+import threading
+from importlib import import_module
+from django.conf import settings
+from django.db import connections
+
+log = logging.getLogger("docrootcms.revalidate")
+
+# how long a worker may hold the refresh lock for a key
+LOCK_TIMEOUT = 60
+
+_running = set()
+_running_lock = threading.Lock()
+_counters = {'started': 0, 'skipped': 0, 'failed': 0}
+
+# request.META entries tied to the visitor that must not reach the background render
+PRIVATE_META = ('HTTP_COOKIE', 'HTTP_AUTHORIZATION', 'CSRF_COOKIE', 'CSRF_COOKIE_NEEDS_UPDATE', 'CSRF_COOKIE_USED')
+
+
+def detach_request(request):
+    """
+        an anonymous copy of request that is safe to render with on another thread
+    """
+    from django.contrib.auth.models import AnonymousUser
+    detached = copy.copy(request)
+    detached.META = {name: value for name, value in request.META.items() if name not in PRIVATE_META}
+    detached.COOKIES = {}
+    detached.user = AnonymousUser()
+    if hasattr(request, 'session'):
+        detached.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    # cached_property; rebuilt from the new META on first use
+    detached.__dict__.pop('headers', None)
+    return detached
+
+
+def lock_key(key):
+    return f'{key}:revalidating'
+
+
+def refresh(key, func, cache):
+    try:
+        func()
+    except Exception:
+        with _running_lock:
+            _counters['failed'] += 1
+        log.exception(f"background refresh of {key} failed; the stale copy is kept")
+    finally:
+        with _running_lock:
+            _running.discard(key)
+        if cache is not None:
+            cache.delete(lock_key(key))
+        # no request cycle closes the connections of this thread
+        connections.close_all()
+
+
+def submit(key, func, cache=None):
+    """
+        call func() on a background thread unless key is already being refreshed; returns True if it was started
+    """
+    with _running_lock:
+        if key in _running:
+            _counters['skipped'] += 1
+            return False
+        _running.add(key)
+    if cache is not None and not cache.add(lock_key(key), os.getpid(), LOCK_TIMEOUT):
+        with _running_lock:
+            _running.discard(key)
+            _counters['skipped'] += 1
+        return False
+    with _running_lock:
+        _counters['started'] += 1
+    log.debug(f"refreshing {key} in the background")
+    threading.Thread(target=refresh, args=(key, func, cache), name='docrootcms-revalidate', daemon=True).start()
+    return True
+
+
+def stats():
+    with _running_lock:
+        return {'running': len(_running), **_counters}
@@ -0,0 +1,241 @@
+# In-memory index of the files under DOCROOT_ROOT.  Every docroot request that falls through to the cms used to probe
+# the filesystem several times (static file, .dt template, .data.py api, then again for the language prefix and
+# APPEND_SLASH retries).  The index scans the docroot once and maps every url form of every file to the kind of view
+# (static, page, api) that serves it, so DocrootFallbackMiddleware resolves a request with a lookup per url form, only
+# calls the views that can answer it and skips them all for a url nothing in the docroot serves.
+# Enable with DOCROOT_ROUTE_INDEX = True; set DOCROOT_ROUTE_INDEX_FILE to share one scan between workers.
+# NOTE: with DOCROOT_WATCH enabled the index follows changes to the docroot; without it the index only sees files that
+#   existed when it was built so rebuild it on deploy with ./manage.py docrootcms index
+import os
+import json
+import logging
+import threading
+from collections import namedtuple
+from django.conf import settings
+
+from . import watcher
+
+log = logging.getLogger("docrootcms.routes")
+
+INDEX_VERSION = 1
+STATIC = 'static'
+PAGE = 'page'
+API = 'api'
+
+# kind is one of STATIC, PAGE or API; name is the canonical url (without the leading /) the file is served as
+Route = namedtuple('Route', ['kind', 'file_name', 'name'])
+
+
+class RouteIndex:
+    """
+        maps every url form of the files under a docroot to the file that would serve it
+    """
+
+    def __init__(self, docroot_dir):
+        self.docroot_dir = os.path.normpath(str(docroot_dir))
+        self.prefix = self.docroot_dir + os.sep
+        self.files = set()
+        self.routes = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.files)
+
+    # walk the docroot and (re)build the index from scratch
+    def scan(self):
+        files = set()
+        for root, dirs, names in os.walk(self.docroot_dir, followlinks=True):
+            # never index compiled python from the data files
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            for name in names:
+                files.add(os.path.relpath(os.path.join(root, name), self.docroot_dir))
+        self.rebuild(files)
+        log.info(f"route index scanned {len(files)} files from {self.docroot_dir}")
+
+    # build into new structures and swap them in so readers never see a half built index
+    def rebuild(self, files):
+        new_files = set()
+        new_routes = {}
+        for rel in files:
+            self._add(new_files, new_routes, rel)
+        with self.lock:
+            self.files = new_files
+            self.routes = new_routes
+
+    # returns the url forms a docroot relative file name can be requested as
+    @staticmethod
+    def url_forms(rel):
+        path = rel.replace(os.sep, '/')
+        forms = [(STATIC, '/' + path, path)]
+        directory, base = os.path.split(path)
+        directory = directory + '/' if directory else ''
+        if path.endswith('.data.py'):
+            name = path[:-len('.data.py')]
+            forms.append((API, '/' + name + '.json', name + '.json'))
+            forms.append((API, '/' + name, name + '.json'))
+            if base == 'index.data.py':
+                forms.append((API, '/' + directory, name + '.json'))
+        elif path.endswith('.dt'):
+            name = path[:-len('.dt')]
+            forms.append((PAGE, '/' + name + '.html', name + '.html'))
+            forms.append((PAGE, '/' + name, name + '.html'))
+            if base == 'index.dt':
+                forms.append((PAGE, '/' + directory, name + '.html'))
+        return forms
+
+    def _add(self, files, routes, rel):
+        file_name = os.path.join(self.docroot_dir, rel)
+        files.add(rel)
+        for kind, url, name in self.url_forms(rel):
+            routes.setdefault(url, {})[kind] = Route(kind, file_name, name)
+
+    def add(self, rel):
+        with self.lock:
+            self._add(self.files, self.routes, rel)
+
+    def discard_tree(self, rel):
+        prefix = rel + os.sep
+        with self.lock:
+            for child in [f for f in self.files if f.startswith(prefix)]:
+                self.discard(child)
+
+    def discard(self, rel):
+        with self.lock:
+            self.files.discard(rel)
+            for kind, url, name in self.url_forms(rel):
+                kinds = self.routes.get(url)
+                if kinds:
+                    kinds.pop(kind, None)
+                    if not kinds:
+                        del self.routes[url]
+
+    # {kind: Route} for a url path (as in request.path_info); empty when no docroot file serves it
+    def lookup(self, path):
+        return self.routes.get(path) or {}
+
+    # drop in replacement for os.path.isfile() for any file name built from the docroot; anything that doesn't name a
+    #   file inside the docroot ('a.txt/', '../settings.py') is not a docroot file
+    def isfile(self, file_name):
+        file_name = str(file_name)
+        if file_name.endswith(('/', os.sep)):
+            return False
+        key = os.path.normpath(file_name)
+        if not key.startswith(self.prefix):
+            return False
+        return key[len(self.prefix):] in self.files
+
+    def save(self, index_file):
+        with self.lock:
+            data = {'version': INDEX_VERSION, 'docroot': self.docroot_dir, 'files': sorted(self.files)}
+        # write to a temp file and move it into place so other workers never read a partial index
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_file, index_file)
+        log.info(f"route index saved to {index_file}")
+
+    def load(self, index_file):
+        try:
+            with open(index_file, 'r', encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError) as ex:
+            log.debug(f"unable to load route index [{index_file}]: {ex}")
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('docroot') != self.docroot_dir:
+            log.info(f"route index [{index_file}] is for another docroot or version; ignoring it")
+            return False
+        self.rebuild(data.get('files', []))
+        log.info(f"route index loaded {len(self.files)} files from {index_file}")
+        return True
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'DOCROOT_ROUTE_INDEX', False)
+
+
+# returns the shared route index building (or loading) it on first use; None if the index is disabled
+def get_index():
+    global _index
+    if not is_enabled():
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+                watcher.subscribe(on_change)
+    return _index
+
+
+def build_index(index_file=None, rescan=False):
+    index = RouteIndex(getattr(settings, "DOCROOT_ROOT", ""))
+    index_file = index_file or getattr(settings, 'DOCROOT_ROUTE_INDEX_FILE', None)
+    if index_file and not rescan and index.load(index_file):
+        return index
+    index.scan()
+    if index_file:
+        try:
+            index.save(index_file)
+        except OSError as ex:
+            log.error(f"unable to save route index [{index_file}]: {ex}")
+    return index
+
+
+# keeps the shared index in step with the docroot when the watcher is enabled
+def on_change(event):
+    index = _index
+    if index is None:
+        return
+    if event.kind == watcher.RESET:
+        index.scan()
+        return
+    key = os.path.normpath(event.file_name)
+    if not key.startswith(index.prefix):
+        return
+    rel = key[len(index.prefix):]
+    if event.kind == watcher.DELETED:
+        if event.is_dir:
+            index.discard_tree(rel)
+        else:
+            index.discard(rel)
+    elif not event.is_dir:
+        index.add(rel)
+
+
+# the url forms the views try for a request: as is, then (unless IGNORE_LANGUAGE_PREFIX) without the language prefix
+#   and with APPEND_SLASH without the slash django added; mirrors TemplateMeta/ApiMeta
+def request_paths(request):
+    path = request.path_info.strip()
+    paths = [path]
+    language_code = getattr(request, 'LANGUAGE_CODE', None)
+    if language_code and not getattr(settings, 'IGNORE_LANGUAGE_PREFIX', False):
+        lang = f'/{language_code}/'
+        if path.startswith(lang):
+            paths.append('/' + path[len(lang):])
+            if getattr(settings, 'APPEND_SLASH', False) and path.endswith('/'):
+                paths.append('/' + path[len(lang):-1])
+    return paths
+
+
+def request_kinds(request):
+    """
+        the kinds of docroot file (STATIC, PAGE, API) that can answer request; None when the index is disabled
+    """
+    index = get_index()
+    if index is None:
+        return None
+    kinds = set()
+    for path in request_paths(request):
+        kinds.update(index.lookup(path))
+    return kinds
+
+
+# os.path.isfile() that answers from the route index when it is enabled
+def isfile(file_name):
+    index = get_index()
+    if index is None:
+        return os.path.isfile(file_name)
+    return index.isfile(file_name)
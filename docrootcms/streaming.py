@@ -0,0 +1,140 @@
+# Streams a rendered docroot page instead of building it in memory.  A page opts in from its data file:
+#
+#   stream = True
+#   stream_chunk_size = 16384                   # optional; defaults to DOCROOT_STREAM_CHUNK_SIZE
+#
+# The template is rendered node by node, following {% extends %} up to the root layout and descending into
+# {% block %}s, so the output up to and including </head> is flushed as soon as it is rendered and the rest is sent in
+# chunks of about stream_chunk_size characters.  The output of any other tag ({% for %}, {% include %} etc.) is
+# rendered as a whole before it is sent.
+# NOTE: the response headers are sent before the template renders so templates of streamed pages must not change the
+#   session or anything else the response middleware relies on; streamed pages are never put in the page cache.
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.base import TextNode
+from django.template.loader_tags import BLOCK_CONTEXT_KEY, BlockContext, BlockNode, ExtendsNode
+
+log = logging.getLogger("docrootcms.streaming")
+
+HEAD_END = '</head>'
+
+
+def is_streamed(data):
+    return bool(getattr(data, 'stream', False))
+
+
+def get_chunk_size(data):
+    return getattr(data, 'stream_chunk_size', None) or getattr(settings, 'DOCROOT_STREAM_CHUNK_SIZE', 8192)
+
+
+# the same as django.template.base.Template.render except the output is yielded a node at a time
+def iter_render(template, context):
+    with context.render_context.push_state(template):
+        if context.template is None:
+            with context.bind_template(template):
+                context.template_name = template.name
+                yield from iter_template(template, context)
+        else:
+            yield from iter_template(template, context)
+
+
+def iter_template(template, context):
+    for index, node in enumerate(template.nodelist):
+        # the extends tag has to be the first non-text node; like django we still send the text in front of it
+        if isinstance(node, TextNode):
+            continue
+        if isinstance(node, ExtendsNode):
+            yield from iter_nodelist(template.nodelist[:index], context)
+            yield from iter_extends(node, context)
+            return
+        break
+    yield from iter_nodelist(template.nodelist, context)
+
+
+def iter_nodelist(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, BlockNode):
+            yield from iter_block(node, context)
+        else:
+            yield str(node.render_annotated(context))
+
+
+# mirrors ExtendsNode.render
+def iter_extends(node, context):
+    parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for parent_node in parent.nodelist:
+        if not isinstance(parent_node, TextNode):
+            if not isinstance(parent_node, ExtendsNode):
+                block_context.add_blocks({n.name: n for n in parent.nodelist.get_nodes_by_type(BlockNode)})
+            break
+    with context.render_context.push_state(parent, isolated_context=False):
+        yield from iter_template(parent, context)
+
+
+# mirrors BlockNode.render
+def iter_block(node, context):
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            yield from iter_nodelist(node.nodelist, context)
+        else:
+            push = block = block_context.pop(node.name)
+            if block is None:
+                block = node
+            block = type(node)(block.name, block.nodelist)
+            block.context = context
+            context['block'] = block
+            yield from iter_nodelist(block.nodelist, context)
+            if push is not None:
+                block_context.push(node.name, push)
+
+
+# joins the rendered pieces into chunks; everything up to </head> goes out as soon as we have it
+def iter_chunks(pieces, chunk_size):
+    buffer = []
+    size = 0
+    head_sent = False
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer.append(piece)
+        size += len(piece)
+        if not head_sent and HEAD_END in piece:
+            head_sent = True
+        elif size < chunk_size:
+            continue
+        yield ''.join(buffer)
+        buffer = []
+        size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# under ASGI django would read a sync iterator to the end before sending anything; render each chunk in a thread
+#   instead (templates may use the database)
+async def aiter_chunks(chunks):
+    done = object()
+    while True:
+        chunk = await sync_to_async(next)(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def stream_page(request, template, context, chunk_size, asynchronous=False):
+    """
+        returns a StreamingHttpResponse that renders template with context as the client reads it
+    """
+    # the csrf cookie is set by csrf_protect before a streamed template renders {% csrf_token %} so create it now
+    get_token(request)
+    log.debug(f"streaming {template.name} in chunks of {chunk_size}")
+    chunks = iter_chunks(iter_render(template, context), chunk_size)
+    return StreamingHttpResponse(aiter_chunks(chunks) if asynchronous else chunks)
@@ -0,0 +1,149 @@
+# Finds the context keys a compiled docroot template can read.  The walk covers the page template, the templates it
+# extends and the templates it includes (when their names are constants) and collects the first part of every
+# variable, filter argument and tag argument ({{ products.count }}, {% for p in products %}, {% if news %}, ...).
+# render_page uses it to skip the loaders = {key: callable} a page never uses; ./manage.py docrootcms vars <page.dt>
+# prints it.  The report is marked incomplete when something can read the context in ways we can't see (a dynamic
+# include, a takes_context tag, {% debug %}, a third party tag); callers must then assume every key is used.
+import logging
+import weakref
+import threading
+from collections import namedtuple
+from django.template import TemplateDoesNotExist
+from django.template.base import FilterExpression, Node, NodeList, Variable
+from django.template.defaulttags import CsrfTokenNode, DebugNode
+from django.template.library import InclusionNode, SimpleNode
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.template.smartif import TokenBase
+
+from . import watcher
+
+log = logging.getLogger("docrootcms.templatevars")
+
+Report = namedtuple('Report', ['keys', 'complete', 'templates'])
+
+# modules whose tags only read the context through the filter expressions we walk
+KNOWN_MODULES = ('django.template.', 'django.templatetags.')
+
+
+class Analyzer:
+    """
+        collects the context keys for one template tree
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.keys = set()
+        self.complete = True
+        self.templates = []
+        self.seen = set()
+
+    def incomplete(self, reason):
+        if self.complete:
+            log.debug(f"template variables incomplete: {reason}")
+        self.complete = False
+
+    def add_variable(self, var):
+        if isinstance(var, Variable) and var.lookups:
+            self.keys.add(var.lookups[0])
+
+    def visit_template(self, name):
+        if name in self.templates:
+            return
+        self.templates.append(name)
+        try:
+            template = self.engine.get_template(name)
+        except TemplateDoesNotExist:
+            self.incomplete(f"missing template {name}")
+            return
+        self.visit(template.nodelist)
+
+    def visit(self, value):
+        if id(value) in self.seen:
+            return
+        if isinstance(value, FilterExpression):
+            self.add_variable(value.var)
+            for func, args in value.filters:
+                for lookup, arg in args:
+                    if lookup:
+                        self.add_variable(arg)
+        elif isinstance(value, Variable):
+            self.add_variable(value)
+        elif isinstance(value, NodeList):
+            self.seen.add(id(value))
+            for node in value:
+                self.visit(node)
+        elif isinstance(value, Node):
+            self.seen.add(id(value))
+            self.visit_node(value)
+        elif isinstance(value, TokenBase):
+            # {% if %} conditions
+            for item in vars(value).values():
+                self.visit(item)
+        elif isinstance(value, (list, tuple, set)):
+            for item in value:
+                self.visit(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self.visit(item)
+
+    def visit_node(self, node):
+        if not node.__class__.__module__.startswith(KNOWN_MODULES):
+            self.incomplete(f"unknown tag {node.__class__.__name__}")
+        elif isinstance(node, DebugNode):
+            self.incomplete("{% debug %}")
+        elif isinstance(node, (SimpleNode, InclusionNode)) and node.takes_context:
+            self.incomplete(f"takes_context tag {node.__class__.__name__}")
+        elif isinstance(node, CsrfTokenNode):
+            self.keys.add('csrf_token')
+        elif node.__class__.__name__ == 'BlockTranslateNode':
+            # {% blocktranslate %} keeps its variables as tokens
+            for token in list(node.singular) + list(node.plural or []):
+                if token.token_type.name == 'VAR':
+                    self.keys.add(token.contents.split('.')[0])
+        if isinstance(node, ExtendsNode):
+            if isinstance(node.parent_name.var, str):
+                self.visit_template(node.parent_name.var)
+            else:
+                self.incomplete("dynamic extends")
+        elif isinstance(node, IncludeNode):
+            if isinstance(node.template.var, str):
+                self.visit_template(node.template.var)
+            else:
+                self.incomplete("dynamic include")
+        for name, item in vars(node).items():
+            if name not in ('token', 'origin'):
+                self.visit(item)
+
+
+def analyze(template):
+    """
+        returns a Report(keys, complete, templates) of the context keys template (and its parents and includes) reads
+    """
+    report = _reports.get(template)
+    if report is None:
+        analyzer = Analyzer(template.engine)
+        analyzer.visit(template.nodelist)
+        report = Report(frozenset(analyzer.keys), analyzer.complete, tuple(analyzer.templates))
+        with _reports_lock:
+            _reports[template] = report
+        subscribe()
+    return report
+
+
+_reports = weakref.WeakKeyDictionary()
+_reports_lock = threading.Lock()
+_subscribed = False
+
+
+def subscribe():
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        watcher.subscribe(on_change)
+
+
+# a changed parent or include changes what every page using it reads
+def on_change(event):
+    if event.kind == watcher.RESET or event.is_dir or not event.file_name.endswith('.py'):
+        with _reports_lock:
+            _reports.clear()
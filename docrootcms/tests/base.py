@@ -0,0 +1,128 @@
+# Shared setup for the docrootcms tests: every test gets its own temporary DOCROOT_ROOT, a private locmem cache and
+# fresh process level caches, with every optional docroot feature off unless the test turns it on.
+import os
+import time
+import shutil
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import routes
+from .. import caches
+from .. import misses
+from .. import hotfiles
+from .. import admission
+from .. import coalesce
+from .. import templatevars
+from .. import jsonencoding
+from .. import revalidate
+
+MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.locale.LocaleMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'docrootcms.middleware.DocrootFallbackMiddleware',
+]
+
+DEFAULT_SETTINGS = {
+    'ROOT_URLCONF': 'docrootcms.tests.urls',
+    'MIDDLEWARE': MIDDLEWARE,
+    'ALLOWED_HOSTS': ['testserver', 'localhost'],
+    'DEBUG': False,
+    'IGNORE_LANGUAGE_PREFIX': True,
+    'USE_STATIC_FORBIDDEN': False,
+    'DOCROOT_ROUTE_INDEX': False,
+    'DOCROOT_ROUTE_INDEX_FILE': None,
+    'DOCROOT_WATCH': False,
+    'DOCROOT_PRE_DISPATCH': False,
+    'DOCROOT_MISS_CACHE_SIZE': 0,
+    'DOCROOT_TEMPLATE_CACHE': None,
+    'DOCROOT_DATA_CACHE': None,
+    'DOCROOT_PAGE_CACHE_TIMEOUT': None,
+    'DOCROOT_PAGE_CACHE_ALIAS': 'default',
+    'DOCROOT_CONTEXT_CACHE_ALIAS': 'default',
+    'DOCROOT_MAX_CONCURRENCY': None,
+    'DOCROOT_COALESCE': False,
+    'DOCROOT_COALESCE_LOCK': False,
+    'DOCROOT_SENDFILE': None,
+    'DOCROOT_HOT_FILES': False,
+    'DOCROOT_PRECOMPRESSED': True,
+}
+
+
+def reset_state():
+    routes._index = None
+    caches._template_cache = None
+    caches._data_cache = None
+    misses._cache = None
+    hotfiles._cache = None
+    jsonencoding._dumps = None
+    admission._limiters.clear()
+    coalesce._flights.clear()
+    with templatevars._reports_lock:
+        templatevars._reports.clear()
+
+
+def later(seconds):
+    """
+        moves time.time() forward; the locmem cache uses it too so entries must outlive the jump
+    """
+    now = time.time
+    return mock.patch('time.time', lambda: now() + seconds)
+
+
+def wait_for_refreshes():
+    while revalidate.stats()['running']:
+        time.sleep(0.01)
+
+
+class DocrootMixin:
+    """
+        files = {'relative/name': 'content'} are written to a fresh docroot before every test; settings overrides
+        DEFAULT_SETTINGS for the whole class
+    """
+    files = {}
+    settings = {}
+
+    def setUp(self):
+        super().setUp()
+        self.docroot = tempfile.mkdtemp(prefix='docrootcms-test-')
+        self.addCleanup(shutil.rmtree, self.docroot, True)
+        for name, content in self.files.items():
+            self.write(name, content)
+        overrides = override_settings(**{
+            **DEFAULT_SETTINGS,
+            'DOCROOT_ROOT': self.docroot,
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                   'LOCATION': self.docroot}},
+            **self.settings,
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_state()
+        self.addCleanup(reset_state)
+
+    def path(self, name):
+        return os.path.join(self.docroot, name)
+
+    def write(self, name, content, mtime=None):
+        file_name = self.path(name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'wb' if isinstance(content, bytes) else 'w') as fp:
+            fp.write(content)
+        if mtime is not None:
+            os.utime(file_name, (mtime, mtime))
+        return file_name
+
+
+class DocrootTestCase(DocrootMixin, SimpleTestCase):
+    pass
+
+
+class DocrootDatabaseTestCase(DocrootMixin, TestCase):
+    """
+        for tests that need sessions or users
+    """
+    pass
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+
+from .base import DocrootTestCase
+from .. import admission
+
+
+class LimiterTests(SimpleTestCase):
+
+    def test_rejects_over_the_limit_without_a_queue(self):
+        limiter = admission.Limiter('/a', 1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_waiting_thread_gets_the_released_slot(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5)
+        limiter.acquire()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        thread.start()
+        while not limiter.waiting:
+            pass
+        limiter.release()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertEqual((limiter.active, limiter.waiting, limiter.queued), (1, 0, 1))
+
+    def test_full_queue_rejects(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5, queue_size=0)
+        limiter.acquire()
+        self.assertFalse(limiter.acquire())
+
+    def test_queue_is_bounded_by_default(self):
+        limiter = admission.get_limiter('/a', SimpleNamespace(max_concurrency=2))
+        self.assertEqual(limiter.queue_size, admission.DEFAULT_MAX_QUEUE)
+        admission._limiters.clear()
+
+
+class AsyncLimiterTests(SimpleTestCase):
+
+    async def test_waiter_gets_the_released_slot(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5)
+        self.assertTrue(await limiter.aacquire())
+        waiter = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting, 1)
+        limiter.release()
+        self.assertTrue(await waiter)
+        self.assertEqual((limiter.active, limiter.waiting), (1, 0))
+
+    async def test_timeout(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=0.01)
+        await limiter.aacquire()
+        self.assertFalse(await limiter.aacquire())
+        self.assertEqual((limiter.active, limiter.waiting, limiter.timeouts), (1, 0, 1))
+
+    async def test_cancelled_waiter_does_not_keep_a_slot(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5)
+        await limiter.aacquire()
+        waiter = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual((limiter.active, limiter.waiting), (1, 0))
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
+
+    async def test_cancelled_after_the_slot_was_handed_over(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5)
+        await limiter.aacquire()
+        waiter = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        waiter.cancel()
+        try:
+            # wait_for may still hand over the slot when it was granted first; then the caller owns it
+            if await waiter:
+                limiter.release()
+        except asyncio.CancelledError:
+            pass
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+        self.assertTrue(await limiter.aacquire())
+
+    async def test_released_from_a_thread(self):
+        limiter = admission.Limiter('/a', 1, queue_wait=5)
+        await limiter.aacquire()
+        waiter = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        await asyncio.to_thread(limiter.release)
+        self.assertTrue(await waiter)
+
+
+STREAM_DATA = '''max_concurrency = 1
+
+def GET(request):
+    yield {'n': 1}
+    yield {'n': 2}
+'''
+
+
+class StreamedResponseSlotTests(DocrootTestCase):
+    files = {'items.data.py': STREAM_DATA}
+
+    def test_slot_is_held_until_the_stream_is_closed(self):
+        response = self.client.get('/items.json')
+        self.assertTrue(response.streaming)
+        limiter = admission._limiters['items.json']
+        self.assertEqual(limiter.active, 1)
+        self.assertEqual(self.client.get('/items.json').status_code, 503)
+        b''.join(response.streaming_content)
+        self.assertEqual(limiter.active, 0)
+        response = self.client.get('/items.json')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(limiter.active, 0)
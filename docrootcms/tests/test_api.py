@@ -0,0 +1,138 @@
+import json
+import datetime
+from decimal import Decimal
+from django.test import SimpleTestCase, override_settings
+
+from .base import DocrootTestCase
+from .. import jsonencoding
+
+HOOKS_DATA = '''import datetime
+
+calls = []
+
+def etag(request):
+    return 'v1'
+
+def last_modified(request):
+    return datetime.datetime(2024, 1, 1)
+
+def GET(request):
+    calls.append(request)
+    return {'calls': len(calls)}
+'''
+
+PLAIN_DATA = '''def GET(request):
+    return 'hello ' + request.GET.get('name', 'world')
+'''
+
+
+class ConditionalApiTests(DocrootTestCase):
+    files = {'hooks.data.py': HOOKS_DATA, 'plain.data.py': PLAIN_DATA}
+
+    def test_hooks_answer_without_calling_the_method(self):
+        response = self.client.get('/hooks.json')
+        self.assertEqual(response['ETag'], '"v1"')
+        self.assertEqual(response['Last-Modified'], 'Mon, 01 Jan 2024 00:00:00 GMT')
+        response = self.client.get('/hooks.json', HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/hooks.json', HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/hooks.json', HTTP_IF_NONE_MATCH='"v0"').status_code, 200)
+
+    def test_if_match_on_writes(self):
+        self.write('hooks.data.py', HOOKS_DATA + '\ndef PUT(request):\n    return {}\n')
+        self.assertEqual(self.client.put('/hooks.json', HTTP_IF_MATCH='"v0"').status_code, 412)
+        self.assertEqual(self.client.put('/hooks.json', HTTP_IF_MATCH='"v1"').status_code, 200)
+
+    def test_writes_without_hooks_ignore_preconditions(self):
+        self.write('plain.data.py', PLAIN_DATA + '\ndef PUT(request):\n    return {}\n')
+        self.assertEqual(self.client.put('/plain.json', HTTP_IF_MATCH='"v0"').status_code, 200)
+        response = self.client.put('/plain.json', HTTP_IF_UNMODIFIED_SINCE='Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_async_writes_without_hooks_ignore_preconditions(self):
+        self.write('plain.data.py', PLAIN_DATA + '\ndef PUT(request):\n    return {}\n')
+        response = await self.async_client.put('/plain.json', headers={'If-Match': '"v0"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_from_the_body(self):
+        response = self.client.get('/plain.json')
+        self.assertTrue(response['ETag'])
+        self.assertEqual(self.client.get('/plain.json', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/plain.json?name=x', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    @override_settings(DOCROOT_API_ETAGS=False)
+    def test_body_etags_can_be_turned_off(self):
+        self.assertNotIn('ETag', self.client.get('/plain.json'))
+
+
+TYPES_DATA = '''import datetime
+from decimal import Decimal
+
+def GET(request):
+    return {'when': datetime.date(2024, 1, 2), 'price': Decimal('1.50'), 'tags': ('a', 'b')}
+'''
+
+STREAM_DATA = '''def GET(request):
+    return ({'n': n} for n in range(int(request.GET.get('count', 3))))
+'''
+
+ASYNC_STREAM_DATA = '''async def items():
+    for n in range(3):
+        yield {'n': n}
+
+async def GET(request):
+    return items()
+'''
+
+
+def upper_dumps(obj):
+    return json.dumps(obj).upper()
+
+
+class JsonApiTests(DocrootTestCase):
+    files = {'types.data.py': TYPES_DATA, 'items.data.py': STREAM_DATA, 'aitems.data.py': ASYNC_STREAM_DATA}
+
+    def test_documents(self):
+        for encoder in (None, 'json', 'orjson'):
+            with self.subTest(encoder), override_settings(DOCROOT_JSON_ENCODER=encoder):
+                jsonencoding._dumps = None
+                response = self.client.get('/types.json')
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.json(), {'when': '2024-01-02', 'price': '1.50', 'tags': ['a', 'b']})
+
+    @override_settings(DOCROOT_JSON_ENCODER='docrootcms.tests.test_api.upper_dumps')
+    def test_custom_encoder(self):
+        response = self.client.get('/items.json', {'count': 2})
+        self.assertEqual(b''.join(response.streaming_content), b'[{"N": 0},{"N": 1}]')
+
+    def test_generators_are_streamed_as_an_array(self):
+        response = self.client.get('/items.json', {'count': 1000})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [{'n': n} for n in range(1000)])
+
+    def test_empty_stream(self):
+        response = self.client.get('/items.json', {'count': 0})
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    def test_ndjson(self):
+        response = self.client.get('/items.json', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(b''.join(response.streaming_content), b'{"n":0}\n{"n":1}\n{"n":2}\n')
+
+    async def test_async_generators(self):
+        response = await self.async_client.get('/aitems.json')
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(json.loads(b''.join(chunks)), [{'n': 0}, {'n': 1}, {'n': 2}])
+
+
+class StreamEncoderTests(SimpleTestCase):
+
+    def test_chunks(self):
+        chunks = list(jsonencoding.iter_encoded(({'n': n} for n in range(100)), jsonencoding.JSON, 64))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(json.loads(b''.join(chunks)), [{'n': n} for n in range(100)])
+        self.assertEqual(jsonencoding.dumps(datetime.date(2024, 1, 2)), b'"2024-01-02"')
+        self.assertEqual(jsonencoding.dumps(Decimal('2.5')), b'"2.5"')
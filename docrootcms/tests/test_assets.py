@@ -0,0 +1,217 @@
+import os
+import gzip
+from django.test import RequestFactory, override_settings
+from django.utils.http import http_date
+
+from .base import DocrootTestCase
+from .. import assets
+from .. import hotfiles
+from .. import views
+
+CSS = 'body { color: red; }\n' * 100
+
+
+# LocaleMiddleware adds Accept-Language
+def vary(response):
+    return [value.strip() for value in response.get('Vary', '').split(',')]
+
+
+def content(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+class ConditionalTests(DocrootTestCase):
+    files = {'site.css': CSS}
+
+    def test_validators(self):
+        response = self.client.get('/site.css')
+        self.assertEqual(response.status_code, 200)
+        stat = os.stat(self.path('site.css'))
+        self.assertEqual(response['ETag'], assets.get_etag(stat))
+        self.assertEqual(response['Last-Modified'], http_date(stat.st_mtime))
+        response.close()
+
+    def test_if_none_match(self):
+        etag = self.client.get('/site.css')['ETag']
+        response = self.client.get('/site.css', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/site.css', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/site.css')['Last-Modified']
+        self.assertEqual(self.client.get('/site.css', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.write('site.css', CSS + 'a{}', mtime=os.stat(self.path('site.css')).st_mtime + 10)
+        self.assertEqual(self.client.get('/site.css', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+
+class RangeTests(DocrootTestCase):
+    files = {'data.bin': bytes(range(256)) * 4}
+
+    def get(self, header, **extra):
+        return self.client.get('/data.bin', HTTP_RANGE=header, **extra)
+
+    def test_single_range(self):
+        response = self.get('bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(content(response), bytes(range(10, 20)))
+
+    def test_suffix_and_open_ranges(self):
+        self.assertEqual(content(self.get('bytes=-4')), bytes(range(252, 256)))
+        response = self.get('bytes=1020-')
+        self.assertEqual(response['Content-Range'], 'bytes 1020-1023/1024')
+        self.assertEqual(content(response), bytes(range(252, 256)))
+
+    def test_multiple_ranges(self):
+        response = self.get('bytes=0-1,10-11')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = content(response)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 10-11/1024\r\n\r\n' + bytes([10, 11]), body)
+
+    def test_unsatisfiable(self):
+        response = self.get('bytes=2000-3000')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_malformed_ranges_get_the_whole_file(self):
+        for header in ('bytes=5-1', 'lines=1-2', 'bytes=x-'):
+            with self.subTest(header):
+                response = self.get(header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(content(response)), 1024)
+
+    def test_if_range(self):
+        etag = self.client.get('/data.bin')['ETag']
+        self.assertEqual(self.get('bytes=0-1', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get('bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+
+
+class PrecompressedTests(DocrootTestCase):
+    files = {'site.css': CSS, 'site.css.gz': gzip.compress(CSS.encode(), mtime=0), 'logo.png': b'png'}
+
+    def test_gzip_copy_for_clients_that_accept_it(self):
+        response = self.client.get('/site.css', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', vary(response))
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(content(response)).decode(), CSS)
+
+    def test_identity_for_other_clients(self):
+        for accept in ('', 'gzip;q=0', 'br'):
+            with self.subTest(accept):
+                response = self.client.get('/site.css', HTTP_ACCEPT_ENCODING=accept)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertIn('Accept-Encoding', vary(response))
+                self.assertEqual(content(response).decode(), CSS)
+
+    def test_copies_have_their_own_etag(self):
+        gzipped = self.client.get('/site.css', HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertNotEqual(self.client.get('/site.css')['ETag'], gzipped)
+        response = self.client.get('/site.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Encoding', vary(response))
+
+    def test_stale_copies_are_ignored(self):
+        os.utime(self.path('site.css.gz'), (1, 1))
+        self.assertNotIn('Content-Encoding', self.client.get('/site.css', HTTP_ACCEPT_ENCODING='gzip'))
+
+    def test_other_files_are_not_negotiated(self):
+        response = self.client.get('/logo.png', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Accept-Encoding', vary(response))
+        self.assertNotIn('Content-Encoding', response)
+
+    @override_settings(DOCROOT_PRECOMPRESSED=False)
+    def test_disabled(self):
+        self.assertNotIn('Content-Encoding', self.client.get('/site.css', HTTP_ACCEPT_ENCODING='gzip'))
+
+
+class SendfileTests(DocrootTestCase):
+    files = {'css/site.css': CSS, 'video.mp4': b'\0' * 100, 'notes.txt': 'notes'}
+
+    @override_settings(DOCROOT_SENDFILE='x-accel-redirect', DOCROOT_SENDFILE_PREFIX='/_docroot/')
+    def test_x_accel_redirect(self):
+        response = self.client.get('/css/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/_docroot/css/site.css')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DOCROOT_SENDFILE='X-Sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get('/css/site.css')
+        self.assertEqual(response['X-Sendfile'], self.path('css/site.css'))
+
+    @override_settings(DOCROOT_SENDFILE='x-accel-redirect',
+                       DOCROOT_SENDFILE_HEADERS={'.mp4': {'X-Accel-Buffering': 'no'}, '.txt': None})
+    def test_headers_per_extension(self):
+        self.assertEqual(self.client.get('/video.mp4')['X-Accel-Buffering'], 'no')
+        response = self.client.get('/notes.txt')
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(b''.join(response.streaming_content), b'notes')
+
+    @override_settings(DOCROOT_SENDFILE='x-lighttpd')
+    def test_unknown_mode_is_logged_once_and_served_by_python(self):
+        assets._invalid_modes.discard('x-lighttpd')
+        with self.assertLogs('docrootcms.assets', 'ERROR') as logs:
+            for _ in range(3):
+                response = self.client.get('/css/site.css')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content).decode(), CSS)
+        self.assertEqual(len(logs.records), 1)
+        self.assertNotIn('X-Sendfile', response)
+
+
+class HotFileTests(DocrootTestCase):
+    files = {'favicon.ico': b'icon', 'big.bin': b'x' * 100000}
+    settings = {'DOCROOT_HOT_FILES': True, 'DOCROOT_HOT_FILES_MAX_FILE_SIZE': 1024,
+                'DOCROOT_HOT_FILES_INTERVAL': 0}
+
+    def get(self, path, **extra):
+        return views.static(RequestFactory().get(path, **extra))
+
+    def test_small_files_are_served_from_memory(self):
+        self.assertEqual(self.get('/favicon.ico').content, b'icon')
+        self.assertEqual(self.get('/favicon.ico').content, b'icon')
+        self.assertEqual((hotfiles.stats()['misses'], hotfiles.stats()['hits']), (1, 1))
+
+    def test_changed_files_are_read_again(self):
+        self.get('/favicon.ico')
+        self.write('favicon.ico', b'new icon', mtime=1)
+        self.assertEqual(self.get('/favicon.ico').content, b'new icon')
+
+    def test_medium_files_are_not_mapped_by_default(self):
+        response = self.get('/big.bin')
+        self.assertNotIsInstance(response.file_to_stream, hotfiles.MappedFile)
+        response.close()
+
+    @override_settings(DOCROOT_HOT_FILES_MMAP_SIZE=1024 * 1024)
+    def test_medium_files_are_mapped_without_a_file_wrapper(self):
+        response = self.get('/big.bin')
+        self.assertIsInstance(response.file_to_stream, hotfiles.MappedFile)
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 100000)
+        response.close()
+
+    @override_settings(DOCROOT_HOT_FILES_MMAP_SIZE=1024 * 1024)
+    def test_closed_mappings_are_no_longer_counted(self):
+        mapped = hotfiles.stats()['mapped']
+        response = self.get('/big.bin')
+        self.assertEqual(hotfiles.stats()['mapped'], mapped + 1)
+        response.close()
+        response.file_to_stream.close()
+        self.assertEqual(hotfiles.stats()['mapped'], mapped)
+
+    @override_settings(DOCROOT_HOT_FILES_MMAP_SIZE=1024 * 1024)
+    def test_servers_with_a_file_wrapper_get_a_real_file(self):
+        response = self.get('/big.bin', **{'wsgi.file_wrapper': object})
+        self.assertTrue(response.file_to_stream.fileno())
+        response.close()
+        response = self.get('/big.bin', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.file_to_stream.fileno())
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 10)
+        response.close()
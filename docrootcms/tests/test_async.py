@@ -0,0 +1,81 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+
+from docrootcms import apps, views
+
+from .base import DocrootTestCase, DocrootDatabaseTestCase
+
+PAGE_DATA = '''cache_timeout = 60
+
+def get_context(request):
+    return {'name': request.GET.get('name', 'world')}
+'''
+
+API_DATA = '''coalesce = True
+
+def GET(request):
+    return {'name': request.GET.get('name', 'world')}
+'''
+
+
+class AsyncSessionTests(DocrootDatabaseTestCase):
+    files = {
+        'page.dt': 'hello {{ name }}',
+        'page.data.py': PAGE_DATA,
+        'api.data.py': API_DATA,
+    }
+
+    async def login(self):
+        user = await User.objects.acreate_user('visitor', password='secret')
+        # the user is loaded from the session on first use
+        await self.async_client.aforce_login(user)
+
+    async def test_anonymous_page(self):
+        response = await self.async_client.get('/page')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'hello world')
+
+    async def test_page_with_a_session(self):
+        await self.login()
+        response = await self.async_client.get('/page', {'name': 'visitor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'hello visitor')
+
+    async def test_api_with_a_session(self):
+        await self.login()
+        response = await self.async_client.get('/api.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'name': 'world'})
+
+
+class AsyncStaticTests(DocrootTestCase):
+    files = {'site.css': 'body {}'}
+
+    async def test_static_files(self):
+        response = await self.async_client.get('/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), b'body {}')
+
+    async def test_static_runs_off_the_event_loop(self):
+        threads = []
+
+        def static(request):
+            threads.append(threading.current_thread())
+            return None
+
+        with mock.patch.object(views, 'static', static):
+            await views.astatic(None)
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+
+class DjangoVersionTests(SimpleTestCase):
+    def test_supported_django(self):
+        self.assertEqual(apps.check_django_version(None), [])
+
+    def test_older_django_is_reported(self):
+        with mock.patch('django.VERSION', (4, 2, 0, 'final', 0)):
+            errors = apps.check_django_version(None)
+        self.assertEqual([error.id for error in errors], ['docrootcms.E001'])
@@ -0,0 +1,92 @@
+from django.test import override_settings
+
+from .base import DocrootTestCase
+from .. import caches
+from .. import watcher
+
+# counts how often the module level code ran
+COUNTING_DATA = '''from docrootcms.tests import test_caches
+
+test_caches.LOADS.append(VERSION)
+
+def get_context(request):
+    return {'version': VERSION}
+'''
+LOADS = []
+
+
+def data(version):
+    return f"VERSION = {version!r}\n" + COUNTING_DATA
+
+
+class TemplateCacheTests(DocrootTestCase):
+    files = {'page.dt': 'one'}
+
+    def change(self):
+        # a different mtime than the cached copy even on filesystems with coarse timestamps
+        self.write('page.dt', 'two', mtime=1)
+
+    @override_settings(DOCROOT_TEMPLATE_CACHE='mtime')
+    def test_mtime(self):
+        self.assertEqual(self.client.get('/page').content, b'one')
+        self.assertEqual(self.client.get('/page').content, b'one')
+        self.assertEqual(caches.stats()['templates']['hits'], 1)
+        self.change()
+        self.assertEqual(self.client.get('/page').content, b'two')
+
+    @override_settings(DOCROOT_TEMPLATE_CACHE='interval', DOCROOT_TEMPLATE_CACHE_INTERVAL=60)
+    def test_interval(self):
+        self.client.get('/page')
+        self.change()
+        self.assertEqual(self.client.get('/page').content, b'one')
+        caches.get_template_cache().interval = 0
+        self.assertEqual(self.client.get('/page').content, b'two')
+
+    @override_settings(DOCROOT_TEMPLATE_CACHE='never')
+    def test_never_until_the_watcher_sees_the_change(self):
+        self.client.get('/page')
+        self.change()
+        self.assertEqual(self.client.get('/page').content, b'one')
+        watcher.publish(watcher.Event(watcher.MODIFIED, self.path('page.dt'), False))
+        self.assertEqual(self.client.get('/page').content, b'two')
+
+    @override_settings(DOCROOT_TEMPLATE_CACHE='sometimes')
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            caches.get_template_cache()
+
+
+class DataModuleCacheTests(DocrootTestCase):
+    files = {'page.dt': '{{ version }}', 'page.data.py': data('one')}
+
+    def setUp(self):
+        super().setUp()
+        LOADS.clear()
+
+    def test_off_executes_every_request(self):
+        self.client.get('/page')
+        self.client.get('/page')
+        self.assertEqual(LOADS, ['one', 'one'])
+
+    @override_settings(DOCROOT_DATA_CACHE='mtime')
+    def test_module_runs_once(self):
+        self.assertEqual(self.client.get('/page').content, b'one')
+        self.assertEqual(self.client.get('/page').content, b'one')
+        self.assertEqual(LOADS, ['one'])
+        self.assertEqual(caches.stats()['data_modules']['hits'], 1)
+
+    @override_settings(DOCROOT_DATA_CACHE='mtime')
+    def test_reloaded_after_change(self):
+        self.client.get('/page')
+        self.write('page.data.py', data('two'), mtime=1)
+        self.assertEqual(self.client.get('/page').content, b'two')
+        self.assertEqual(LOADS, ['one', 'two'])
+
+    @override_settings(DOCROOT_DATA_CACHE='never')
+    def test_watcher_event_reloads(self):
+        self.client.get('/page')
+        self.write('page.data.py', data('two'), mtime=1)
+        self.assertEqual(self.client.get('/page').content, b'one')
+        watcher.publish(watcher.Event(watcher.MODIFIED, self.path('page.data.py'), False))
+        self.assertEqual(self.client.get('/page').content, b'two')
+        self.assertEqual(LOADS, ['one', 'two'])
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from .base import DocrootTestCase
+from .. import coalesce
+
+
+class CoalesceTests(DocrootTestCase):
+    settings = {'DOCROOT_COALESCE_TIMEOUT': 5}
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get('/page')
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return HttpResponse(f'render {self.renders}')
+
+    def test_followers_share_the_leaders_response(self):
+        release = threading.Event()
+        responses = []
+
+        def slow_render():
+            release.wait(5)
+            return self.render()
+
+        def request():
+            responses.append(coalesce.run('key', self.request, slow_render).content)
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while coalesce.stats()['followers'] < 4:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(responses, [b'render 1'] * 5)
+
+    def test_no_key_renders_every_request(self):
+        coalesce.run(None, self.request, self.render)
+        coalesce.run(None, self.request, self.render)
+        self.assertEqual(self.renders, 2)
+
+    async def test_async_followers_wait_on_the_event_loop(self):
+        release = asyncio.Event()
+
+        async def slow_render():
+            await release.wait()
+            return self.render()
+
+        threads = threading.active_count()
+        tasks = [asyncio.ensure_future(coalesce.arun('key', self.request, slow_render)) for _ in range(200)]
+        await asyncio.sleep(0.01)
+        flight = coalesce._flights['key']
+        self.assertEqual(len(flight.waiters), 199)
+        self.assertEqual(threading.active_count(), threads)
+        release.set()
+        responses = await asyncio.gather(*tasks)
+        self.assertEqual(self.renders, 1)
+        self.assertEqual({response.content for response in responses}, {b'render 1'})
+        self.assertEqual(flight.waiters, [])
+
+    async def test_async_follower_of_a_thread(self):
+        flight, leader = coalesce.join('key')
+        follower = asyncio.ensure_future(coalesce.arun('key', self.request, None))
+        await asyncio.sleep(0)
+        flight.snapshot = coalesce.take_snapshot(self.request, HttpResponse('shared'), False)
+        await asyncio.to_thread(coalesce.land, 'key', flight)
+        self.assertEqual((await follower).content, b'shared')
+
+    async def test_async_follower_gives_up(self):
+        coalesce.join('key')
+        with override_settings(DOCROOT_COALESCE_TIMEOUT=0.01):
+            async def arender():
+                return self.render()
+            response = await coalesce.arun('key', self.request, arender)
+        self.assertEqual(response.content, b'render 1')
+        self.assertEqual(coalesce._flights['key'].waiters, [])
+
+    def test_pages_showing_messages_are_not_shared(self):
+        self.assertIsNotNone(coalesce.take_snapshot(self.request, HttpResponse('shared'), False))
+        self.request._messages = CookieStorage(self.request)
+        messages.info(self.request, 'secret')
+        self.assertIsNone(coalesce.take_snapshot(self.request, HttpResponse('secret'), False))
+
+    def test_visitors_with_pending_messages_are_not_coalesced(self):
+        data = SimpleNamespace(coalesce=True)
+        self.assertIsNotNone(coalesce.get_key(self.request, data))
+        self.request.COOKIES[CookieStorage.cookie_name] = 'pending'
+        self.assertIsNone(coalesce.get_key(self.request, data))
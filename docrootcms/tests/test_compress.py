@@ -0,0 +1,46 @@
+import os
+import gzip
+import json
+
+from .base import DocrootTestCase
+from .. import compress
+
+CSS = 'body { color: red; }\n' * 200
+
+
+class CompressTests(DocrootTestCase):
+    files = {
+        'site.css': CSS,
+        'small.css': 'a{}',
+        'logo.png': CSS,
+    }
+    settings = {'DOCROOT_COMPRESS_MIN_SIZE': 1024}
+
+    def test_writes_copies_of_compressible_files(self):
+        report = compress.compress(workers=1)
+        self.assertEqual((report['files'], report['compressed'], report['failed']), (1, 1, {}))
+        with open(self.path('site.css.gz'), 'rb') as fp:
+            self.assertEqual(gzip.decompress(fp.read()).decode(), CSS)
+        self.assertFalse(os.path.exists(self.path('small.css.gz')))
+        self.assertFalse(os.path.exists(self.path('logo.png.gz')))
+        self.assertEqual(compress.compress(workers=1)['unchanged'], 1)
+
+    def test_a_broken_symlink_is_reported(self):
+        os.symlink(self.path('missing.css'), self.path('gone.css'))
+        report = compress.compress(workers=1)
+        self.assertIn('FileNotFoundError', report['failed']['gone.css'])
+        self.assertEqual(report['compressed'], 1)
+
+    def test_incompressible_files_are_only_tried_again_when_they_change(self):
+        self.write('font.ttf', os.urandom(4096), mtime=1700000000)
+        report = compress.compress(workers=1)
+        self.assertEqual((report['compressed'], report['incompressible']), (2, 1))
+        self.assertFalse(os.path.exists(self.path('font.ttf.gz')))
+        with open(self.path(compress.MANIFEST_NAME), encoding='utf-8') as fp:
+            self.assertEqual(json.load(fp)['incompressible']['font.ttf']['encodings'], sorted(compress.get_encodings()))
+        report = compress.compress(workers=1)
+        self.assertEqual((report['compressed'], report['unchanged']), (0, 2))
+        self.write('font.ttf', CSS, mtime=1700000001)
+        report = compress.compress(workers=1)
+        self.assertEqual((report['compressed'], report['incompressible']), (1, 0))
+        self.assertTrue(os.path.exists(self.path('font.ttf.gz')))
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.db import connections
+
+from docrootcms import contextloaders
+
+from .base import DocrootTestCase
+
+CONCURRENT_DATA = '''import threading
+
+# each loader waits for the other so the page only renders when they run at the same time
+barrier = threading.Barrier(2, timeout=5)
+
+def load_products(request):
+    barrier.wait()
+    return ['tea', 'cake']
+
+def load_news(request):
+    barrier.wait()
+    return 'open late'
+
+context = {'title': 'shop'}
+loaders = {'products': load_products, 'news': load_news}
+'''
+
+ASYNC_DATA = '''import asyncio
+
+async def load_products(request):
+    await asyncio.sleep(0)
+    return ['tea']
+
+def load_news(request):
+    return request.GET.get('news', 'none')
+
+def get_context(request):
+    return {'title': 'async shop'}
+
+loaders = {'products': load_products, 'news': load_news}
+'''
+
+FAILING_DATA = '''def broken(request):
+    raise ValueError('no news')
+
+loaders = {'news': broken, 'products': lambda request: []}
+'''
+
+TEMPLATE = '{{ title }}: {{ products|join:"," }} / {{ news }}'
+
+
+class ContextLoaderTests(DocrootTestCase):
+    files = {
+        'shop.dt': TEMPLATE,
+        'shop.data.py': CONCURRENT_DATA,
+        'ashop.dt': TEMPLATE,
+        'ashop.data.py': ASYNC_DATA,
+        'broken.dt': TEMPLATE,
+        'broken.data.py': FAILING_DATA,
+    }
+
+    def test_loaders_run_concurrently(self):
+        self.assertEqual(self.client.get('/shop').content, b'shop: tea,cake / open late')
+
+    async def test_async_loaders(self):
+        response = await self.async_client.get('/ashop', {'news': 'hot'})
+        self.assertEqual(response.content, b'async shop: tea / hot')
+
+    def test_sync_view_runs_async_loaders(self):
+        self.assertEqual(self.client.get('/ashop').content, b'async shop: tea / none')
+
+    def test_a_failing_loader_fails_the_page(self):
+        with self.assertRaises(ValueError):
+            self.client.get('/broken')
+
+    def test_pool_threads_keep_their_persistent_connections(self):
+        with mock.patch.object(contextloaders, 'close_old_connections') as close_old_connections, \
+                mock.patch.object(connections, 'close_all') as close_all:
+            self.assertEqual(contextloaders.call_loader(lambda request: 'ok', None), 'ok')
+        close_old_connections.assert_called_once_with()
+        close_all.assert_not_called()
@@ -0,0 +1,124 @@
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory
+
+from .base import DocrootTestCase, later, wait_for_refreshes
+from ..decorators import cached_context, flush_context_cache, lazy
+
+
+class CachedContextTests(DocrootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+
+    def get(self, path='/page', **extra):
+        return RequestFactory().get(path, **extra)
+
+    def counted(self, **options):
+        @cached_context(namespace='tests/page.html', **options)
+        def get_context(request):
+            self.calls += 1
+            return {'calls': self.calls}
+        return get_context
+
+    def test_cached_per_vary_values(self):
+        get_context = self.counted(vary_on_query=['page'], vary_on_headers=['X-Region'])
+        self.assertEqual(get_context(self.get()), {'calls': 1})
+        self.assertEqual(get_context(self.get('/page?other=1')), {'calls': 1})
+        self.assertEqual(get_context(self.get('/page?page=2')), {'calls': 2})
+        self.assertEqual(get_context(self.get(HTTP_X_REGION='eu')), {'calls': 3})
+        self.assertEqual(get_context(self.get('/page?page=2')), {'calls': 2})
+
+    def test_vary_on_attributes(self):
+        get_context = self.counted(vary_on_attributes=['user.pk'])
+        first, second = self.get(), self.get()
+        first.user = type('User', (), {'pk': 1})()
+        second.user = type('User', (), {'pk': 2})()
+        self.assertEqual(get_context(first), {'calls': 1})
+        self.assertEqual(get_context(second), {'calls': 2})
+
+    def test_writes_are_not_cached(self):
+        get_context = self.counted()
+        get_context(RequestFactory().post('/page'))
+        get_context(RequestFactory().post('/page'))
+        self.assertEqual(self.calls, 2)
+
+    def test_flush(self):
+        get_context = self.counted()
+        get_context(self.get())
+        flush_context_cache('tests/page.html')
+        self.assertEqual(get_context(self.get()), {'calls': 2})
+
+    def test_responses(self):
+        @cached_context(namespace='tests/api.html', vary_on_query=['cookie'])
+        def get(request):
+            self.calls += 1
+            response = HttpResponse(f'call {self.calls}', content_type='text/plain')
+            if request.GET.get('cookie'):
+                response.set_cookie('seen', '1')
+            return response
+
+        self.assertEqual(get(self.get()).content, b'call 1')
+        self.assertEqual(get(self.get()).content, b'call 1')
+        self.assertEqual(get(self.get()).get('Content-Type'), 'text/plain')
+        get(self.get('/?cookie=1'))
+        self.assertEqual(get(self.get('/?cookie=1')).content, b'call 3')
+
+    async def test_async_functions(self):
+        @cached_context(namespace='tests/async.html')
+        async def get_context(request):
+            self.calls += 1
+            return {'calls': self.calls}
+
+        self.assertEqual(await get_context(self.get()), {'calls': 1})
+        self.assertEqual(await get_context(self.get()), {'calls': 1})
+
+
+class LazyTests(DocrootTestCase):
+
+    def test_only_evaluated_when_used(self):
+        calls = []
+        value = lazy(lambda: calls.append(1) or 'value')
+        self.assertEqual(Template('{% if show %}{{ value }} {{ value }}{% endif %}').render(
+            Context({'value': value, 'show': False})), '')
+        self.assertEqual(calls, [])
+        self.assertEqual(Template('{{ value }} {{ value }}').render(Context({'value': value})), 'value value')
+        self.assertEqual(calls, [1])
+
+
+class StaleContextTests(DocrootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+        self.fail = False
+
+    def counted(self, **options):
+        @cached_context(namespace='tests/stale.html', timeout=10, **options)
+        def get_context(request):
+            if self.fail:
+                raise ValueError('down')
+            self.calls += 1
+            return {'calls': self.calls}
+        return get_context
+
+    def test_stale_while_revalidate(self):
+        get_context = self.counted(stale_while_revalidate=100)
+        request = RequestFactory().get('/')
+        get_context(request)
+        with later(20):
+            self.assertEqual(get_context(request), {'calls': 1})
+            wait_for_refreshes()
+            self.assertEqual(get_context(request), {'calls': 2})
+
+    def test_stale_if_error(self):
+        get_context = self.counted(stale_if_error=100)
+        request = RequestFactory().get('/')
+        get_context(request)
+        self.fail = True
+        with later(20):
+            with self.assertLogs('docrootcms.decorators', 'ERROR'):
+                self.assertEqual(get_context(request), {'calls': 1})
+        with later(200), self.assertRaises(ValueError):
+            get_context(request)
@@ -0,0 +1,79 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+from django.conf import settings
+
+from .base import DocrootTestCase
+from .. import export
+from ..cms import Template
+
+
+def crash(uri, language_code, out_file):
+    os._exit(1)
+
+
+class ExportTests(DocrootTestCase):
+    files = {
+        'index.dt': 'home',
+        'about/team.dt': 'team',
+        'broken.dt': 'broken',
+        'broken.data.py': 'def get_context(request:\n',
+        'visitor.dt': 'hello {{ name }}',
+        'visitor.data.py': 'def get_context(request):\n    return {"name": request.GET.get("name")}\n',
+        'news.dt': '{{ news }}',
+        'news.data.py': 'loaders = {"news": lambda request: request.GET.get("topic")}\n',
+        'form.dt': '<form method="post">{% csrf_token %}</form>',
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.out_dir = tempfile.mkdtemp(prefix='docrootcms-export-')
+        self.addCleanup(shutil.rmtree, self.out_dir, True)
+
+    def read(self, uri):
+        with open(os.path.join(self.out_dir, uri)) as fp:
+            return fp.read()
+
+    def test_export(self):
+        manifest = export.export(self.out_dir, workers=1)
+        self.assertEqual(self.read('index.html'), 'home')
+        self.assertEqual(self.read('about/team.html'), 'team')
+        self.assertEqual(manifest['rendered'], 2)
+        with open(os.path.join(self.out_dir, export.MANIFEST_NAME)) as fp:
+            self.assertEqual(json.load(fp)['rendered'], 2)
+        self.assertEqual(sorted(export.export(self.out_dir, workers=1)['unchanged']), ['about/team.html', 'index.html'])
+
+    def test_a_data_file_that_does_not_parse_fails_only_its_page(self):
+        manifest = export.export(self.out_dir, workers=1)
+        self.assertIn('SyntaxError', manifest['failed']['broken.html'])
+        self.assertIn('index.html', manifest['pages'])
+
+    def test_request_dependent_pages_are_skipped(self):
+        manifest = export.export(self.out_dir, workers=1)
+        self.assertIn('visitor.html', manifest['skipped'])
+        self.assertIn('news.html', manifest['skipped'])
+        self.write('visitor.data.py', 'export = True\n' + self.files['visitor.data.py'])
+        self.assertIn('visitor.html', export.export(self.out_dir, workers=1)['pages'])
+
+    def test_csrf_token_pages_are_skipped(self):
+        manifest = export.export(self.out_dir, workers=1)
+        self.assertIn('csrf_token', manifest['skipped']['form.html'])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, 'form.html')))
+
+    def test_pages_are_not_exported_from_the_page_cache(self):
+        self.write('cached.dt', 'old')
+        self.write('cached.data.py', 'cache_timeout = 60\n')
+        self.assertEqual(Template('/cached', settings.LANGUAGE_CODE).render().content, b'old')
+        # changed without a watcher to invalidate the cached copy
+        self.write('cached.dt', 'new')
+        export.export(self.out_dir, workers=1)
+        self.assertEqual(self.read('cached.html'), 'new')
+
+    def test_a_dead_worker_is_reported_per_page(self):
+        with mock.patch.object(export, 'render_page', crash):
+            manifest = export.export(self.out_dir, workers=1)
+        self.assertIn('BrokenProcessPool', manifest['failed']['index.html'])
+        self.assertIn('BrokenProcessPool', manifest['failed']['about/team.html'])
+        self.assertEqual(manifest['rendered'], 0)
@@ -0,0 +1,67 @@
+from django.test import override_settings
+
+from .base import MIDDLEWARE, DocrootTestCase
+from .. import misses
+from .. import watcher
+from ..middleware import DocrootFallbackMiddleware
+
+PAGES = {'view/index.dt': 'from the docroot', 'about.dt': 'about', 'robots.txt': 'robots'}
+
+
+class FallbackTests(DocrootTestCase):
+    files = PAGES
+
+    def test_url_patterns_win(self):
+        self.assertEqual(self.client.get('/view/').content, b'from the url pattern')
+
+    def test_docroot_answers_404s(self):
+        self.assertEqual(self.client.get('/about').content, b'about')
+        self.assertEqual(b''.join(self.client.get('/robots.txt').streaming_content), b'robots')
+        self.assertEqual(self.client.get('/missing').status_code, 404)
+
+    async def test_async(self):
+        self.assertEqual((await self.async_client.get('/view/')).content, b'from the url pattern')
+        self.assertEqual((await self.async_client.get('/about')).content, b'about')
+        self.assertEqual((await self.async_client.get('/missing')).status_code, 404)
+
+
+class PreDispatchTests(DocrootTestCase):
+    files = PAGES
+    settings = {'DOCROOT_PRE_DISPATCH': True}
+
+    def test_docroot_wins(self):
+        self.assertEqual(self.client.get('/view/').content, b'from the docroot')
+        self.assertEqual(self.client.get('/about').content, b'about')
+        self.assertEqual(self.client.get('/missing').status_code, 404)
+
+    async def test_async(self):
+        self.assertEqual((await self.async_client.get('/view/')).content, b'from the docroot')
+
+    def test_middleware_order_is_checked(self):
+        late = [MIDDLEWARE[-1]] + MIDDLEWARE[:-1]
+        with override_settings(MIDDLEWARE=late), self.assertLogs('docroot.middleware', 'WARNING'):
+            DocrootFallbackMiddleware(lambda request: None)
+
+
+class MissCacheTests(DocrootTestCase):
+    files = {'about.dt': 'about'}
+    settings = {'DOCROOT_MISS_CACHE_SIZE': 2}
+
+    def test_repeated_misses_are_remembered(self):
+        self.client.get('/wp-admin/')
+        self.client.get('/wp-admin/')
+        self.assertEqual(misses.stats()['hits'], 1)
+        self.assertEqual(self.client.get('/about').content, b'about')
+        self.assertEqual(misses.stats()['size'], 1)
+
+    def test_bounded(self):
+        for path in ('/a', '/b', '/c'):
+            self.client.get(path)
+        self.assertEqual((misses.stats()['size'], misses.stats()['evictions']), (2, 1))
+
+    def test_changes_clear_the_cache(self):
+        self.assertEqual(self.client.get('/new').status_code, 404)
+        self.write('new.dt', 'new')
+        self.assertEqual(self.client.get('/new').status_code, 404)
+        watcher.publish(watcher.Event(watcher.CREATED, self.path('new.dt'), False))
+        self.assertEqual(self.client.get('/new').content, b'new')
@@ -0,0 +1,184 @@
+import os
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+from .base import DocrootTestCase, DocrootDatabaseTestCase, later, wait_for_refreshes
+from .. import pagecache
+from .. import watcher
+
+COUNTING_DATA = '''import time
+cache_timeout = 60
+
+def get_context(request):
+    return {'stamp': time.time_ns()}
+'''
+
+
+class PageCacheTests(DocrootTestCase):
+    files = {
+        'page.dt': '{{ stamp }}',
+        'page.data.py': COUNTING_DATA,
+        'static.dt': 'static {{ stamp }}',
+    }
+
+    def test_cached_until_a_dependency_changes(self):
+        first = self.client.get('/page').content
+        self.assertEqual(self.client.get('/page').content, first)
+        pagecache.on_change(watcher.Event(watcher.MODIFIED, self.path('page.dt'), False))
+        self.assertNotEqual(self.client.get('/page').content, first)
+
+    def test_vary_on_query_by_default(self):
+        first = self.client.get('/page?a=1').content
+        self.assertNotEqual(self.client.get('/page?a=2').content, first)
+        self.assertEqual(self.client.get('/page?a=1').content, first)
+
+    def test_pages_without_a_policy_are_not_cached(self):
+        self.write('page.data.py', COUNTING_DATA.replace('cache_timeout = 60', ''))
+        self.assertNotEqual(self.client.get('/page').content, self.client.get('/page').content)
+
+
+SESSION_DATA = '''import time
+cache_timeout = 60
+
+def get_context(request):
+    return {'stamp': time.time_ns(), 'visits': request.session.get('visits', 0)}
+'''
+
+
+class PrivatePageTests(DocrootDatabaseTestCase):
+    files = {
+        'page.dt': '{{ stamp }}',
+        'page.data.py': COUNTING_DATA,
+        'form.dt': '{% csrf_token %}{{ stamp }}',
+        'form.data.py': COUNTING_DATA,
+        'session.dt': '{{ visits }} {{ stamp }}',
+        'session.data.py': SESSION_DATA,
+    }
+
+    def assertNotCached(self, url):
+        self.assertNotEqual(self.client.get(url).content, self.client.get(url).content)
+
+    def test_logged_in_users_are_not_served_or_stored(self):
+        self.client.force_login(User.objects.create_user('visitor', password='secret'))
+        self.assertNotCached('/page')
+        self.client.logout()
+        anonymous = self.client.get('/page').content
+        self.assertEqual(self.client.get('/page').content, anonymous)
+        self.client.force_login(User.objects.get(username='visitor'))
+        self.assertNotEqual(self.client.get('/page').content, anonymous)
+
+    def test_pages_using_the_csrf_token_are_not_cached(self):
+        self.assertNotCached('/form')
+
+    def test_pages_reading_the_session_are_not_cached(self):
+        self.assertNotCached('/session')
+
+
+MESSAGES_DATA = '''import time
+from django.contrib import messages
+cache_timeout = 60
+cache_vary_on_query = []
+
+def get_context(request):
+    if 'say' in request.GET:
+        messages.info(request, request.GET['say'])
+    return {'stamp': time.time_ns()}
+'''
+
+
+class FlashMessageTests(DocrootTestCase):
+    files = {
+        'notice.dt': '{% for message in messages %}{{ message }}{% endfor %} {{ stamp }}',
+        'notice.data.py': MESSAGES_DATA,
+        'quiet.dt': '{{ stamp }}',
+        'quiet.data.py': MESSAGES_DATA,
+    }
+    settings = {
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+        'TEMPLATES': [{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'APP_DIRS': True,
+                       'OPTIONS': {'context_processors': ['django.template.context_processors.request',
+                                                          'django.contrib.messages.context_processors.messages']}}],
+    }
+
+    def test_pages_showing_messages_are_not_stored(self):
+        self.assertIn(b'secret for a', self.client.get('/notice', {'say': 'secret for a'}).content)
+        self.assertNotIn(b'secret', self.client_class().get('/notice').content)
+
+    def test_visitors_with_pending_messages_are_not_served_from_the_cache(self):
+        shared = self.client.get('/notice').content
+        visitor = self.client_class()
+        visitor.get('/quiet', {'say': 'secret for a'})
+        self.assertIn(b'secret for a', visitor.get('/notice').content)
+        self.assertEqual(self.client.get('/notice').content, shared)
+
+
+class AutomaticPolicyTests(DocrootTestCase):
+    files = {
+        'static.dt': 'static {{ stamp }}',
+        'static.data.py': 'import time\ncontext = {"stamp": time.time_ns()}\n',
+        'loaded.dt': 'loaded {{ stamp }}',
+        'loaded.data.py': 'import time\nloaders = {"stamp": lambda request: time.time_ns()}\n',
+    }
+    settings = {'DOCROOT_PAGE_CACHE_TIMEOUT': 60}
+
+    def test_static_context_pages_are_cached(self):
+        self.assertEqual(self.client.get('/static').content, self.client.get('/static').content)
+
+    def test_loaders_pages_are_not_cached(self):
+        self.assertNotEqual(self.client.get('/loaded').content, self.client.get('/loaded').content)
+
+    def test_loaders_pages_with_a_timeout_are_cached(self):
+        self.write('loaded.data.py', 'cache_timeout = 60\n' + self.files['loaded.data.py'])
+        self.assertEqual(self.client.get('/loaded').content, self.client.get('/loaded').content)
+
+
+STALE_DATA = '''import os
+import time
+cache_timeout = 10
+cache_stale_while_revalidate = 100
+cache_stale_if_error = 1000
+
+def get_context(request):
+    if os.path.exists(os.path.join(os.path.dirname(__file__), 'down')):
+        raise ValueError('down')
+    return {'stamp': time.time_ns()}
+'''
+
+
+class StalePageTests(DocrootTestCase):
+    files = {'page.dt': '{{ stamp }}', 'page.data.py': STALE_DATA}
+
+    def test_stale_while_revalidate(self):
+        first = self.client.get('/page').content
+        with later(20):
+            self.assertEqual(self.client.get('/page').content, first)
+            wait_for_refreshes()
+            second = self.client.get('/page').content
+            self.assertNotEqual(second, first)
+            self.assertEqual(self.client.get('/page').content, second)
+
+    def test_stale_if_error(self):
+        first = self.client.get('/page').content
+        self.write('down', '')
+        with later(500), self.assertLogs('docrootcms.cms', 'ERROR'):
+            self.assertEqual(self.client.get('/page').content, first)
+        os.remove(self.path('down'))
+
+
+class InvalidateTests(DocrootTestCase):
+
+    def any_template_generation(self):
+        return caches['default'].get(pagecache.ANY_TEMPLATE_GENERATION_KEY)
+
+    def test_assets_leave_dynamic_template_pages_alone(self):
+        for name in ('site.css', 'logo.png', 'site.css.gz', 'site.css.br', 'page.data.py'):
+            pagecache.invalidate(self.path(name))
+            self.assertIsNone(self.any_template_generation(), name)
+        self.assertIsNotNone(caches['default'].get(pagecache.generation_key(self.path('site.css'))))
+
+    def test_templates_invalidate_dynamic_template_pages(self):
+        pagecache.invalidate(self.path('page.dt'))
+        first = self.any_template_generation()
+        self.assertIsNotNone(first)
+        pagecache.invalidate(self.path('dt.inc/_layout.html'))
+        self.assertNotEqual(self.any_template_generation(), first)
@@ -0,0 +1,46 @@
+import os
+
+from .base import DocrootTestCase
+from .. import caches
+from .. import preload
+import docrootcms
+
+
+class WarmTests(DocrootTestCase):
+    files = {
+        'index.dt': 'home',
+        'page.dt': '{{ title }}',
+        'page.data.py': "context = {'title': 'warm'}\n",
+        'sub/other.dt': 'other',
+        'style.css': 'body {}',
+    }
+    settings = {'DOCROOT_TEMPLATE_CACHE': 'mtime', 'DOCROOT_DATA_CACHE': 'mtime'}
+
+    def test_requests_use_the_warmed_caches(self):
+        report = docrootcms.warm()
+        self.assertEqual((report.count(preload.TEMPLATE), report.count(preload.DATA), report.failures), (3, 1, []))
+        self.assertEqual(self.client.get('/page').content, b'warm')
+        self.assertEqual(self.client.get('/sub/other').content, b'other')
+        stats = caches.stats()
+        self.assertEqual((stats['templates']['misses'], stats['templates']['hits']), (3, 2))
+        # sub/other has no data file; only page.data.py was warmed
+        self.assertEqual(stats['data_modules']['hits'], 1)
+
+    def test_failures_are_reported_per_file(self):
+        self.write('broken.dt', '{% if %}')
+        self.write('broken.data.py', 'def (')
+        report = docrootcms.warm()
+        failed = {os.path.basename(result.file_name): result.kind for result in report.failures}
+        self.assertEqual(failed, {'broken.dt': preload.TEMPLATE, 'broken.data.py': preload.DATA})
+        self.assertIn('2 failures', str(report))
+        self.assertEqual(self.client.get('/page').content, b'warm')
+
+
+class WarmWithoutCachesTests(DocrootTestCase):
+    files = {'page.dt': 'page', 'page.data.py': "context = {}\n"}
+
+    def test_data_files_are_byte_compiled(self):
+        report = docrootcms.warm()
+        self.assertEqual(report.failures, [])
+        self.assertTrue(os.listdir(self.path('__pycache__')))
+        self.assertIsNone(caches.stats()['templates'])
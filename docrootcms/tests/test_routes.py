@@ -0,0 +1,86 @@
+import os
+from unittest import mock
+from django.test import RequestFactory, override_settings
+
+from .base import DocrootTestCase
+from .. import routes
+from .. import views
+
+
+class RouteIndexTests(DocrootTestCase):
+    files = {
+        'a.txt': 'a',
+        'shop/index.dt': 'shop',
+        'shop/items.data.py': 'def GET(request):\n    return {"items": []}\n',
+    }
+    settings = {'DOCROOT_ROUTE_INDEX': True}
+
+    def test_isfile_matches_the_filesystem(self):
+        index = routes.get_index()
+        self.assertTrue(index.isfile(self.path('a.txt')))
+        self.assertTrue(index.isfile(self.path('shop/index.dt')))
+        self.assertFalse(index.isfile(self.path('missing.txt')))
+        self.assertFalse(index.isfile(self.path('shop')))
+
+    def test_trailing_separator_is_not_a_file(self):
+        self.assertFalse(os.path.isfile(self.path('a.txt') + '/'))
+        self.assertFalse(routes.isfile(self.path('a.txt') + '/'))
+
+    def test_paths_outside_the_docroot_are_not_files(self):
+        outside = os.path.join(os.path.dirname(self.docroot), 'outside.txt')
+        self.assertFalse(routes.isfile(outside))
+        self.assertFalse(routes.isfile(os.path.join(self.docroot, '..', os.path.basename(self.docroot), '..', 'x')))
+        # a path that normalises back into the docroot is still found
+        self.assertTrue(routes.isfile(os.path.join(self.docroot, 'shop', '..', 'a.txt')))
+
+    def test_url_forms(self):
+        index = routes.get_index()
+        self.assertIn('/shop/', index.routes)
+        self.assertIn(routes.PAGE, index.routes['/shop/index.html'])
+        self.assertIn(routes.API, index.routes['/shop/items.json'])
+        self.assertIn(routes.API, index.routes['/shop/items'])
+
+    def test_requests_resolve_to_their_kinds(self):
+        def kinds(path):
+            return routes.request_kinds(RequestFactory().get(path))
+        self.assertEqual(kinds('/a.txt'), {routes.STATIC})
+        self.assertEqual(kinds('/shop/'), {routes.PAGE})
+        self.assertEqual(kinds('/shop/items'), {routes.API})
+        self.assertEqual(kinds('/missing'), set())
+
+    @override_settings(IGNORE_LANGUAGE_PREFIX=False, APPEND_SLASH=True)
+    def test_language_prefix_and_appended_slash(self):
+        request = RequestFactory().get('/en/shop/items/')
+        request.LANGUAGE_CODE = 'en'
+        self.assertEqual(routes.request_kinds(request), {routes.API})
+
+    def test_only_the_views_that_can_answer_run(self):
+        with mock.patch.object(views, 'page') as page, mock.patch.object(views, 'api') as api:
+            self.assertEqual(b''.join(self.client.get('/a.txt').streaming_content), b'a')
+            self.assertEqual(self.client.get('/missing').status_code, 404)
+        page.assert_not_called()
+        api.assert_not_called()
+        self.assertEqual(self.client.get('/shop/items.json').status_code, 200)
+
+    def test_static_view_with_trailing_slash(self):
+        request = RequestFactory().get('/a.txt/')
+        self.assertIsNone(views.static(request))
+        self.assertEqual(self.client.get('/a.txt/').status_code, 404)
+
+    def test_save_and_load(self):
+        index_file = self.path('../index.json')
+        routes.build_index(index_file, rescan=True)
+        self.addCleanup(os.remove, index_file)
+        index = routes.RouteIndex(self.docroot)
+        self.assertTrue(index.load(index_file))
+        self.assertTrue(index.isfile(self.path('a.txt')))
+
+
+class RouteIndexDisabledTests(DocrootTestCase):
+    files = {'a.txt': 'a'}
+
+    def test_falls_back_to_the_filesystem(self):
+        self.assertIsNone(routes.get_index())
+        self.assertTrue(routes.isfile(self.path('a.txt')))
+        self.assertEqual(self.client.get('/a.txt/').status_code, 404)
+        self.assertEqual(b''.join(self.client.get('/a.txt').streaming_content), b'a')
@@ -0,0 +1,43 @@
+from django.template import Context, Engine
+from django.test import SimpleTestCase
+
+from .. import streaming
+
+TEMPLATES = {
+    'base.html': '<html><head><title>{% block title %}base{% endblock %}</title></head>'
+                 '<body>{% block body %}{% endblock %}</body></html>',
+    'page.html': '{% extends "base.html" %}{% block title %}page{% endblock %}'
+                 '{% block body %}{% for i in items %}<p>{{ i }}</p>{% endfor %}{% endblock %}',
+    'leading.html': '<!-- before -->\n{% extends "page.html" %}{% block title %}{{ block.super }} too{% endblock %}',
+    'plain.html': 'no {{ layout }} here',
+}
+
+
+class StreamingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.engine = Engine(loaders=[('django.template.loaders.locmem.Loader', TEMPLATES)])
+
+    def assertStreamsLikeRender(self, name):
+        template = self.engine.get_template(name)
+        context = {'items': range(50), 'layout': 'layout'}
+        expected = template.render(Context(context))
+        pieces = list(streaming.iter_render(template, Context(context)))
+        self.assertEqual(''.join(pieces), expected)
+        return pieces
+
+    def test_output_matches_render(self):
+        for name in TEMPLATES:
+            with self.subTest(name):
+                self.assertStreamsLikeRender(name)
+
+    def test_text_before_extends_is_sent(self):
+        pieces = self.assertStreamsLikeRender('leading.html')
+        self.assertTrue(''.join(pieces).startswith('<!-- before -->\n<html>'))
+
+    def test_head_is_flushed_first(self):
+        pieces = self.assertStreamsLikeRender('page.html')
+        chunks = list(streaming.iter_chunks(pieces, 64))
+        self.assertTrue(chunks[0].endswith('</head><body>'))
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(''.join(chunks), ''.join(pieces))
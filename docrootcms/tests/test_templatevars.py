@@ -0,0 +1,50 @@
+from django.template import Engine
+
+from .base import DocrootTestCase
+from .. import templatevars
+
+TEMPLATES = {
+    'base.html': '<title>{{ title }}</title>{% block body %}{% endblock %}{% include "footer.html" %}',
+    'footer.html': '{{ footer.text|default:fallback }}',
+    'page.html': '{% extends "base.html" %}{% block body %}{% for p in products %}{{ p.name }}{% endfor %}'
+                 '{% if news and not hidden %}{{ news }}{% endif %}{% endblock %}',
+    'dynamic.html': '{% include template_name %}',
+    'debug.html': '{% debug %}',
+}
+
+UNUSED_LOADER_DATA = '''calls = []
+
+def expensive(request):
+    calls.append(request)
+    raise AssertionError('the template never reads this')
+
+loaders = {'used': lambda request: 'used', 'unused': expensive}
+'''
+
+
+class AnalyzeTests(DocrootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.engine = Engine(loaders=[('django.template.loaders.locmem.Loader', TEMPLATES)])
+
+    def analyze(self, name):
+        return templatevars.analyze(self.engine.get_template(name))
+
+    def test_keys_across_extends_and_includes(self):
+        report = self.analyze('page.html')
+        self.assertTrue(report.complete)
+        # loop variables are reported too; extra keys only mean a loader runs that could have been skipped
+        self.assertEqual(report.keys, {'title', 'footer', 'fallback', 'products', 'p', 'news', 'hidden'})
+        self.assertEqual(set(report.templates), {'base.html', 'footer.html'})
+
+    def test_incomplete_reports(self):
+        self.assertFalse(self.analyze('dynamic.html').complete)
+        self.assertFalse(self.analyze('debug.html').complete)
+
+
+class UnusedLoaderTests(DocrootTestCase):
+    files = {'page.dt': '{{ used }}', 'page.data.py': UNUSED_LOADER_DATA}
+
+    def test_loaders_the_template_never_reads_are_skipped(self):
+        self.assertEqual(self.client.get('/page').content, b'used')
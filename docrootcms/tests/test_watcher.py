@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+from .base import DocrootTestCase
+from .. import routes
+from .. import watcher
+
+
+class WatcherTests(DocrootTestCase):
+    files = {'a.txt': 'a', 'sub/b.txt': 'b'}
+
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        watcher.subscribe(self.events.append)
+        self.addCleanup(watcher.unsubscribe, self.events.append)
+
+    def changes(self, instance):
+        # inotify may need a couple of reads to see everything
+        for _ in range(5):
+            instance.run_once()
+        return {(event.kind, os.path.relpath(event.file_name, self.docroot)) for event in self.events}
+
+    def change_files(self):
+        self.write('a.txt', 'changed', mtime=1)
+        self.write('new.txt', 'new')
+        os.remove(self.path('sub/b.txt'))
+
+    def assertChanges(self, instance):
+        self.change_files()
+        changes = self.changes(instance)
+        self.assertIn((watcher.MODIFIED, 'a.txt'), changes)
+        self.assertIn((watcher.CREATED, 'new.txt'), changes)
+        self.assertIn((watcher.DELETED, 'sub/b.txt'), changes)
+
+    def test_polling(self):
+        instance = watcher.PollingWatcher([self.docroot], interval=0.001)
+        self.assertChanges(instance)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is linux only')
+    def test_inotify(self):
+        instance = watcher.InotifyWatcher([self.docroot], interval=0.01)
+        self.addCleanup(instance.close)
+        self.assertChanges(instance)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is linux only')
+    def test_inotify_new_directories(self):
+        instance = watcher.InotifyWatcher([self.docroot], interval=0.01)
+        self.addCleanup(instance.close)
+        self.write('new/dir/c.txt', 'c')
+        changes = self.changes(instance)
+        self.assertIn((watcher.CREATED, 'new'), changes)
+        self.assertIn((watcher.CREATED, 'new/dir/c.txt'), changes)
+
+    def test_subscriber_errors_are_logged(self):
+        def broken(event):
+            raise ValueError('broken')
+        watcher.subscribe(broken)
+        self.addCleanup(watcher.unsubscribe, broken)
+        with self.assertLogs('docrootcms.watcher', 'ERROR'):
+            watcher.publish(watcher.Event(watcher.MODIFIED, self.path('a.txt'), False))
+        self.assertEqual(len(self.events), 1)
+
+
+class RouteIndexEventTests(DocrootTestCase):
+    files = {'a.txt': 'a'}
+    settings = {'DOCROOT_ROUTE_INDEX': True}
+
+    def test_index_follows_events(self):
+        self.assertFalse(routes.isfile(self.path('b.txt')))
+        self.write('b.txt', 'b')
+        watcher.publish(watcher.Event(watcher.CREATED, self.path('b.txt'), False))
+        self.assertTrue(routes.isfile(self.path('b.txt')))
+        os.remove(self.path('a.txt'))
+        watcher.publish(watcher.Event(watcher.DELETED, self.path('a.txt'), False))
+        self.assertFalse(routes.isfile(self.path('a.txt')))
@@ -0,0 +1,8 @@
+from django.http import HttpResponse
+from django.urls import path
+
+# every other request falls through to DocrootFallbackMiddleware; the docroot of the middleware tests has a view/
+#   page too
+urlpatterns = [
+    path('view/', lambda request: HttpResponse('from the url pattern')),
+]
@@ -18,6 +18,7 @@ from . import views
 
 urlpatterns = [
     path('content/', views.ContentApi.as_view(), name='cms_content'),
+    path('stats/', views.StatsApi.as_view(), name='cms_stats'),
     path('login', views.LoginFormView.as_view(), name="cms_login"),
     path('logout', views.LogoutView.as_view(), name="cms_logout"),
     path('auth', views.AuthenticateView.as_view(), name="cms_authenticate"),
@@ -5,6 +5,7 @@ import importlib.util
 import json
 import codecs
 import base64
+from asgiref.sync import sync_to_async
 from django.conf import settings
 # from django.template import Context
 from django.template import Template, Origin, RequestContext
@@ -24,6 +25,14 @@ from markdownx.views import ImageUploadView
 from .forms import LoginForm
 from .models import Content
 from .cms import TemplateMeta, ApiMeta
+from . import routes
+from . import assets
+from . import misses
+from . import caches
+from . import admission
+from . import coalesce
+from . import revalidate
+from . import hotfiles
 
 log = logging.getLogger("docrootcms.views")
 
@@ -46,7 +55,11 @@ def static(request):
     log.debug("path: " + path)
     file = os.path.join(docroot_dir, path)
     log.debug("file: " + file)
-    if os.path.isfile(file):
+    # hot files were looked up and passed the forbidden checks when they were cached
+    response = assets.serve_cached(request, file, path)
+    if response is not None:
+        return response
+    if routes.isfile(file):
         # for various reasons we don't want to serve up various file extensions. Let's look at a setting containing
         # extensions to ignore
         # USE CASE: Apache at root passes .htaccess, .dt and .py files through we don't want to show these static files
@@ -59,9 +72,7 @@ def static(request):
             elif os.path.basename(filename) in forbidden_file_names:
                 return HttpResponseForbidden()
         log.debug("found static file: " + file)
-        log.debug("downloading...")
-        response = FileResponse(open(file, 'rb'), content_type=mimetypes.guess_type(path)[0])
-        return response
+        return assets.serve(request, file, path)
     else:
         return None
 
@@ -88,6 +99,22 @@ def api(request):
     return meta.render()
 
 
+# async versions of the docroot views used by DocrootFallbackMiddleware under ASGI
+async def astatic(request):
+    # static can build the route index, read into the hot file cache or mmap, so keep it off the event loop
+    return await sync_to_async(static)(request)
+
+
+async def apage(request):
+    meta = TemplateMeta(request)
+    return await meta.arender()
+
+
+async def aapi(request):
+    meta = ApiMeta(request)
+    return await meta.arender()
+
+
 # class based view for getting and putting cms content
 class ContentApi(View):
     def get(self, request):
@@ -130,6 +157,22 @@ class ContentApi(View):
             return HttpResponse(status=204)
 
 
+# runtime statistics for the docroot caches of the worker process that answers; staff only
+class StatsApi(View):
+    def get(self, request):
+        if not request.user.is_staff:
+            return HttpResponseForbidden()
+        return JsonResponse({
+            'pid': os.getpid(),
+            'miss_cache': misses.stats(),
+            **caches.stats(),
+            'admission': admission.stats(),
+            'coalesce': coalesce.stats(),
+            'revalidate': revalidate.stats(),
+            'hot_files': hotfiles.stats(),
+        })
+
+
 # # AUTHENTICATION VIEWS
 #
 class LoginFormView(View):
@@ -0,0 +1,314 @@
+# Publishes created/modified/deleted events for the files under DOCROOT_ROOT and the dt.inc template directories so
+# the rest of the cms can keep derived state (route index, compiled templates, data modules etc.) in memory and drop
+# only the affected entries when we deploy with a git pull while the server is running.
+# Uses inotify on linux and falls back to polling file modification times everywhere else.
+# Enable with DOCROOT_WATCH = True ('inotify' or 'poll' to force one); DOCROOT_WATCH_INTERVAL is the poll interval.
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+from collections import namedtuple
+from django.conf import settings
+
+log = logging.getLogger("docrootcms.watcher")
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+# we lost track of what changed (inotify queue overflow, watched root removed); subscribers should drop everything
+RESET = 'reset'
+
+# file_name is always absolute; is_dir is set when a whole directory was created or deleted
+Event = namedtuple('Event', ['kind', 'file_name', 'is_dir'])
+
+_subscribers = []
+_subscribers_lock = threading.Lock()
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def subscribe(callback):
+    """
+        register callback(event) to be called from the watcher thread for every change; returns the callback so it
+        can be used as a decorator
+    """
+    with _subscribers_lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+    ensure_started()
+    return callback
+
+
+def unsubscribe(callback):
+    with _subscribers_lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def publish(event):
+    log.debug(f"publishing {event}")
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(event)
+        except Exception as ex:
+            log.exception(f"watcher subscriber {callback} failed for {event}: {ex}")
+
+
+def is_enabled():
+    return bool(getattr(settings, 'DOCROOT_WATCH', False))
+
+
+# the absolute directories we watch: the docroot plus any dt.inc template directories not already inside it
+def watch_roots():
+    candidates = [getattr(settings, "DOCROOT_ROOT", "")]
+    for engine in getattr(settings, 'TEMPLATES', []):
+        for template_dir in engine.get('DIRS', []):
+            if 'dt.inc' in str(template_dir):
+                candidates.append(template_dir)
+    roots = []
+    for candidate in candidates:
+        if not candidate:
+            continue
+        root = os.path.abspath(str(candidate))
+        if os.path.isdir(root) and not any(root == r or root.startswith(r + os.sep) for r in roots):
+            roots = [r for r in roots if not r.startswith(root + os.sep)]
+            roots.append(root)
+    return roots
+
+
+# starts the watcher for this process if it is enabled and anyone is listening; safe to call on every request
+#   NOTE: threads do not survive a fork so we check the pid and start a new one in each worker
+def ensure_started():
+    global _watcher
+    if not is_enabled() or not _subscribers:
+        return None
+    current = _watcher
+    if current is not None and current.pid == os.getpid():
+        return current
+    with _watcher_lock:
+        if _watcher is not None and _watcher.pid == os.getpid():
+            return _watcher
+        if _watcher is not None:
+            # inherited from our parent process; release anything it holds without touching the parent's thread
+            _watcher.close()
+        _watcher = create_watcher(watch_roots())
+        _watcher.start()
+        return _watcher
+
+
+def stop():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+def create_watcher(roots):
+    mode = getattr(settings, 'DOCROOT_WATCH', True)
+    interval = getattr(settings, 'DOCROOT_WATCH_INTERVAL', 1.0)
+    if mode != 'poll' and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots, interval)
+        except OSError as ex:
+            log.warning(f"inotify is not available ({ex}); falling back to polling the docroot")
+    return PollingWatcher(roots, interval)
+
+
+class Watcher:
+    """
+        base class for the watcher thread; subclasses implement run_once() which publishes any changes it finds
+    """
+
+    def __init__(self, roots, interval=1.0):
+        self.roots = roots
+        self.interval = interval
+        self.pid = os.getpid()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"docrootcms-{self.__class__.__name__}", daemon=True)
+        self.thread.start()
+        log.info(f"{self.__class__.__name__} watching {self.roots}")
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(self.interval * 2 + 1)
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as ex:
+                log.exception(f"watcher error: {ex}")
+                self.stopping.wait(self.interval)
+
+    def run_once(self):
+        raise NotImplementedError
+
+
+class PollingWatcher(Watcher):
+    """
+        compares a snapshot of file modification times every interval seconds
+    """
+
+    def __init__(self, roots, interval=1.0):
+        super().__init__(roots, interval)
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for directory, dirs, names in os.walk(root, followlinks=True):
+                dirs[:] = [d for d in dirs if d != '__pycache__']
+                for name in names:
+                    file_name = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(file_name)
+                    except OSError:
+                        continue
+                    snapshot[file_name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def run_once(self):
+        if self.stopping.wait(self.interval):
+            return
+        snapshot = self.take_snapshot()
+        previous = self.snapshot
+        self.snapshot = snapshot
+        for file_name, signature in snapshot.items():
+            if file_name not in previous:
+                publish(Event(CREATED, file_name, False))
+            elif previous[file_name] != signature:
+                publish(Event(MODIFIED, file_name, False))
+        for file_name in previous:
+            if file_name not in snapshot:
+                publish(Event(DELETED, file_name, False))
+
+
+# inotify constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher(Watcher):
+    """
+        recursive inotify watch on the roots using libc through ctypes (no extra dependencies)
+    """
+
+    def __init__(self, roots, interval=1.0):
+        super().__init__(roots, interval)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # watch descriptor -> directory
+        self.watches = {}
+        for root in self.roots:
+            self.add_tree(root)
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                log.error("inotify watch limit reached; raise fs.inotify.max_user_watches or use DOCROOT_WATCH='poll'")
+            log.debug(f"unable to watch {directory}: {os.strerror(error)}")
+            return
+        self.watches[wd] = directory
+
+    # watch a directory and everything below it; returns the files found so new trees can be published
+    def add_tree(self, root):
+        found = []
+        for directory, dirs, names in os.walk(root, followlinks=True):
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            self.add_watch(directory)
+            found.extend(os.path.join(directory, name) for name in names)
+        return found
+
+    def close(self):
+        if self.fd is not None and self.fd >= 0:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def run_once(self):
+        readable, _, _ = select.select([self.fd], [], [], self.interval)
+        if not readable or self.stopping.is_set():
+            return
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            self.handle(wd, mask, name)
+
+    def handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            log.warning("inotify queue overflowed; resetting all docroot state")
+            publish(Event(RESET, '', True))
+            return
+        directory = self.watches.get(wd)
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if directory is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if directory in self.roots:
+                log.warning(f"watched root {directory} was removed or moved; resetting all docroot state")
+                publish(Event(RESET, directory, True))
+            return
+        file_name = os.path.join(directory, name)
+        is_dir = bool(mask & IN_ISDIR)
+        if is_dir:
+            if name == '__pycache__':
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # files can land in a new directory before we get to watch it so publish what is already there
+                publish(Event(CREATED, file_name, True))
+                for found in self.add_tree(file_name):
+                    publish(Event(CREATED, found, False))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                publish(Event(DELETED, file_name, True))
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            publish(Event(CREATED, file_name, False))
+        elif mask & (IN_CLOSE_WRITE | IN_ATTRIB):
+            publish(Event(MODIFIED, file_name, False))
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            publish(Event(DELETED, file_name, False))
@@ -21,13 +21,15 @@ setuptools.setup(name='django-docrootcms',
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Framework :: Django",
-        "Framework :: Django :: 4.0",
+        "Framework :: Django :: 5.0",
+        "Framework :: Django :: 5.1",
+        "Framework :: Django :: 5.2",
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content :: Content Management System",
         "Topic :: Internet :: WWW/HTTP :: Site Management",
       ],
-      python_requires='>=3.9',
+      python_requires='>=3.10',
       install_requires=[
-          'django',
+          'django>=5.0',
           'python-ubercode-utils',
       ],
 )